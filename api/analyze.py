@@ -3,8 +3,9 @@ import json
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from .services.analysis import AnalysisService
+from .services.tracing import TracedHandlerMixin, span
 
-class handler(BaseHTTPRequestHandler):
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             # Check required environment variables
@@ -37,10 +38,12 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             # Send response
+            with span('serialize'):
+                body = json.dumps(response_data).encode()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode())
+            self.wfile.write(body)
 
         except Exception as e:
             self.send_error(500, str(e))
\ No newline at end of file
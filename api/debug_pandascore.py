@@ -1,9 +1,11 @@
 import os
 import json
-import requests
 from http.server import BaseHTTPRequestHandler
 
-class handler(BaseHTTPRequestHandler):
+from .services.pandascore import PandaScoreClient
+from .services.tracing import TracedHandlerMixin
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             api_key = os.environ.get('PANDASCORE_API_KEY')
@@ -15,10 +17,8 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps({'error': 'PANDASCORE_API_KEY not set in env'}).encode())
                 return
 
-            url = 'https://api.pandascore.co/csgo/teams'
-            headers = {'Authorization': f'Bearer {api_key}'}
             try:
-                r = requests.get(url, headers=headers, timeout=15)
+                r = PandaScoreClient(api_key).get('/csgo/teams', timeout=15)
             except Exception as e:
                 self.send_response(502)
                 self.send_header('Content-Type', 'application/json')
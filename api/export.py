@@ -0,0 +1,79 @@
+import os
+import hmac
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from .services import export
+from .services.db import connect_read
+
+# Exports hand out whole tables (raw payloads too): callers must send it as a
+# Bearer token, and without it the endpoint is disabled
+EXPORT_TOKEN = os.getenv('EXPORT_TOKEN')
+
+
+class handler(BaseHTTPRequestHandler):
+    # Long-running stream: like live_stream.py, not wrapped in TracedHandlerMixin
+    def do_GET(self):
+        """Stream one table as NDJSON or Parquet (see api/services/export.py).
+
+        ?table=historical_matches|team_stats|predictions|match_statistics
+        ?since=<ISO 8601>  only rows changed after this watermark
+        ?format=ndjson|parquet  (parquet needs pyarrow)
+        ?raw=1  include raw_data / raw_hash
+
+        The next `since` is returned in the X-Export-Watermark header. The
+        body has no Content-Length: a stream cut short by an error ends
+        early, so large or unattended exports should use scripts/export.py.
+        """
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            self.send_error(500, "Missing DATABASE_URL environment variable")
+            return
+        if not EXPORT_TOKEN:
+            self.send_error(503, "Missing EXPORT_TOKEN environment variable")
+            return
+        token = (self.headers.get('Authorization') or '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(token, EXPORT_TOKEN):
+            self.send_error(401, "Invalid or missing export token")
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        table = query.get('table', [None])[0]
+        fmt = query.get('format', [export.NDJSON])[0]
+        include_raw = query.get('raw', ['0'])[0] in ('1', 'true')
+        try:
+            since = export.parse_since(query.get('since', [None])[0])
+        except ValueError:
+            self.send_error(400, "Invalid 'since' (expected ISO 8601)")
+            return
+
+        started = False
+
+        def send_headers(result):
+            nonlocal started
+            self.send_response(200)
+            self.send_header('Content-Type', export.CONTENT_TYPES[fmt])
+            self.send_header('Content-Disposition', f'attachment; filename="{table}.{fmt}"')
+            self.send_header('X-Export-Watermark', result['watermark'] or '')
+            self.send_header('Access-Control-Expose-Headers', 'X-Export-Watermark')
+            self.end_headers()
+            started = True
+
+        conn = None
+        try:
+            conn = connect_read(database_url)
+            export.export_table(conn, table, self.wfile, fmt=fmt, since=since,
+                                include_raw=include_raw, on_start=send_headers)
+        except ValueError as e:
+            if not started:
+                self.send_error(400, str(e))
+        except Exception as e:
+            if not started:
+                self.send_error(500, str(e))
+            else:
+                # Headers are gone; the client sees a truncated body
+                print(f"Export of {table} failed mid-stream: {e}")
+                self.close_connection = True
+        finally:
+            if conn:
+                conn.close()
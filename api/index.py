@@ -1,10 +1,14 @@
 from http.server import BaseHTTPRequestHandler
 import os
 import json
-import requests
-import psycopg2
 
-class handler(BaseHTTPRequestHandler):
+from .services import (export, pair_stats, payloads, player_stats, prediction, quota, rounds, singleflight, sync,
+                       team_form, webhooks)
+from .services.db import connect
+from .services.pandascore import PandaScoreClient
+from .services.tracing import TracedHandlerMixin
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
 
     def do_GET(self):
         print("--- fonksiyon tetiklendi ---")
@@ -23,22 +27,13 @@ class handler(BaseHTTPRequestHandler):
         print("api key ve db url bulundu.")
         conn = None
         try:
-            # 1. veri avı
-            print("pandascore'dan veri çekiliyor...")
-            url = "https://api.pandascore.co/csgo/matches/upcoming?sort=-scheduled_at&per_page=5"
-            headers = {"Authorization": f"Bearer {api_key}"}
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            matches = response.json()
-            print(f"{len(matches)} adet maç verisi çekildi.")
-
-            # 2. beyne bağlan
+            # 1. beyne bağlan
             print("veritabanına bağlanmaya çalışılıyor...")
-            conn = psycopg2.connect(db_url)
+            conn = connect(db_url)
             cur = conn.cursor()
             print("veritabanına başarıyla bağlandı.")
 
-            # 3. tablo oluşturma
+            # 2. tablo oluşturma
             print("tablo oluşturma/kontrol etme komutu gönderiliyor...")
             # Ana tablo güncellemesi
             cur.execute("""
@@ -91,44 +86,58 @@ class handler(BaseHTTPRequestHandler):
                     PRIMARY KEY (match_id, timestamp)
                 );
             """)
-            print("tablo komutu işlendi.")
-            
-            # 4. veri yazma
-            print("veri yazma işlemi başlıyor...")
-            inserted_count = 0
-            for match in matches:
-                # 'opponents' listesinin dolu olup olmadığını kontrol et
-                team1 = match['opponents'][0]['opponent']['name'] if len(match['opponents']) > 0 and match['opponents'][0] else 'TBD'
-                team2 = match['opponents'][1]['opponent']['name'] if len(match['opponents']) > 1 and match['opponents'][1] else 'TBD'
-
-                cur.execute("""
-                    INSERT INTO matches (id, team1_name, team2_name, scheduled_at, league_name, raw_data)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (id) DO NOTHING;
-                """, (
-                    match['id'],
-                    team1,
-                    team2,
-                    match['scheduled_at'],
-                    match['league']['name'],
-                    json.dumps(match)
-                ))
-                if cur.rowcount > 0:
-                    inserted_count += 1
-            
-            print(f"{inserted_count} yeni kayıt eklendi.")
+            # Ham payload arşivi (raw_data sadece projeksiyonu tutar)
+            cur.execute(payloads.SCHEMA_SQL)
+            cur.execute("""
+                ALTER TABLE matches ADD COLUMN IF NOT EXISTS raw_hash CHAR(64);
+                ALTER TABLE matches ADD COLUMN IF NOT EXISTS team1_id INTEGER;
+                ALTER TABLE matches ADD COLUMN IF NOT EXISTS team2_id INTEGER;
+            """)
+            # Artımlı senkronizasyon imleci
+            cur.execute(sync.SCHEMA_SQL)
+            # Oyuncu bazlı istatistik zaman serisi
+            cur.execute(player_stats.SCHEMA_SQL)
+            # Tur olayları (round_history bunlardan artımlı doldurulur)
+            cur.execute(rounds.SCHEMA_SQL)
+            # Takım çifti bazlı H2H özetleri (ingest sırasında güncellenir)
+            cur.execute(pair_stats.SCHEMA_SQL)
+            # Takım başına son maçlar ve form skoru (ingest sırasında güncellenir)
+            cur.execute(team_form.SCHEMA_SQL)
+            # Süreçler arası paylaşılan kısa ömürlü analiz sonuçları
+            cur.execute(singleflight.SCHEMA_SQL)
+            # İmzalı webhook olayları (tekilleştirme); eski kayıtlar temizlenir
+            cur.execute(webhooks.SCHEMA_SQL)
+            webhooks.purge(cur)
+            # Artımlı export için watermark kolonu ve indeksleri
+            cur.execute(export.SCHEMA_SQL)
+            # scripts/tune_model.py ile kaydedilen tahmin modeli sürümleri
+            cur.execute(prediction.MODELS_SCHEMA_SQL)
             conn.commit()
             cur.close()
-            print("işlem tamamlandı ve bağlantı kapatıldı.")
+            print("tablo komutu işlendi.")
+            
+            # 3. artımlı senkronizasyon: sadece son çalıştırmadan beri
+            # değişen maçlar çekilir, hash'i değişmeyen satırlar yazılmaz
+            print("pandascore'dan değişen maçlar çekiliyor...")
+            match_sync = sync.MatchSync(PandaScoreClient(api_key, priority=quota.UPCOMING), conn)
+            upcoming = match_sync.sync('upcoming')
+            print(f"upcoming: {upcoming}")
+            past = match_sync.sync('past')
+            print(f"past: {past}")
+            print("işlem tamamlandı.")
 
-            # 5. rapor ver
+            # 4. rapor ver
             self.send_response(200)
             self.send_header('Content-type', 'application/json; charset=utf-8')
             self.end_headers()
             self.wfile.write(json.dumps({
                 "status": "başarılı", 
-                "fetched_matches": len(matches),
-                "newly_inserted_matches": inserted_count
+                "fetched_matches": upcoming['fetched'],
+                "newly_inserted_matches": upcoming['new'],
+                "sync": {
+                    "upcoming": upcoming,
+                    "past": past
+                }
             }).encode())
 
         except Exception as e:
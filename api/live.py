@@ -1,11 +1,16 @@
 from http.server import BaseHTTPRequestHandler
 import os
 import json
-import requests
-import psycopg2
+import time
 from datetime import datetime
 
-class handler(BaseHTTPRequestHandler):
+from .services import live_updates, metrics, quota, webhooks
+from .services.db import connect
+from .services.pandascore import PandaScoreClient
+from .services.resilience import Deadline
+from .services.tracing import TracedHandlerMixin, span
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         # API ve DB bağlantı bilgileri
         api_key = os.environ.get("PANDASCORE_API_KEY")
@@ -16,129 +21,104 @@ class handler(BaseHTTPRequestHandler):
             return
             
         try:
+            cycle_started = time.perf_counter()
+
             # 1. Devam eden maçları çek
-            live_matches = self._fetch_live_matches(api_key)
+            # Tüm PandaScore çağrıları tek bir döngü süresi içinde kalır
+            deadline = Deadline(live_updates.CYCLE_DEADLINE)
+            client = PandaScoreClient(api_key, priority=quota.LIVE)
+            live_matches = self._fetch_live_matches(client, deadline)
+            # Webhook ile yakın zamanda güncellenen maçlar için /stats çekilmez
+            # ve yazılmaz; listede son kaydedilen halleriyle yer alırlar
+            webhook_fed = self._webhook_fed(live_matches, db_url)
             
             # 2. Her maç için canlı veriyi işle ve kaydet
             results = []
+            # Snapshot'lar tek tek değil, toplu transaction'larla yazılır
+            writer = live_updates.SnapshotBuffer(db_url, 'live')
+            skipped = 0
             for match in live_matches:
-                match_data = self._process_match(match, api_key)
-                if match_data:
-                    self._save_match_data(match_data, db_url)
+                if match.get('id') in webhook_fed:
+                    results.append(webhook_fed[match.get('id')])
+                    continue
+                if deadline.expired():
+                    skipped += 1
+                    continue
+                processed = self._process_match(match, client, deadline)
+                if processed:
+                    match_data, round_state = processed
+                    writer.add(match_data, round_state)
                     results.append(match_data)
+            writer.flush()
+            if skipped:
+                print(f"Döngü süresi doldu, {skipped} maç bu turda atlandı")
+
+            metrics.LIVE_MATCHES_PROCESSED.inc('live', amount=len(results) - len(webhook_fed))
+            metrics.LIVE_CYCLE_DURATION.observe(time.perf_counter() - cycle_started, 'live')
             
             # 3. Yanıt döndür
             self._send_success({
                 "status": "success",
                 "live_matches": results,
+                "webhook_fed": sorted(webhook_fed),
+                # Tek tek yeniden denendiğinde de yazılamayan snapshot'ların maçları
+                "write_failed": sorted(writer.failed),
                 "timestamp": datetime.utcnow().isoformat()
             })
             
         except Exception as e:
             self._send_error(f"Hata: {str(e)}")
 
-    def _fetch_live_matches(self, api_key):
-        """Devam eden CS:GO maçlarını çeker"""
-        url = "https://api.pandascore.co/csgo/matches/running"
-        response = requests.get(
-            url,
-            headers={"Authorization": f"Bearer {api_key}"},
+    def _fetch_live_matches(self, client, deadline):
+        """Devam eden CS:GO maçlarını çeker (PandaScore erişilemezse son bilinen liste)"""
+        return client.get_json(
+            "/csgo/matches/running",
             params={
                 "per_page": "50",
                 "sort": "-scheduled_at"
-            }
+            },
+            deadline=deadline
         )
-        response.raise_for_status()
-        return response.json()
 
-    def _process_match(self, match, api_key):
+    def _webhook_fed(self, live_matches, db_url):
+        """Son WEBHOOK_RECONCILE_AFTER saniyede webhook olayı gelen maçlar:
+        {match_id: son kaydedilen match_data}"""
+        if not webhooks.enabled():
+            return {}
+        conn = None
+        try:
+            conn = connect(db_url)
+            with conn.cursor() as cur:
+                fed = webhooks.recently_pushed(cur, [m.get('id') for m in live_matches])
+                return live_updates.stored_match_data(cur, [m for m in live_matches if m.get('id') in fed])
+        except Exception as e:
+            # Okunamazsa tüm maçlar poll edilir
+            print(f"Webhook durumu okunamadı: {e}")
+            return {}
+        finally:
+            if conn:
+                conn.close()
+
+    def _process_match(self, match, client, deadline):
         """Maç verilerini işler ve gerekli formata dönüştürür"""
         try:
-            # Detaylı maç verisi çek
             match_id = match.get('id')
-            details_url = f"https://api.pandascore.co/csgo/matches/{match_id}/stats"
-            details = requests.get(
-                details_url,
-                headers={"Authorization": f"Bearer {api_key}"}
-            ).json()
-
-            # Ana maç bilgileri
-            processed = {
-                "match_id": match_id,
-                "status": match.get('status'),
-                "current_score": {
-                    "team1": match.get('results', [{'score': 0}])[0].get('score', 0),
-                    "team2": match.get('results', [{'score': 0}])[1].get('score', 0) if len(match.get('results', [])) > 1 else 0
-                },
-                "teams": {
-                    "team1": {
-                        "id": match.get('opponents', [{}])[0].get('opponent', {}).get('id'),
-                        "name": match.get('opponents', [{}])[0].get('opponent', {}).get('name', 'TBD'),
-                    },
-                    "team2": {
-                        "id": match.get('opponents', [{}])[1].get('opponent', {}).get('id') if len(match.get('opponents', [])) > 1 else None,
-                        "name": match.get('opponents', [{}])[1].get('opponent', {}).get('name', 'TBD') if len(match.get('opponents', [])) > 1 else 'TBD',
-                    }
-                },
-                "current_round": details.get('current_round', 0),
-                "map": details.get('map', {}).get('name'),
-                "player_stats": details.get('players', []),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            return processed
+            details = client.get_json(f"/csgo/matches/{match_id}/stats", deadline=deadline)
+            # match_data ve tur durumu (webhook alıcısıyla ortak)
+            return live_updates.build_match_data(match, details)
         except Exception as e:
             print(f"Maç işleme hatası ({match_id}): {str(e)}")
             return None
 
-    def _save_match_data(self, match_data, db_url):
-        """İşlenmiş maç verisini veritabanına kaydeder"""
-        conn = None
-        try:
-            conn = psycopg2.connect(db_url)
-            cur = conn.cursor()
-            
-            # 1. matches tablosunu güncelle
-            cur.execute("""
-                UPDATE matches 
-                SET match_status = %s,
-                    live_score = %s,
-                    player_stats = %s
-                WHERE id = %s
-            """, (
-                match_data['status'],
-                json.dumps(match_data['current_score']),
-                json.dumps(match_data['player_stats']),
-                match_data['match_id']
-            ))
-            
-            # 2. İstatistikleri kaydet
-            cur.execute("""
-                INSERT INTO match_statistics 
-                    (match_id, timestamp, event_type, event_data)
-                VALUES 
-                    (%s, %s, %s, %s)
-                ON CONFLICT (match_id, timestamp) DO NOTHING
-            """, (
-                match_data['match_id'],
-                match_data['timestamp'],
-                'live_update',
-                json.dumps(match_data)
-            ))
-            
-            conn.commit()
-            
-        finally:
-            if conn:
-                conn.close()
-
     def _send_success(self, data):
         """Başarılı yanıt gönder"""
+        with span('serialize'):
+            body = json.dumps(data).encode()
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')  # CORS için
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
 
     def _send_error(self, message):
         """Hata yanıtı gönder"""
@@ -0,0 +1,102 @@
+from http.server import BaseHTTPRequestHandler
+import os
+import json
+import select
+import time
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2.extras
+
+from .services import live_updates, metrics
+from .services.db import connect
+
+# Bir istekte akışın açık kalacağı süre; sonrasında EventSource
+# Last-Event-ID ile yeniden bağlanır (serverless süre limitleri için)
+STREAM_WINDOW = float(os.environ.get('LIVE_STREAM_WINDOW', '25'))
+
+
+class handler(BaseHTTPRequestHandler):
+    # Uzun süren akış: TracedHandlerMixin'in istek süresi metriği yerine
+    # abone sayısı live_stream_subscribers ile izlenir
+    def do_GET(self):
+        """Server-Sent Events: /api/live/stream?match_id=X
+
+        Önce Last-Event-ID'den sonraki (yoksa en son) snapshot'ları, sonra
+        save_match_data'nın NOTIFY ettiği değişiklikleri gönderir.
+        """
+        db_url = os.environ.get("DATABASE_URL")
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            match_id = int(query['match_id'][0])
+        except (KeyError, ValueError):
+            self.send_error(400, "Missing or invalid 'match_id'")
+            return
+        if not db_url:
+            self.send_error(500, "Missing DATABASE_URL environment variable")
+            return
+
+        last_event_id = self.headers.get('Last-Event-ID') or query.get('last_event_id', [None])[0]
+        since = live_updates.parse_event_id(last_event_id)
+
+        listen_conn = None
+        metrics.LIVE_STREAM_SUBSCRIBERS.inc('thread')
+        try:
+            # 1. Önce LISTEN: replay sırasında gelen değişiklikler kaçmasın
+            # (ek parametre havuzu atlar; LISTEN eden bağlantı havuza dönmemeli)
+            listen_conn = connect(db_url, application_name='live_stream')
+            listen_conn.autocommit = True
+            with listen_conn.cursor() as cur:
+                cur.execute(f"LISTEN {live_updates.NOTIFY_CHANNEL}")
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(f"retry: {live_updates.RETRY_MS}\n\n".encode())
+
+            # 2. Kaçırılan (veya son) snapshot'lar
+            last_sent = self._replay(db_url, match_id, since)
+            self.wfile.flush()
+
+            # 3. Canlı değişiklikler + heartbeat
+            deadline = time.monotonic() + STREAM_WINDOW
+            last_write = time.monotonic()
+            while time.monotonic() < deadline:
+                timeout = min(deadline - time.monotonic(), live_updates.HEARTBEAT_INTERVAL)
+                if select.select([listen_conn], [], [], max(timeout, 0))[0]:
+                    listen_conn.poll()
+                    for notify in listen_conn.notifies:
+                        event = json.loads(notify.payload)
+                        if event['match_id'] == match_id:
+                            last_sent = self._replay(db_url, match_id, last_sent) or last_sent
+                    listen_conn.notifies.clear()
+                    self.wfile.flush()
+                    last_write = time.monotonic()
+                elif time.monotonic() - last_write >= live_updates.HEARTBEAT_INTERVAL:
+                    self.wfile.write(live_updates.HEARTBEAT_FRAME)
+                    self.wfile.flush()
+                    last_write = time.monotonic()
+
+        except (BrokenPipeError, ConnectionResetError):
+            # İstemci bağlantıyı kapattı
+            pass
+        finally:
+            metrics.LIVE_STREAM_SUBSCRIBERS.dec('thread')
+            if listen_conn:
+                listen_conn.close()
+
+    def _replay(self, db_url, match_id, since):
+        """Snapshot'ları yazar; gönderilen son snapshot zamanını döner"""
+        # Replika gecikmesi NOTIFY edilen satırı kaçırabilir; primary'den okunur
+        with connect(db_url) as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                if since is None:
+                    cur.execute(live_updates.LATEST_EVENT_SQL, {'match_id': match_id})
+                else:
+                    cur.execute(live_updates.EVENTS_SINCE_SQL, {'match_id': match_id, 'since': since, 'limit': 500})
+                rows = [(r['timestamp'], r['event_data']) for r in cur.fetchall()]
+        for frame in live_updates.replay_frames(match_id, rows):
+            self.wfile.write(frame)
+        return rows[-1][0] if rows else since
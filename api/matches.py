@@ -0,0 +1,38 @@
+import os
+import json
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from .services.listing import InvalidCursor, ListingService, matches_args
+from .services.tracing import TracedHandlerMixin, span
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
+    def do_GET(self):
+        """List stored matches (DB only, keyset pagination).
+
+        ?cursor=&limit=  paging (limit max 200)
+        ?league=&status=&team_id=  filters
+        ?order=desc  newest first
+        """
+        try:
+            database_url = os.getenv('DATABASE_URL')
+            if not database_url:
+                self.send_error(500, "Missing DATABASE_URL environment variable")
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                response_data = ListingService(database_url).list_matches(**matches_args(query))
+            except (InvalidCursor, ValueError) as e:
+                self.send_error(400, str(e))
+                return
+
+            with span('serialize'):
+                body = json.dumps(response_data).encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body)
+
+        except Exception as e:
+            self.send_error(500, str(e))
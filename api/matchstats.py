@@ -4,9 +4,62 @@ from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 
 from .services.analysis import AnalysisService
+from .services.db import connect_read
 from .services.prediction import PredictionModel
+from .services.singleflight import SingleFlight
+from .services.tracing import TracedHandlerMixin, span
 
-class handler(BaseHTTPRequestHandler):
+# Selectable sections per mode, as dotted paths into the response
+PAIR_FIELDS = (
+    'analysis.team1_form', 'analysis.team2_form', 'analysis.head_to_head', 'analysis.map_analysis',
+    'maps.team1', 'maps.team2', 'prediction',
+)
+MATCH_FIELDS = PAIR_FIELDS + ('match',)
+TEAM_FIELDS = ('form', 'maps', 'recent_matches', 'upcoming_matches')
+
+# Short names for the analysis sub-sections, e.g. ?fields=head_to_head
+FIELD_ALIASES = {name.split('.', 1)[1]: name for name in PAIR_FIELDS if name.startswith('analysis.')}
+
+# Concurrent identical requests share one analysis run
+COALESCER = SingleFlight('matchstats')
+
+
+class Fields:
+    """Requested response sections; `None` selects everything.
+
+    A field selects itself and everything below it, so `maps` selects both
+    `maps.team1` and `maps.team2`.
+    """
+
+    def __init__(self, requested, allowed):
+        self.requested = None
+        if requested is None:
+            return
+        names = set()
+        for name in (n.strip() for n in requested.split(',')):
+            if not name:
+                continue
+            if name not in allowed and not any(a.startswith(name + '.') for a in allowed):
+                name = FIELD_ALIASES.get(name, name)
+            if name not in allowed and not any(a.startswith(name + '.') for a in allowed):
+                raise ValueError(f"Unknown field '{name}'. Valid fields: {', '.join(allowed)}")
+            names.add(name)
+        if not names:
+            raise ValueError(f"Empty 'fields' parameter. Valid fields: {', '.join(allowed)}")
+        self.requested = names
+
+    def key(self) -> str:
+        """Canonical form for request identity."""
+        return '*' if self.requested is None else ','.join(sorted(self.requested))
+
+    def __call__(self, path: str) -> bool:
+        if self.requested is None:
+            return True
+        parts = path.split('.')
+        return any('.'.join(parts[:i]) in self.requested for i in range(1, len(parts) + 1))
+
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             # Check required environment variables
@@ -17,50 +70,72 @@ class handler(BaseHTTPRequestHandler):
 
             # Parse query parameters
             query = parse_qs(urlparse(self.path).query)
+            requested = query['fields'][0] if 'fields' in query else None
 
             # Initialize services
             analysis_service = AnalysisService(database_url)
             prediction_model = PredictionModel(database_url)
 
+            try:
+                if 'match_id' in query:
+                    fields = Fields(requested, MATCH_FIELDS)
+                elif 'team1_id' in query and 'team2_id' in query:
+                    fields = Fields(requested, PAIR_FIELDS)
+                else:
+                    fields = Fields(requested, TEAM_FIELDS)
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+
             if 'match_id' in query:
                 # Full match analysis
                 match_id = int(query['match_id'][0])
-                response_data = self._analyze_match(match_id, analysis_service, prediction_model)
+                key = f"match_id={match_id}"
+                compute = lambda: self._analyze_match(match_id, analysis_service, prediction_model, fields)
             
             elif 'team1_id' in query and 'team2_id' in query:
                 # Quick analysis without storing
                 team1_id = int(query['team1_id'][0])
                 team2_id = int(query['team2_id'][0])
-                response_data = self._analyze_teams(team1_id, team2_id, analysis_service, prediction_model)
+                key = f"team1_id={team1_id}&team2_id={team2_id}"
+                compute = lambda: self._analyze_teams(team1_id, team2_id, analysis_service, prediction_model, fields)
 
             elif 'team_id' in query:
                 # Single team analysis
                 team_id = int(query['team_id'][0])
-                response_data = self._analyze_team(team_id, analysis_service, prediction_model)
+                key = f"team_id={team_id}"
+                compute = lambda: self._analyze_team(team_id, analysis_service, prediction_model, fields)
             
             else:
                 self.send_error(400, "Missing required parameters. Use either 'match_id', 'team_id', or 'team1_id' and 'team2_id'")
                 return
 
+            # Duplicates in flight wait for the first request's result
+            key = f"{key}&fields={fields.key()}&model={prediction_model.model_name}"
+            response_data, outcome = COALESCER.do(key, compute, database_url)
+
             # Send response
+            with span('serialize'):
+                body = json.dumps(response_data).encode()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
+            self.send_header('X-Singleflight', outcome)
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode())
+            self.wfile.write(body)
 
         except Exception as e:
             self.send_error(500, str(e))
 
     def _fetch_match_details(self, match_id: int):
         """Fetch basic match details from database"""
-        import psycopg2
         import psycopg2.extras
 
         database_url = os.getenv('DATABASE_URL')
-        with psycopg2.connect(database_url) as conn:
+        with connect_read(database_url) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute("""
-                    SELECT m.*, 
+                    SELECT m.id, m.scheduled_at, m.team1_id, m.team2_id, m.league_name,
+                           m.raw_data->'serie'->>'full_name' as series_name,
                            t1.name as team1_name, t1.image_url as team1_image,
                            t2.name as team2_name, t2.image_url as team2_image
                     FROM matches m
@@ -71,7 +146,8 @@ class handler(BaseHTTPRequestHandler):
                 match = cur.fetchone()
                 return dict(match) if match else None
 
-    def _analyze_match(self, match_id: int, analysis_service: AnalysisService, prediction_model: PredictionModel):
+    def _analyze_match(self, match_id: int, analysis_service: AnalysisService, prediction_model: PredictionModel,
+                       fields: Fields = Fields(None, MATCH_FIELDS)):
         """Full analysis for a specific match"""
         # Get match details
         match = self._fetch_match_details(match_id)
@@ -82,69 +158,97 @@ class handler(BaseHTTPRequestHandler):
         team2_id = match['team2_id']
 
         # Get all analyses
-        analysis = self._analyze_teams(team1_id, team2_id, analysis_service, prediction_model)
+        analysis = self._analyze_teams(team1_id, team2_id, analysis_service, prediction_model, fields)
         
         # Add match details
-        analysis['match'] = {
-            'id': match_id,
-            'scheduled_at': match['scheduled_at'].isoformat() if match['scheduled_at'] else None,
-            'team1': {
-                'id': team1_id,
-                'name': match['team1_name'],
-                'image_url': match['team1_image']
-            },
-            'team2': {
-                'id': team2_id,
-                'name': match['team2_name'],
-                'image_url': match['team2_image']
-            },
-            'event': {
-                'name': match.get('league_name'),
-                'series': match.get('series_name')
+        if fields('match'):
+            analysis['match'] = {
+                'id': match_id,
+                'scheduled_at': match['scheduled_at'].isoformat() if match['scheduled_at'] else None,
+                'team1': {
+                    'id': team1_id,
+                    'name': match['team1_name'],
+                    'image_url': match['team1_image']
+                },
+                'team2': {
+                    'id': team2_id,
+                    'name': match['team2_name'],
+                    'image_url': match['team2_image']
+                },
+                'event': {
+                    'name': match.get('league_name'),
+                    'series': match.get('series_name')
+                }
             }
-        }
 
-        # Store prediction
-        prediction_model.store_prediction(match_id, team1_id, team2_id)
+        # Store prediction (reusing the one just computed)
+        if 'prediction' in analysis:
+            prediction_model.store_prediction(match_id, team1_id, team2_id, analysis['prediction'])
 
         return analysis
 
-    def _analyze_teams(self, team1_id: int, team2_id: int, analysis_service: AnalysisService, prediction_model: PredictionModel):
-        """Analysis of two teams (for match prediction)"""
-        return {
-            # Team form and performance analysis
-            'analysis': analysis_service.analyze_teams(team1_id, team2_id),
-            
-            # Map performance comparison
-            'maps': {
-                'team1': analysis_service.get_map_performance(team1_id),
-                'team2': analysis_service.get_map_performance(team2_id)
-            },
-            
-            # Match prediction
-            'prediction': prediction_model.predict_match(team1_id, team2_id)
-        }
+    def _analyze_teams(self, team1_id: int, team2_id: int, analysis_service: AnalysisService, prediction_model: PredictionModel,
+                       fields: Fields = Fields(None, PAIR_FIELDS)):
+        """Analysis of two teams (for match prediction); only the selected sections are queried"""
+        map_performance = {}
+
+        def maps_of(team_id):
+            # The same tables back both 'maps' and 'analysis.map_analysis'
+            if team_id not in map_performance:
+                map_performance[team_id] = analysis_service.get_map_performance(team_id)
+            return map_performance[team_id]
+
+        # Team form and performance analysis
+        analysis = {}
+        if fields('analysis.team1_form'):
+            analysis['team1_form'] = analysis_service.get_team_form(team1_id)
+        if fields('analysis.team2_form'):
+            analysis['team2_form'] = analysis_service.get_team_form(team2_id)
+        if fields('analysis.head_to_head'):
+            analysis['head_to_head'] = analysis_service.get_head_to_head(team1_id, team2_id)
+        if fields('analysis.map_analysis'):
+            analysis['map_analysis'] = analysis_service.compare_maps(maps_of(team1_id), maps_of(team2_id))
 
-    def _analyze_team(self, team_id: int, analysis_service: AnalysisService, prediction_model: PredictionModel):
+        # Map performance comparison
+        maps = {}
+        if fields('maps.team1'):
+            maps['team1'] = maps_of(team1_id)
+        if fields('maps.team2'):
+            maps['team2'] = maps_of(team2_id)
+
+        result = {}
+        if analysis:
+            result['analysis'] = analysis
+        if maps:
+            result['maps'] = maps
+
+        # Match prediction
+        if fields('prediction'):
+            result['prediction'] = prediction_model.predict_match(team1_id, team2_id)
+        return result
+
+    def _analyze_team(self, team_id: int, analysis_service: AnalysisService, prediction_model: PredictionModel,
+                      fields: Fields = Fields(None, TEAM_FIELDS)):
         """Detailed analysis of a single team"""
-        return {
-            'form': analysis_service.get_team_form(team_id),
-            'maps': analysis_service.get_map_performance(team_id),
-            
+        result = {}
+        if fields('form'):
+            result['form'] = analysis_service.get_team_form(team_id)
+        if fields('maps'):
+            result['maps'] = analysis_service.get_map_performance(team_id)
+        if fields('recent_matches'):
             # Get recent matches from form analysis
-            'recent_matches': analysis_service.get_team_form(team_id, last_n_matches=10)['recent_results'],
-            
+            result['recent_matches'] = analysis_service.get_team_form(team_id, last_n_matches=10)['recent_results']
+        if fields('upcoming_matches'):
             # Include upcoming matches if available
-            'upcoming_matches': self._get_upcoming_matches(team_id)
-        }
+            result['upcoming_matches'] = self._get_upcoming_matches(team_id)
+        return result
 
     def _get_upcoming_matches(self, team_id: int):
         """Fetch upcoming matches for a team"""
-        import psycopg2
         import psycopg2.extras
 
         database_url = os.getenv('DATABASE_URL')
-        with psycopg2.connect(database_url) as conn:
+        with connect_read(database_url) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute("""
                     SELECT m.id, m.scheduled_at, m.league_name,
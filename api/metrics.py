@@ -0,0 +1,19 @@
+from http.server import BaseHTTPRequestHandler
+
+from .services.metrics import REGISTRY
+from .services.tracing import TracedHandlerMixin
+
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Expose the in-process metrics registry in Prometheus text format.
+
+        Counters are per process, so on Vercel each scrape only sees the
+        instance that served it.
+        """
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
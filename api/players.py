@@ -0,0 +1,56 @@
+import os
+import json
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from .services.player_stats import PlayerStatsService
+from .services.tracing import TracedHandlerMixin, span
+
+MAX_LAST = 200
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
+    def do_GET(self):
+        """/api/players?player_id=X[&last=20][&since=ISO][&matches=1]
+
+        Oyuncunun son N maçı üzerinden toplam ve ortalamalar (K/D, ADR,
+        KAST, rating, HS%); matches=1 ile maç bazlı satırlar da döner.
+        """
+        try:
+            database_url = os.getenv('DATABASE_URL')
+            if not database_url:
+                self.send_error(500, "Missing DATABASE_URL environment variable")
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                player_id = int(query['player_id'][0])
+                last = int(query.get('last', ['20'])[0])
+                since = query.get('since', [None])[0]
+                if since is not None:
+                    since = datetime.fromisoformat(since)
+            except (KeyError, ValueError):
+                self.send_error(400, "Missing or invalid 'player_id', 'last' or 'since'")
+                return
+            if not 1 <= last <= MAX_LAST:
+                self.send_error(400, f"'last' must be between 1 and {MAX_LAST}")
+                return
+
+            service = PlayerStatsService(database_url)
+            response_data = {
+                'player_id': player_id,
+                'last': last,
+                'aggregates': service.get_player_aggregates(player_id, last, since)
+            }
+            if query.get('matches', ['0'])[0] in ('1', 'true'):
+                response_data['matches'] = service.get_player_matches(player_id, last, since)
+
+            with span('serialize'):
+                body = json.dumps(response_data).encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body)
+
+        except Exception as e:
+            self.send_error(500, str(e))
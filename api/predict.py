@@ -3,8 +3,9 @@ import json
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from .services.prediction import PredictionModel
+from .services.tracing import TracedHandlerMixin, span
 
-class handler(BaseHTTPRequestHandler):
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             # Check required environment variables
@@ -16,8 +17,14 @@ class handler(BaseHTTPRequestHandler):
             # Parse query parameters
             query = parse_qs(urlparse(self.path).query)
             
-            # Initialize prediction model
-            prediction_model = PredictionModel(database_url)
+            # Initialize prediction model (?model=heuristic_v2 ile kayıtlı bir sürüm)
+            prediction_model = PredictionModel(database_url, query.get('model', [None])[0])
+
+            try:
+                prediction_model.load()
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
 
             if 'match_id' in query:
                 # Generate and store prediction for a specific match
@@ -43,10 +50,12 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             # Send response
+            with span('serialize'):
+                body = json.dumps(response_data).encode()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode())
+            self.wfile.write(body)
 
         except Exception as e:
             self.send_error(500, str(e))
\ No newline at end of file
@@ -2,8 +2,10 @@ from http.server import BaseHTTPRequestHandler
 import os
 import json
 
+from .services.tracing import TracedHandlerMixin
 
-class handler(BaseHTTPRequestHandler):
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         """Return a small JSON with public Pusher info (key, cluster).
 
@@ -13,6 +15,10 @@ class handler(BaseHTTPRequestHandler):
         """
         key = os.environ.get('PUSHER_KEY')
         cluster = os.environ.get('PUSHER_CLUSTER', 'eu')
+        # Self-hosted broadcaster (server.py --ws-port); any key works there
+        ws_host = os.environ.get('BROADCAST_WS_HOST')
+        if ws_host and not key:
+            key = 'local'
 
         if not key:
             self.send_response(404)
@@ -28,6 +34,9 @@ class handler(BaseHTTPRequestHandler):
             'pusher_key': key,
             'pusher_cluster': cluster
         }
+        if ws_host:
+            payload['ws_host'] = ws_host
+            payload['ws_port'] = int(os.environ.get('BROADCAST_WS_PORT', '8001'))
 
         self.send_response(200)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
@@ -0,0 +1,52 @@
+import os
+import json
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2.extras
+
+from .services import rounds
+from .services.db import connect_read
+from .services.tracing import TracedHandlerMixin, span
+
+MAX_LIMIT = 500
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
+    def do_GET(self):
+        """/api/rounds?match_id=X[&after=ID][&limit=500]
+
+        Maçın tur zaman çizelgesi (match_rounds, eskiden yeniye). İstemci
+        son gördüğü `id`'yi `after` ile göndererek sadece yeni turları alır.
+        """
+        try:
+            database_url = os.getenv('DATABASE_URL')
+            if not database_url:
+                self.send_error(500, "Missing DATABASE_URL environment variable")
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                match_id = int(query['match_id'][0])
+                after = int(query.get('after', ['0'])[0])
+                limit = min(max(int(query.get('limit', [str(MAX_LIMIT)])[0]), 1), MAX_LIMIT)
+            except (KeyError, ValueError):
+                self.send_error(400, "Missing or invalid 'match_id', 'after' or 'limit'")
+                return
+
+            with connect_read(database_url) as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    timeline = rounds.get_timeline(cur, match_id, after, limit)
+
+            with span('serialize'):
+                body = json.dumps({
+                    'match_id': match_id,
+                    'rounds': timeline,
+                    'last_id': timeline[-1]['id'] if timeline else after
+                }).encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body)
+
+        except Exception as e:
+            self.send_error(500, str(e))
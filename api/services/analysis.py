@@ -1,14 +1,138 @@
+import asyncio
 import psycopg2
 import psycopg2.extras
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+from . import pair_stats, team_form
+from .db import connect_read, fetch_async
+
+TEAM_RESULTS_SQL = """
+    SELECT
+        id AS match_id,
+        winner_id = %(team_id)s AS won,
+        CASE WHEN team1_id = %(team_id)s THEN team1_score ELSE team2_score END AS team_score,
+        CASE WHEN team1_id = %(team_id)s THEN team2_score ELSE team1_score END AS opp_score,
+        played_at
+    FROM historical_matches
+    WHERE (team1_id = %(team_id)s OR team2_id = %(team_id)s)
+    AND played_at < NOW()
+    ORDER BY played_at DESC, id DESC
+    LIMIT %(limit)s
+"""
+
+HEAD_TO_HEAD_SQL = """
+    SELECT id, winner_id, team1_id, team2_id, team1_score, team2_score,
+           played_at, map_name, event_name
+    FROM historical_matches
+    WHERE ((team1_id = %(team1_id)s AND team2_id = %(team2_id)s)
+        OR (team1_id = %(team2_id)s AND team2_id = %(team1_id)s))
+      AND played_at < NOW()
+    ORDER BY played_at DESC, id DESC
+    LIMIT %(limit)s
+"""
+
+MAP_PERFORMANCE_SQL = """
+    SELECT 
+        map_name,
+        COUNT(*) as total_matches,
+        SUM(CASE WHEN winner_id = %(team_id)s THEN 1 ELSE 0 END) as wins,
+        SUM(CASE 
+            WHEN team1_id = %(team_id)s THEN team1_score 
+            ELSE team2_score 
+        END) as rounds_won,
+        SUM(CASE 
+            WHEN team1_id = %(team_id)s THEN team2_score 
+            ELSE team1_score 
+        END) as rounds_lost
+    FROM historical_matches
+    WHERE (team1_id = %(team_id)s OR team2_id = %(team_id)s)
+        AND map_name IS NOT NULL
+    GROUP BY map_name
+    HAVING COUNT(*) >= 3
+    ORDER BY (SUM(CASE WHEN winner_id = %(team_id)s THEN 1 ELSE 0 END)::float / COUNT(*)) DESC
+"""
+
+
+def _team_results(rows) -> List[Dict]:
+    return [dict(row, won=bool(row['won']), played_at=row['played_at'].isoformat()) for row in rows]
+
+
+def _form(results: List[Dict], form_score: float) -> Dict:
+    return {
+        'form_score': round(form_score, 2),
+        'recent_results': [{
+            'match_id': r['match_id'],
+            'won': r['won'],
+            'score': f"{r['team_score']}-{r['opp_score']}",
+            'played_at': r['played_at']
+        } for r in results]
+    }
+
+
+def _head_to_head(team1_id: int, team2_id: int, all_time: Optional[Dict], matches: List[Dict]) -> Dict:
+    # Calculate H2H stats
+    team1_wins = 0
+    team2_wins = 0
+    total_maps = 0
+    recent_matches = []
+
+    for match in matches:
+        # Standardize the results to team1's perspective
+        if match['team1_id'] == team1_id:
+            team1_score = match['team1_score']
+            team2_score = match['team2_score']
+        else:
+            team1_score = match['team2_score']
+            team2_score = match['team1_score']
+
+        if match['winner_id'] == team1_id:
+            team1_wins += 1
+        elif match['winner_id'] == team2_id:
+            team2_wins += 1
+
+        total_maps += 1
+        
+        recent_matches.append({
+            'match_id': match['id'],
+            'score': f"{team1_score}-{team2_score}",
+            'winner': 'team1' if match['winner_id'] == team1_id else 'team2',
+            'map': match['map_name'],
+            'event': match['event_name'],
+            'played_at': match['played_at'].isoformat()
+        })
+
+    if all_time and all_time['last_played_at'] is not None:
+        all_time['last_played_at'] = all_time['last_played_at'].isoformat()
+
+    return {
+        'total_matches': total_maps,
+        'team1_wins': team1_wins,
+        'team2_wins': team2_wins,
+        'team1_win_rate': round(team1_wins / total_maps * 100, 2) if total_maps > 0 else 0,
+        'recent_matches': recent_matches,
+        'all_time': all_time
+    }
+
+
+def _map_performance(maps) -> List[Dict]:
+    return [{
+        'map_name': m['map_name'],
+        'total_matches': m['total_matches'],
+        'wins': m['wins'],
+        'losses': m['total_matches'] - m['wins'],
+        'win_rate': round(m['wins'] / m['total_matches'] * 100, 2),
+        'avg_rounds_won': round(m['rounds_won'] / m['total_matches'], 2),
+        'avg_rounds_lost': round(m['rounds_lost'] / m['total_matches'], 2)
+    } for m in maps]
+
+
 class AnalysisService:
     def __init__(self, database_url: str):
         self.database_url = database_url
 
     def _get_db_connection(self):
-        return psycopg2.connect(self.database_url)
+        return connect_read(self.database_url)
 
     def get_team_form(self, team_id: int, last_n_matches: int = 5) -> Dict:
         """
@@ -17,64 +141,23 @@ class AnalysisService:
         """
         with self._get_db_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                # Get last N matches
-                cur.execute("""
-                    SELECT 
-                        id,
-                        winner_id,
-                        team1_id,
-                        team2_id,
-                        team1_score,
-                        team2_score,
-                        played_at
-                    FROM historical_matches
-                    WHERE (team1_id = %s OR team2_id = %s)
-                    AND played_at < NOW()
-                    ORDER BY played_at DESC
-                    LIMIT %s
-                """, (team_id, team_id, last_n_matches))
-                
-                matches = cur.fetchall()
-
-                # Calculate form metrics
-                form_score = 0
-                recent_results = []
-                
-                for match in matches:
-                    # Determine if team was team1 or team2
-                    is_team1 = match['team1_id'] == team_id
-                    team_score = match['team1_score'] if is_team1 else match['team2_score']
-                    opponent_score = match['team2_score'] if is_team1 else match['team1_score']
-                    
-                    # Calculate match result
-                    won = match['winner_id'] == team_id
-                    score_diff = team_score - opponent_score
-                    
-                    # Add to form score (weighted by recency)
-                    weight = 1 + (0.2 * (len(matches) - len(recent_results)))  # More recent matches count more
-                    if won:
-                        # Win gives 20 points, boosted by score difference
-                        form_score += (20 + min(score_diff * 2, 10)) * weight
-                    else:
-                        # Loss takes away points, but less if it was close
-                        form_score -= (10 - min(abs(score_diff), 5)) * weight
-                    
-                    recent_results.append({
-                        'match_id': match['id'],
-                        'won': won,
-                        'score': f"{team_score}-{opponent_score}",
-                        'played_at': match['played_at'].isoformat()
-                    })
-
-                # Normalize form score to 0-100 range
-                max_possible = sum((20 + 10) * (1 + 0.2 * i) for i in range(len(matches)))
-                min_possible = -sum((10) * (1 + 0.2 * i) for i in range(len(matches)))
-                form_score = max(0, min(100, ((form_score - min_possible) / (max_possible - min_possible)) * 100))
-
-                return {
-                    'form_score': round(form_score, 2),
-                    'recent_results': recent_results
-                }
+                # Precomputed at ingestion: one primary-key lookup
+                form = team_form.fetch_form(cur, team_id, last_n_matches) \
+                    if last_n_matches <= team_form.RECENT_SIZE else None
+                if form is not None:
+                    results = form['recent']
+                    form_score = form['form_score']
+                else:
+                    # Longer window, or no team_form row (no matches, or not rebuilt yet)
+                    results = self._fetch_team_results(cur, team_id, last_n_matches)
+                    form_score = team_form.form_score(results)
+
+                return _form(results, form_score)
+
+    def _fetch_team_results(self, cur, team_id: int, limit: int) -> List[Dict]:
+        """Last `limit` results of a team beyond (or missing from) the team_form ring, newest first"""
+        cur.execute(TEAM_RESULTS_SQL, {'team_id': team_id, 'limit': limit})
+        return _team_results(cur.fetchall())
 
     def get_head_to_head(self, team1_id: int, team2_id: int, last_n_matches: int = 5) -> Dict:
         """
@@ -82,65 +165,18 @@ class AnalysisService:
         """
         with self._get_db_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
-                        id,
-                        winner_id,
-                        team1_id,
-                        team2_id,
-                        team1_score,
-                        team2_score,
-                        played_at,
-                        map_name,
-                        event_name
-                    FROM historical_matches
-                    WHERE (team1_id = %s AND team2_id = %s)
-                        OR (team1_id = %s AND team2_id = %s)
-                    AND played_at < NOW()
-                    ORDER BY played_at DESC
-                    LIMIT %s
-                """, (team1_id, team2_id, team2_id, team1_id, last_n_matches))
-                
-                matches = cur.fetchall()
-
-                # Calculate H2H stats
-                team1_wins = 0
-                team2_wins = 0
-                total_maps = 0
-                recent_matches = []
-
-                for match in matches:
-                    # Standardize the results to team1's perspective
-                    if match['team1_id'] == team1_id:
-                        team1_score = match['team1_score']
-                        team2_score = match['team2_score']
-                    else:
-                        team1_score = match['team2_score']
-                        team2_score = match['team1_score']
-
-                    if match['winner_id'] == team1_id:
-                        team1_wins += 1
-                    elif match['winner_id'] == team2_id:
-                        team2_wins += 1
-
-                    total_maps += 1
-                    
-                    recent_matches.append({
-                        'match_id': match['id'],
-                        'score': f"{team1_score}-{team2_score}",
-                        'winner': 'team1' if match['winner_id'] == team1_id else 'team2',
-                        'map': match['map_name'],
-                        'event': match['event_name'],
-                        'played_at': match['played_at'].isoformat()
-                    })
-
-                return {
-                    'total_matches': total_maps,
-                    'team1_wins': team1_wins,
-                    'team2_wins': team2_wins,
-                    'team1_win_rate': round(team1_wins / total_maps * 100, 2) if total_maps > 0 else 0,
-                    'recent_matches': recent_matches
-                }
+                # One primary-key lookup on team_pair_stats plus the recent meetings
+                all_time, matches = pair_stats.fetch_pair(cur, team1_id, team2_id, last_n_matches)
+                # No row: the pair never met, or team_pair_stats was not rebuilt yet
+                if all_time is None or last_n_matches > pair_stats.RECENT_SIZE:
+                    matches = self._fetch_head_to_head(cur, team1_id, team2_id, last_n_matches)
+
+                return _head_to_head(team1_id, team2_id, all_time, matches)
+
+    def _fetch_head_to_head(self, cur, team1_id: int, team2_id: int, limit: int) -> List[Dict]:
+        """Meetings beyond (or missing from) the team_pair_stats ring, read from historical_matches"""
+        cur.execute(HEAD_TO_HEAD_SQL, {'team1_id': team1_id, 'team2_id': team2_id, 'limit': limit})
+        return cur.fetchall()
 
     def get_map_performance(self, team_id: int) -> Dict:
         """
@@ -148,38 +184,8 @@ class AnalysisService:
         """
         with self._get_db_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
-                        map_name,
-                        COUNT(*) as total_matches,
-                        SUM(CASE WHEN winner_id = %s THEN 1 ELSE 0 END) as wins,
-                        SUM(CASE 
-                            WHEN team1_id = %s THEN team1_score 
-                            ELSE team2_score 
-                        END) as rounds_won,
-                        SUM(CASE 
-                            WHEN team1_id = %s THEN team2_score 
-                            ELSE team1_score 
-                        END) as rounds_lost
-                    FROM historical_matches
-                    WHERE (team1_id = %s OR team2_id = %s)
-                        AND map_name IS NOT NULL
-                    GROUP BY map_name
-                    HAVING COUNT(*) >= 3
-                    ORDER BY (SUM(CASE WHEN winner_id = %s THEN 1 ELSE 0 END)::float / COUNT(*)) DESC
-                """, (team_id, team_id, team_id, team_id, team_id, team_id))
-                
-                maps = cur.fetchall()
-                
-                return [{
-                    'map_name': m['map_name'],
-                    'total_matches': m['total_matches'],
-                    'wins': m['wins'],
-                    'losses': m['total_matches'] - m['wins'],
-                    'win_rate': round(m['wins'] / m['total_matches'] * 100, 2),
-                    'avg_rounds_won': round(m['rounds_won'] / m['total_matches'], 2),
-                    'avg_rounds_lost': round(m['rounds_lost'] / m['total_matches'], 2)
-                } for m in maps]
+                cur.execute(MAP_PERFORMANCE_SQL, {'team_id': team_id})
+                return _map_performance(cur.fetchall())
 
     def analyze_teams(self, team1_id: int, team2_id: int) -> Dict:
         """
@@ -196,6 +202,18 @@ class AnalysisService:
         team1_maps = self.get_map_performance(team1_id)
         team2_maps = self.get_map_performance(team2_id)
         
+        return {
+            'team1_form': team1_form,
+            'team2_form': team2_form,
+            'head_to_head': h2h,
+            'map_analysis': self.compare_maps(team1_maps, team2_maps)
+        }
+
+    @staticmethod
+    def compare_maps(team1_maps: List[Dict], team2_maps: List[Dict]) -> Dict:
+        """
+        Builds the map_analysis section from two get_map_performance results
+        """
         # Find common strong/weak maps
         team1_map_dict = {m['map_name']: m for m in team1_maps}
         team2_map_dict = {m['map_name']: m for m in team2_maps}
@@ -212,15 +230,56 @@ class AnalysisService:
                 'team2_avg_rounds': t2_stats['avg_rounds_won']
             })
         
+        return {
+            'team1_maps': team1_maps,
+            'team2_maps': team2_maps,
+            'common_maps': sorted(common_maps, 
+                               key=lambda x: abs(x['team1_win_rate'] - x['team2_win_rate']),
+                               reverse=True)
+        }
+
+class AsyncAnalysisService:
+    """AnalysisService reads over an asyncpg pool, for the self-hosted server."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def get_team_form(self, team_id: int, last_n_matches: int = 5) -> Dict:
+        form = None
+        if last_n_matches <= team_form.RECENT_SIZE:
+            rows = await fetch_async(self.pool, 'fetch_form', team_form.FETCH_SQL, {'team_id': team_id})
+            form = team_form.form_from_row(rows[0] if rows else None, last_n_matches)
+        if form is not None:
+            return _form(form['recent'], form['form_score'])
+        results = _team_results(await fetch_async(self.pool, '_fetch_team_results', TEAM_RESULTS_SQL,
+                                                  {'team_id': team_id, 'limit': last_n_matches}))
+        return _form(results, team_form.form_score(results))
+
+    async def get_head_to_head(self, team1_id: int, team2_id: int, last_n_matches: int = 5) -> Dict:
+        all_time, matches = pair_stats.pair_from_rows(
+            await fetch_async(self.pool, 'fetch_pair', pair_stats.H2H_SQL,
+                              pair_stats.h2h_params(team1_id, team2_id, last_n_matches)),
+            team1_id, team2_id)
+        if all_time is None or last_n_matches > pair_stats.RECENT_SIZE:
+            matches = await fetch_async(self.pool, '_fetch_head_to_head', HEAD_TO_HEAD_SQL,
+                                        {'team1_id': team1_id, 'team2_id': team2_id, 'limit': last_n_matches})
+        return _head_to_head(team1_id, team2_id, all_time, matches)
+
+    async def get_map_performance(self, team_id: int) -> List[Dict]:
+        return _map_performance(await fetch_async(self.pool, 'get_map_performance', MAP_PERFORMANCE_SQL,
+                                                  {'team_id': team_id}))
+
+    async def analyze_teams(self, team1_id: int, team2_id: int) -> Dict:
+        team1_form, team2_form, h2h, team1_maps, team2_maps = await asyncio.gather(
+            self.get_team_form(team1_id),
+            self.get_team_form(team2_id),
+            self.get_head_to_head(team1_id, team2_id),
+            self.get_map_performance(team1_id),
+            self.get_map_performance(team2_id),
+        )
         return {
             'team1_form': team1_form,
             'team2_form': team2_form,
             'head_to_head': h2h,
-            'map_analysis': {
-                'team1_maps': team1_maps,
-                'team2_maps': team2_maps,
-                'common_maps': sorted(common_maps, 
-                                   key=lambda x: abs(x['team1_win_rate'] - x['team2_win_rate']),
-                                   reverse=True)
-            }
-        }
\ No newline at end of file
+            'map_analysis': AnalysisService.compare_maps(team1_maps, team2_maps)
+        }
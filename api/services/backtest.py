@@ -0,0 +1,247 @@
+"""Backtest of the prediction model over historical_matches.
+
+The history is loaded once (COPY) into columnar arrays ordered by
+played_at. One chronological pass keeps per-team and per-pair state
+(last-N results, rolling win rate, last-N head-to-head winners) and
+records, for every match, the features predict_match would have seen at
+that moment: only matches played strictly earlier are visible, and matches
+sharing a played_at are all featurized before any of them updates the
+state. Scoring then runs over the feature columns with
+prediction.heuristic_prediction, so a parameter set can be re-scored
+without touching the database or recomputing features.
+"""
+import csv
+import io
+import math
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from .prediction import DEFAULT_PARAMS, FORM_WINDOW, H2H_WINDOW, heuristic_prediction
+
+# team_stats.win_rate is computed from a team's last 50 matches (api/teams.py)
+WIN_RATE_WINDOW = 50
+
+LOAD_SQL = """
+    COPY (
+        SELECT id, team1_id, team2_id, winner_id,
+               COALESCE(team1_score, 0), COALESCE(team2_score, 0),
+               EXTRACT(EPOCH FROM played_at)
+        FROM historical_matches
+        WHERE played_at IS NOT NULL
+        ORDER BY played_at, id
+    ) TO STDOUT WITH (FORMAT csv)
+"""
+
+# Outcome of a match from team1's point of view
+TEAM1_WON, TEAM2_WON, NO_RESULT = 1, 0, -1
+
+
+class MatchHistory:
+    """historical_matches as parallel arrays, ordered by (played_at, id)."""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.team1 = array('q')
+        self.team2 = array('q')
+        self.winner = array('q')  # 0 = no winner
+        self.score1 = array('l')
+        self.score2 = array('l')
+        self.played_at = array('d')  # epoch seconds
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, match_id, team1_id, team2_id, winner_id, team1_score, team2_score, played_at) -> None:
+        self.ids.append(int(match_id))
+        self.team1.append(int(team1_id))
+        self.team2.append(int(team2_id))
+        self.winner.append(int(winner_id) if winner_id not in (None, '') else 0)
+        self.score1.append(int(team1_score or 0))
+        self.score2.append(int(team2_score or 0))
+        self.played_at.append(float(played_at))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> 'MatchHistory':
+        """Rows of (id, team1_id, team2_id, winner_id, team1_score, team2_score,
+        played_at epoch), already sorted by played_at."""
+        history = cls()
+        for row in rows:
+            history.append(*row)
+        return history
+
+    @classmethod
+    def load(cls, conn) -> 'MatchHistory':
+        buf = io.StringIO()
+        with conn.cursor() as cur:
+            cur.copy_expert(LOAD_SQL, buf)
+        buf.seek(0)
+        return cls.from_rows(csv.reader(buf))
+
+    def labels(self) -> array:
+        out = array('b')
+        for t1, t2, w in zip(self.team1, self.team2, self.winner):
+            out.append(TEAM1_WON if w == t1 else TEAM2_WON if w == t2 else NO_RESULT)
+        return out
+
+
+class Features:
+    """Point-in-time predict_match inputs per match (columnar)."""
+
+    COLUMNS = ('t1_win_rate', 't2_win_rate', 't1_recent_wins', 't2_recent_wins',
+               't1_recent_avg_diff', 't2_recent_avg_diff', 'h2h_team1_wins', 'h2h_team2_wins',
+               'data_points')
+
+    def __init__(self):
+        self.t1_win_rate = array('d')
+        self.t2_win_rate = array('d')
+        self.t1_recent_wins = array('l')
+        self.t2_recent_wins = array('l')
+        self.t1_recent_avg_diff = array('d')
+        self.t2_recent_avg_diff = array('d')
+        self.h2h_team1_wins = array('l')
+        self.h2h_team2_wins = array('l')
+        self.data_points = array('l')
+
+    def __len__(self) -> int:
+        return len(self.data_points)
+
+    def rows(self):
+        return zip(*(getattr(self, c) for c in self.COLUMNS))
+
+
+class _TeamState:
+    __slots__ = ('recent', 'results', 'wins')
+
+    def __init__(self, form_window: int, win_rate_window: int):
+        self.recent = deque(maxlen=form_window)  # (won, score diff)
+        self.results = deque(maxlen=win_rate_window)  # won
+        self.wins = 0
+
+    def win_rate(self) -> float:
+        # No stored stats -> predict_match's 50.0 fallback
+        return self.wins / len(self.results) * 100 if self.results else 50.0
+
+    def form(self):
+        if not self.recent:
+            return 0, 0, 0
+        wins = sum(1 for won, _ in self.recent if won)
+        return wins, sum(diff for _, diff in self.recent) / len(self.recent), len(self.recent)
+
+    def add(self, won: bool, diff: int) -> None:
+        self.recent.append((won, diff))
+        if len(self.results) == self.results.maxlen:
+            self.wins -= self.results[0]
+        self.results.append(won)
+        self.wins += won
+
+
+def compute_features(history: MatchHistory, form_window: int = FORM_WINDOW, h2h_window: int = H2H_WINDOW,
+                     win_rate_window: int = WIN_RATE_WINDOW) -> Features:
+    """One pass over the history; features of a match use earlier matches only."""
+    features = Features()
+    teams: Dict[int, _TeamState] = {}
+    pairs: Dict[tuple, deque] = {}
+
+    def team(team_id):
+        state = teams.get(team_id)
+        if state is None:
+            state = teams[team_id] = _TeamState(form_window, win_rate_window)
+        return state
+
+    n = len(history)
+    start = 0
+    while start < n:
+        # Matches played at the same instant cannot see each other
+        end = start + 1
+        while end < n and history.played_at[end] == history.played_at[start]:
+            end += 1
+
+        for i in range(start, end):
+            t1, t2 = history.team1[i], history.team2[i]
+            s1, s2 = team(t1), team(t2)
+            wins1, diff1, n1 = s1.form()
+            wins2, diff2, n2 = s2.form()
+            h2h = pairs.get((t1, t2) if t1 < t2 else (t2, t1), ())
+            features.t1_win_rate.append(s1.win_rate())
+            features.t2_win_rate.append(s2.win_rate())
+            features.t1_recent_wins.append(wins1)
+            features.t2_recent_wins.append(wins2)
+            features.t1_recent_avg_diff.append(diff1)
+            features.t2_recent_avg_diff.append(diff2)
+            features.h2h_team1_wins.append(sum(1 for w in h2h if w == t1))
+            features.h2h_team2_wins.append(sum(1 for w in h2h if w == t2))
+            features.data_points.append(n1 + n2 + len(h2h))
+
+        for i in range(start, end):
+            t1, t2, w = history.team1[i], history.team2[i], history.winner[i]
+            diff = history.score1[i] - history.score2[i]
+            team(t1).add(w == t1, diff)
+            team(t2).add(w == t2, -diff)
+            key = (t1, t2) if t1 < t2 else (t2, t1)
+            recent = pairs.get(key)
+            if recent is None:
+                recent = pairs[key] = deque(maxlen=h2h_window)
+            recent.append(w)
+        start = end
+    return features
+
+
+def score(features: Features, params: Dict = DEFAULT_PARAMS) -> array:
+    """P(team1 wins) per match, exactly as predict_match would report it."""
+    probs = array('d')
+    for row in features.rows():
+        probs.append(heuristic_prediction(*row, params=params)['win_probability']['team1'] / 100.0)
+    return probs
+
+
+def evaluate(probs: Iterable[float], labels: Iterable[int], mask: Optional[Iterable[bool]] = None,
+             buckets: int = 10) -> Dict:
+    """Accuracy, log-loss, Brier score and calibration over matches with a result."""
+    eps = 1e-15
+    n = correct = 0
+    log_loss = brier = 0.0
+    bins = [[0, 0.0, 0] for _ in range(buckets)]  # count, sum of p, team1 wins
+    for i, (p, y) in enumerate(zip(probs, labels)):
+        if y == NO_RESULT or (mask is not None and not mask[i]):
+            continue
+        n += 1
+        # store_prediction picks team1 only when its probability is higher
+        correct += (p > 0.5) == (y == TEAM1_WON)
+        q = min(max(p, eps), 1 - eps)
+        log_loss -= math.log(q) if y == TEAM1_WON else math.log(1 - q)
+        brier += (p - y) ** 2
+        b = bins[min(int(p * buckets), buckets - 1)]
+        b[0] += 1
+        b[1] += p
+        b[2] += y
+
+    if not n:
+        return {'matches': 0}
+    return {
+        'matches': n,
+        'accuracy': round(correct / n, 4),
+        'log_loss': round(log_loss / n, 4),
+        'brier': round(brier / n, 4),
+        # Coin flip reference: log-loss ln 2, Brier 0.25
+        'baseline': {'log_loss': round(math.log(2), 4), 'brier': 0.25},
+        'calibration': [{
+            'bucket': f"{i / buckets:.2f}-{(i + 1) / buckets:.2f}",
+            'matches': count,
+            'mean_predicted': round(total / count, 4),
+            'observed': round(wins / count, 4),
+        } for i, (count, total, wins) in enumerate(bins) if count],
+    }
+
+
+def since_mask(history: MatchHistory, since_epoch: Optional[float]) -> Optional[List[bool]]:
+    """Matches to score; earlier ones still feed the features as warm-up."""
+    if since_epoch is None:
+        return None
+    return [t >= since_epoch for t in history.played_at]
+
+
+def run_backtest(history: MatchHistory, params: Dict = DEFAULT_PARAMS, since_epoch: Optional[float] = None,
+                 buckets: int = 10) -> Dict:
+    features = compute_features(history, params['form_window'], params['h2h_window'])
+    return evaluate(score(features, params), history.labels(), since_mask(history, since_epoch), buckets)
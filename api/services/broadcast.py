@@ -0,0 +1,343 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import struct
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from . import metrics
+from .live_hub import Hub, Subscriber
+
+_WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+MAX_BUFFERED_BYTES = 256 * 1024
+MAX_MESSAGE_BYTES = 64 * 1024
+MAX_PUBLISH_BYTES = 4 * 1024 * 1024
+ACTIVITY_TIMEOUT = 120
+
+# Shared secret for POST /publish; without it only loopback may publish
+BROADCAST_TOKEN = os.getenv('BROADCAST_TOKEN')
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT, mask: Optional[bytes] = None) -> bytes:
+    """One final frame; servers send unmasked, clients pass a 4-byte mask."""
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, length)
+    if not mask:
+        return header + payload
+    return header + mask + _apply_mask(payload, mask)
+
+
+def _apply_mask(payload: bytes, mask: bytes) -> bytes:
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[bool, int, bytes]:
+    """(fin, opcode, unmasked payload) of the next frame."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE_BYTES:
+        raise ProtocolError('frame too large')
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = _apply_mask(payload, mask)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode() + _WS_GUID).digest()).decode()
+
+
+def pusher_message(event: str, data, channel: Optional[str] = None) -> bytes:
+    """A Pusher protocol message (data is sent as a JSON string) as a text frame."""
+    message = {'event': event, 'data': data if isinstance(data, str) else json.dumps(data, separators=(',', ':'))}
+    if channel is not None:
+        message['channel'] = channel
+    return encode_frame(json.dumps(message, separators=(',', ':')).encode())
+
+
+class WebSocketSubscriber(Subscriber):
+    """Writes pre-encoded frames straight to the socket; no per-client queue."""
+
+    def __init__(self, writer: asyncio.StreamWriter, socket_id: str):
+        self.transport = 'websocket'
+        self.topics = set()
+        self.closed = False
+        self.writer = writer
+        self.socket_id = socket_id
+
+    def deliver(self, message: bytes) -> bool:
+        transport = self.writer.transport
+        if transport.is_closing():
+            return False
+        if transport.get_write_buffer_size() > MAX_BUFFERED_BYTES:
+            return False
+        transport.write(message)
+        return True
+
+    def shutdown(self) -> None:
+        self.writer.transport.abort()
+
+
+class Broadcaster:
+    """Self-hosted WebSocket fan-out speaking the Pusher Channels protocol.
+
+    Clients use the same channels (`matches`, `match-{id}`) and events
+    (`list-update`, `match-update`) as with Pusher; pusher-js can connect by
+    pointing `wsHost`/`wsPort` at the broadcaster. Every published event is
+    encoded into a WebSocket frame once and that same bytes object is written
+    to all subscribers of the channel. A subscriber whose socket buffer grows
+    past MAX_BUFFERED_BYTES is disconnected instead of slowing everyone down.
+
+    Events reach the broadcaster either in-process (`publish_events` when it
+    runs inside server.py) or over HTTP: POST /publish with a JSON list of
+    {"channel", "event", "data"} (see HttpPublisher).
+    """
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8001):
+        self.host = host
+        self.port = port
+        self.hub = Hub()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._socket_ids = itertools.count(1)
+        self._connections: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        global _active
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        _active = self
+
+    async def stop(self) -> None:
+        global _active
+        if _active is self:
+            _active = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # Aborting the sockets lets every connection handler return on its own
+        for subscribers in list(self.hub.topics.values()):
+            for subscriber in list(subscribers):
+                self.hub.close(subscriber)
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=5)
+
+    def publish(self, channel: str, event: str, data) -> int:
+        """Encodes once and fans out; must run on the broadcaster's loop."""
+        started = time.perf_counter()
+        delivered = self.hub.publish(channel, pusher_message(event, data, channel))
+        metrics.BROADCAST_MESSAGES.inc(event, amount=delivered)
+        metrics.BROADCAST_PUBLISH_DURATION.observe(time.perf_counter() - started)
+        return delivered
+
+    def publish_many(self, events: Iterable[Dict]) -> int:
+        return sum(self.publish(e['channel'], e['event'], e['data']) for e in events)
+
+    def publish_threadsafe(self, events: List[Dict]) -> None:
+        self.loop.call_soon_threadsafe(self.publish_many, events)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            for line in header_lines:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            if headers.get('upgrade', '').lower() == 'websocket':
+                await self._websocket(reader, writer, headers)
+            elif method == 'POST' and urlparse(target).path == '/publish':
+                await self._http_publish(reader, writer, headers)
+            else:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(task)
+            if not writer.transport.is_closing():
+                writer.close()
+
+    async def _http_publish(self, reader, writer, headers) -> None:
+        peer = (writer.get_extra_info('peername') or ('',))[0]
+        token = headers.get('authorization', '').removeprefix('Bearer ').strip()
+        allowed = (hmac.compare_digest(token, BROADCAST_TOKEN) if BROADCAST_TOKEN
+                   else peer in ('127.0.0.1', '::1'))
+        # Refused before the body is read: nothing is buffered for strangers
+        if not allowed:
+            writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            length = -1
+        if length < 0:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+        if length > MAX_PUBLISH_BYTES:
+            writer.write(b'HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+        body = await reader.readexactly(length)
+        events = _parse_events(body)
+        if events is None:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+        delivered = self.publish_many(events)
+        response = json.dumps({'delivered': delivered}).encode()
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n'
+                     + f'Content-Length: {len(response)}\r\n\r\n'.encode() + response)
+        await writer.drain()
+
+    async def _websocket(self, reader, writer, headers) -> None:
+        key = headers.get('sec-websocket-key')
+        if not key:
+            raise ProtocolError('missing Sec-WebSocket-Key')
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n').encode())
+        socket_id = f'{os.getpid()}.{next(self._socket_ids)}'
+        subscriber = self.hub.register(WebSocketSubscriber(writer, socket_id))
+        writer.write(pusher_message('pusher:connection_established',
+                                    {'socket_id': socket_id, 'activity_timeout': ACTIVITY_TIMEOUT}))
+        try:
+            fragments: List[bytes] = []
+            fragments_size = 0
+            while not subscriber.closed:
+                fin, opcode, payload = await asyncio.wait_for(read_frame(reader), ACTIVITY_TIMEOUT * 2)
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    writer.write(encode_frame(payload, OP_PONG))
+                    continue
+                if opcode in (OP_TEXT, OP_CONTINUATION):
+                    # The per-frame limit alone lets continuation frames add up
+                    fragments_size += len(payload)
+                    if fragments_size > MAX_MESSAGE_BYTES:
+                        raise ProtocolError('message too large')
+                    fragments.append(payload)
+                    if fin:
+                        self._on_message(subscriber, b''.join(fragments))
+                        fragments = []
+                        fragments_size = 0
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ProtocolError):
+            pass
+        finally:
+            self.hub.close(subscriber)
+
+    def _on_message(self, subscriber: WebSocketSubscriber, raw: bytes) -> None:
+        # Client input: anything that is not a Pusher-shaped object is ignored
+        try:
+            message = json.loads(raw)
+            if not isinstance(message, dict):
+                return
+            data = message.get('data') or {}
+            if isinstance(data, str):
+                data = json.loads(data or '{}')
+        except ValueError:
+            return
+        event = message.get('event')
+        channel = data.get('channel') if isinstance(data, dict) else None
+        if not isinstance(channel, str):
+            channel = None
+        if event == 'pusher:subscribe' and channel:
+            self.hub.subscribe(channel, subscriber)
+            subscriber.deliver(pusher_message('pusher_internal:subscription_succeeded', {}, channel))
+        elif event == 'pusher:unsubscribe' and channel:
+            self.hub.unsubscribe(channel, subscriber)
+        elif event == 'pusher:ping':
+            subscriber.deliver(pusher_message('pusher:pong', {}))
+
+
+def _parse_events(body: bytes) -> Optional[List[Dict]]:
+    """POST /publish body -> [{'channel', 'event', 'data'}], None if malformed."""
+    try:
+        events = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(events, list):
+        return None
+    for event in events:
+        if not (isinstance(event, dict) and isinstance(event.get('channel'), str)
+                and isinstance(event.get('event'), str) and 'data' in event):
+            return None
+    return events
+
+
+# Broadcaster running in this process, if any (set by Broadcaster.start)
+_active: Optional[Broadcaster] = None
+
+
+class HttpPublisher:
+    """Publishes to a broadcaster in another process via POST /publish."""
+
+    def __init__(self, url: str, token: Optional[str] = BROADCAST_TOKEN):
+        self.url = url.rstrip('/') + '/publish'
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    def publish(self, events: List[Dict]) -> None:
+        response = requests.post(self.url, json=events, headers=self.headers, timeout=5)
+        response.raise_for_status()
+
+
+def get_pusher_client():
+    """Pusher client from PUSHER_* env vars; None when not configured so
+    callers skip Pusher publishing."""
+    app_id = os.environ.get('PUSHER_APP_ID')
+    key = os.environ.get('PUSHER_KEY')
+    secret = os.environ.get('PUSHER_SECRET')
+    cluster = os.environ.get('PUSHER_CLUSTER', 'eu')
+
+    if not (app_id and key and secret):
+        return None
+
+    import pusher
+    return pusher.Pusher(
+        app_id=app_id,
+        key=key,
+        secret=secret,
+        cluster=cluster,
+        ssl=True
+    )
+
+
+def publish_events(events: List[Dict]) -> bool:
+    """Sends events to the in-process broadcaster or, if BROADCAST_URL is
+    set, to a remote one. Returns False when no broadcaster is configured."""
+    if _active is not None:
+        _active.publish_threadsafe(events)
+        return True
+    url = os.getenv('BROADCAST_URL')
+    if url:
+        HttpPublisher(url).publish(events)
+        return True
+    return False
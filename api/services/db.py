@@ -0,0 +1,363 @@
+import csv
+import io
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from . import metrics, tracing
+
+
+def observe_query(name: str, started: float) -> None:
+    """Records one statement that started at `started` (perf_counter)."""
+    duration = time.perf_counter() - started
+    metrics.DB_QUERIES.inc(name)
+    metrics.DB_QUERY_DURATION.observe(duration, name)
+    trace = tracing.current()
+    if trace is not None:
+        trace.add('db.' + name, duration)
+
+
+class _InstrumentedCursorMixin:
+    """Counts and times statements, labelled with the calling function."""
+
+    def execute(self, query, vars=None):
+        name = sys._getframe(1).f_code.co_name
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observe_query(name, started)
+
+    def executemany(self, query, vars_list):
+        name = sys._getframe(1).f_code.co_name
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_query(name, started)
+
+    def copy_expert(self, sql, file, size=8192):
+        name = sys._getframe(1).f_code.co_name
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            observe_query(name, started)
+
+
+_instrumented_cursor_classes = {}
+
+
+def _instrumented_cursor_class(base):
+    cls = _instrumented_cursor_classes.get(base)
+    if cls is None:
+        cls = type('Instrumented' + base.__name__, (_InstrumentedCursorMixin, base), {})
+        _instrumented_cursor_classes[base] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _instrumented_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+class PooledConnection(InstrumentedConnection):
+    """Connection checked out of a ConnectionPool.
+
+    Leaving its `with` block or calling close() hands it back to the pool,
+    so handler code written for one-shot connections works unchanged.
+    """
+
+    _pool = None
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            return super().__exit__(exc_type, exc_value, tb)
+        finally:
+            if self._pool is not None:
+                self._pool.release(self)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.release(self)
+        else:
+            super().close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of instrumented connections for long-running
+    processes (see server.py); serverless handlers connect per request.
+    """
+
+    def __init__(self, database_url: str, maxconn: int = 10, timeout: float = 30.0, name: str = 'primary'):
+        self.database_url = database_url
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.name = name
+        self.closed = False
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _update_gauges(self) -> None:
+        metrics.DB_POOL_CONNECTIONS.set(len(self._idle), self.name, 'idle')
+        metrics.DB_POOL_CONNECTIONS.set(self._in_use, self.name, 'in_use')
+
+    def acquire(self) -> PooledConnection:
+        started = time.perf_counter()
+        with self._cond:
+            while not self._idle and self._in_use >= self.maxconn:
+                remaining = self.timeout - (time.perf_counter() - started)
+                if self.closed or remaining <= 0:
+                    raise psycopg2.pool.PoolError(f"No free connection in pool '{self.name}'")
+                self._cond.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self._update_gauges()
+        metrics.DB_POOL_WAIT_DURATION.observe(time.perf_counter() - started, self.name)
+
+        if conn is None:
+            try:
+                conn = _open(self.database_url, PooledConnection)
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._update_gauges()
+                    self._cond.notify()
+                raise
+        conn._pool = self
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        if conn._pool is not self:
+            return
+        conn._pool = None
+        keep = not conn.closed and not self.closed
+        if keep and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                keep = False
+        if not keep and not conn.closed:
+            psycopg2.extensions.connection.close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if keep:
+                self._idle.append(conn)
+            self._update_gauges()
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._update_gauges()
+            self._cond.notify_all()
+        for conn in idle:
+            psycopg2.extensions.connection.close(conn)
+
+
+# database_url -> pool; empty unless a long-running process installed one
+_pools: Dict[str, ConnectionPool] = {}
+# (database_url, name) -> small pool of its own, see side_pool
+_side_pools: Dict[Tuple[str, str], ConnectionPool] = {}
+_side_pools_lock = threading.Lock()
+
+
+def install_pool(database_url: str, maxconn: int = 10, name: str = 'primary') -> ConnectionPool:
+    """Makes connect(database_url) hand out pooled connections."""
+    pool = _pools.get(database_url)
+    if pool is None:
+        pool = _pools[database_url] = ConnectionPool(database_url, maxconn=maxconn, name=name)
+    return pool
+
+
+def side_pool(database_url: str, name: str, maxconn: int, timeout: float) -> Optional[ConnectionPool]:
+    """Separate pool for connections held while their holder takes more from
+    the main pool (e.g. singleflight's advisory lock): drawing both from one
+    pool deadlocks once every thread holds one and waits for a second.
+
+    None when no pool is installed for `database_url` (connect per call).
+    """
+    if database_url not in _pools:
+        return None
+    with _side_pools_lock:
+        pool = _side_pools.get((database_url, name))
+        if pool is None:
+            pool = _side_pools[(database_url, name)] = ConnectionPool(
+                database_url, maxconn=maxconn, timeout=timeout, name=name)
+        return pool
+
+
+def close_pools() -> None:
+    while _pools:
+        _pools.popitem()[1].close()
+    with _side_pools_lock:
+        while _side_pools:
+            _side_pools.popitem()[1].close()
+
+
+def _open(database_url: str, connection_factory, **kwargs):
+    started = time.perf_counter()
+    with tracing.span('db.connect'):
+        conn = psycopg2.connect(database_url, connection_factory=connection_factory, **kwargs)
+    metrics.DB_CONNECTIONS_OPENED.inc()
+    metrics.DB_CONNECT_DURATION.observe(time.perf_counter() - started)
+    return conn
+
+
+def connect(database_url: str, **kwargs):
+    """Opens an instrumented Postgres connection (metrics, optional tracing).
+
+    If a pool is installed for `database_url` the connection comes from it.
+    """
+    pool = _pools.get(database_url)
+    if pool is not None and not kwargs:
+        return pool.acquire()
+    return _open(database_url, InstrumentedConnection, **kwargs)
+
+
+# Optional read replicas (comma-separated). Read-only service queries go
+# to the first replica whose replication lag is within the limit, and
+# fall back to the primary (the URL the caller passed) otherwise.
+READ_URLS: List[str] = [u.strip() for u in os.getenv('DATABASE_READ_URL', '').split(',') if u.strip()]
+MAX_REPLICA_LAG = float(os.getenv('DATABASE_READ_MAX_LAG', '5'))
+LAG_CHECK_INTERVAL = 5.0
+
+# 0 on a primary or a streaming replica that has replayed everything it
+# received; otherwise seconds since the last replayed transaction. Without a
+# streaming WAL receiver nothing new arrives, so receive = replay says nothing
+# (pg_stat_wal_receiver shows status only to pg_read_all_stats; for other
+# roles a running receiver is taken as streaming).
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status IS NULL OR status = 'streaming')
+             AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 'Infinity')
+    END
+"""
+
+_replica_lag: Dict[str, tuple] = {}  # url -> (checked_at, lag seconds)
+_replica_turn = itertools.count()
+
+
+def replica_name(url: str) -> str:
+    """Metric label for a replica (host:port, never credentials)."""
+    parsed = urlparse(url)
+    return f"{parsed.hostname}:{parsed.port or 5432}"
+
+
+def record_replica_lag(url: str, lag: float) -> float:
+    _replica_lag[url] = (time.monotonic(), lag)
+    metrics.DB_REPLICA_LAG.set(lag, replica_name(url))
+    return lag
+
+
+def forget_replica(url: str) -> None:
+    _replica_lag.pop(url, None)
+
+
+def read_candidates():
+    """READ_URLS in round-robin order as (url, lag).
+
+    lag is None when it is due for a check (at most every
+    LAG_CHECK_INTERVAL); replicas known to lag more than MAX_REPLICA_LAG
+    are left out.
+    """
+    start = next(_replica_turn)
+    for i in range(len(READ_URLS)):
+        url = READ_URLS[(start + i) % len(READ_URLS)]
+        checked = _replica_lag.get(url)
+        if checked is None or time.monotonic() - checked[0] >= LAG_CHECK_INTERVAL:
+            yield url, None
+        elif checked[1] <= MAX_REPLICA_LAG:
+            yield url, checked[1]
+
+
+def _check_lag(url: str, conn) -> float:
+    with conn.cursor() as cur:
+        cur.execute(REPLICA_LAG_SQL)
+        lag = float(cur.fetchone()[0])
+    conn.rollback()
+    return record_replica_lag(url, lag)
+
+
+def connect_read(database_url: str):
+    """Connection for read-only queries.
+
+    Picks the DATABASE_READ_URL replicas round-robin, skipping any that are
+    unreachable or lag more than DATABASE_READ_MAX_LAG seconds (checked at
+    most every LAG_CHECK_INTERVAL); without a usable replica this is
+    connect(database_url).
+    """
+    if not READ_URLS:
+        return connect(database_url)
+
+    reason = 'stale'
+    for url, lag in read_candidates():
+        try:
+            conn = connect(url)
+        except psycopg2.Error:
+            forget_replica(url)
+            reason = 'unreachable'
+            continue
+        try:
+            if lag is None:
+                lag = _check_lag(url, conn)
+        except psycopg2.Error:
+            conn.close()
+            reason = 'unreachable'
+            continue
+        if lag <= MAX_REPLICA_LAG:
+            metrics.DB_READ_ROUTES.inc(replica_name(url), 'fresh')
+            return conn
+        conn.close()
+
+    metrics.DB_READ_ROUTES.inc('primary', reason)
+    return connect(database_url)
+
+
+def copy_rows(cur, table: str, columns, rows) -> None:
+    """Bulk-loads an iterable of tuples with COPY ... FROM STDIN (CSV)."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+_NAMED_PARAM = re.compile(r'%\((\w+)\)s')
+
+
+def to_numbered(sql: str, params: Dict) -> Tuple[str, List]:
+    """Rewrites pyformat %(name)s placeholders as asyncpg-style $n."""
+    order: List[str] = []
+
+    def number(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return f'${order.index(name) + 1}'
+
+    return _NAMED_PARAM.sub(number, sql), [params[name] for name in order]
+
+
+async def fetch_async(pool, name: str, sql: str, params: Dict) -> List[Dict]:
+    """Runs pyformat SQL on an asyncpg pool; rows as dicts, timed as `name`."""
+    sql, args = to_numbered(sql, params)
+    started = time.perf_counter()
+    try:
+        return [dict(row) for row in await pool.fetch(sql, *args)]
+    finally:
+        observe_query(name, started)
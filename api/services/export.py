@@ -0,0 +1,250 @@
+"""Streaming export of the analysis tables (scripts/export.py, api/export.py).
+
+Rows are read through a named (server-side) cursor that fetches
+EXPORT_ITERSIZE rows per round trip, and written out batch by batch as
+NDJSON or, when pyarrow is installed, Parquet (one row group per batch), so
+memory use does not grow with the table. raw_data / raw_hash are left out
+unless include_raw is set.
+
+Each table has a watermark column that moves whenever a row is inserted or
+changed. An export covers the rows with since < watermark <= upper, where
+upper is the newest watermark when the export starts but no later than
+EXPORT_SETTLE seconds ago: a transaction still running at that point may
+commit rows stamped earlier than its commit. The returned watermark is the
+`since` of the next incremental export.
+"""
+import json
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from psycopg2 import sql
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # NDJSON only
+    pyarrow = None
+
+ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '5000'))
+SETTLE_SECONDS = float(os.getenv('EXPORT_SETTLE', '60'))
+
+# Table -> watermark column candidates (predictions has two schemas in
+# the wild: migrations/001 and the one api/index.py creates)
+TABLES = {
+    'historical_matches': ('updated_at',),
+    'team_stats': ('last_updated',),
+    'predictions': ('created_at', 'timestamp'),
+    'match_statistics': ('timestamp',),
+}
+RAW_COLUMNS = ('raw_data', 'raw_hash')
+
+# updated_at moves on every ingest change (HISTORICAL_UPSERT_SQL); the
+# other watermarks already exist. team_stats and predictions hold one row
+# per team / match and are scanned.
+SCHEMA_SQL = """
+    ALTER TABLE historical_matches
+        ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+    CREATE INDEX IF NOT EXISTS idx_historical_matches_updated_at ON historical_matches (updated_at);
+    CREATE INDEX IF NOT EXISTS idx_match_statistics_timestamp ON match_statistics (timestamp);
+"""
+
+NDJSON, PARQUET = 'ndjson', 'parquet'
+CONTENT_TYPES = {NDJSON: 'application/x-ndjson', PARQUET: 'application/vnd.apache.parquet'}
+
+COLUMNS_SQL = """
+    SELECT column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = %s
+    ORDER BY ordinal_position
+"""
+
+UPPER_SQL = "SELECT LEAST(MAX({watermark}), NOW() - make_interval(secs => %s)) FROM {table}"
+
+
+def formats() -> List[str]:
+    return [NDJSON, PARQUET] if pyarrow is not None else [NDJSON]
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    """ISO 8601 watermark; naive values are taken as UTC."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class NdjsonWriter:
+    def __init__(self, out, columns: List[Tuple[str, str]]):
+        self.out = out
+        self.names = [name for name, _ in columns]
+
+    def write(self, rows: List[Tuple]) -> None:
+        lines = [json.dumps(dict(zip(self.names, row)), default=_json_default, separators=(',', ':'))
+                 for row in rows]
+        self.out.write(('\n'.join(lines) + '\n').encode())
+
+    def close(self) -> None:
+        pass
+
+
+class _PositionedStream:
+    """Write-only stream that answers tell(), for non-seekable outputs
+    (sockets, stdout) handed to the Parquet writer."""
+
+    def __init__(self, out):
+        self.out = out
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.out.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        self.out.flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _arrow_type(data_type: str):
+    if data_type in ('smallint', 'integer', 'bigint'):
+        return pyarrow.int64()
+    if data_type in ('real', 'double precision', 'numeric'):
+        return pyarrow.float64()
+    if data_type == 'boolean':
+        return pyarrow.bool_()
+    if data_type == 'timestamp with time zone':
+        return pyarrow.timestamp('us', tz='UTC')
+    if data_type == 'timestamp without time zone':
+        return pyarrow.timestamp('us')
+    if data_type == 'date':
+        return pyarrow.date32()
+    # text, varchar, char and json/jsonb (as JSON text)
+    return pyarrow.string()
+
+
+class ParquetWriter:
+    def __init__(self, out, columns: List[Tuple[str, str]]):
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, _arrow_type(data_type)) for name, data_type in columns])
+        self.stream = _PositionedStream(out)
+        self.writer = pyarrow.parquet.ParquetWriter(self.stream, self.schema, compression='zstd')
+
+    def write(self, rows: List[Tuple]) -> None:
+        arrays = []
+        for i, (name, data_type) in enumerate(self.columns):
+            values = [row[i] for row in rows]
+            if data_type in ('json', 'jsonb'):
+                values = [None if v is None else json.dumps(v, default=_json_default) for v in values]
+            elif data_type == 'numeric':
+                values = [None if v is None else float(v) for v in values]
+            arrays.append(pyarrow.array(values, type=self.schema.field(name).type))
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def _writer(fmt: str, out, columns):
+    if fmt == NDJSON:
+        return NdjsonWriter(out, columns)
+    if fmt == PARQUET:
+        if pyarrow is None:
+            raise ValueError("parquet export needs pyarrow")
+        return ParquetWriter(out, columns)
+    raise ValueError(f"unknown format: {fmt!r} (expected one of {', '.join(formats())})")
+
+
+def export_table(conn, table: str, out, fmt: str = NDJSON, since: Optional[datetime] = None,
+                 include_raw: bool = False, itersize: int = ITERSIZE,
+                 on_start: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Streams `table` rows changed after `since` to the binary stream `out`.
+
+    Returns {'table', 'format', 'rows', 'since', 'watermark'}; the
+    watermark and the rows come from one REPEATABLE READ snapshot.
+    `on_start` gets the same dict (rows still 0) before the first byte is
+    written, e.g. to send response headers.
+    """
+    if table not in TABLES:
+        raise ValueError(f"unknown table: {table!r} (expected one of {', '.join(TABLES)})")
+    if fmt not in (NDJSON, PARQUET):
+        raise ValueError(f"unknown format: {fmt!r} (expected one of {', '.join(formats())})")
+
+    # SET TRANSACTION must be the first statement of the transaction
+    conn.rollback()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute(COLUMNS_SQL, (table,))
+            table_columns = cur.fetchall()
+            names = [name for name, _ in table_columns]
+            watermark = next((c for c in TABLES[table] if c in names), None)
+            if watermark is None:
+                raise ValueError(f"{table} has no watermark column ({', '.join(TABLES[table])})")
+            columns = [(name, data_type) for name, data_type in table_columns
+                       if include_raw or name not in RAW_COLUMNS]
+            cur.execute(sql.SQL(UPPER_SQL).format(watermark=sql.Identifier(watermark),
+                                                  table=sql.Identifier(table)), (SETTLE_SECONDS,))
+            upper = cur.fetchone()[0]
+
+        select = sql.SQL("SELECT {columns} FROM {table} WHERE ").format(
+            columns=sql.SQL(', ').join(sql.Identifier(name) for name, _ in columns),
+            table=sql.Identifier(table))
+        if since is None:
+            # Full export also covers rows without a watermark
+            select += sql.SQL("({w} IS NULL OR {w} <= %s)").format(w=sql.Identifier(watermark))
+            params = (upper,)
+        else:
+            select += sql.SQL("{w} > %s AND {w} <= %s").format(w=sql.Identifier(watermark))
+            params = (since, upper)
+
+        if since is not None and upper is not None and upper < since:
+            upper = since
+        result = {
+            'table': table,
+            'format': fmt,
+            'rows': 0,
+            'since': since.isoformat() if since else None,
+            'watermark': (upper or since).isoformat() if (upper or since) else None,
+        }
+        writer = _writer(fmt, out, columns)
+        if on_start is not None:
+            on_start(result)
+        with conn.cursor(name=f'export_{table}') as cur:
+            cur.itersize = itersize
+            cur.execute(select, params)
+            batch = []
+            for row in cur:
+                batch.append(row)
+                if len(batch) >= itersize:
+                    writer.write(batch)
+                    result['rows'] += len(batch)
+                    batch = []
+            if batch:
+                writer.write(batch)
+                result['rows'] += len(batch)
+        writer.close()
+    finally:
+        conn.rollback()
+    return result
@@ -0,0 +1,176 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2.extras
+
+from . import metrics, pair_stats, payloads, team_form
+from .db import copy_rows
+
+TEAM_COLUMNS = ('id', 'name', 'acronym', 'image_url', 'content_hash')
+
+HISTORICAL_COLUMNS = (
+    'id', 'team1_id', 'team2_id', 'winner_id', 'team1_score', 'team2_score',
+    'played_at', 'map_name', 'event_name', 'raw_data', 'raw_hash',
+)
+
+# Upserts only touch a row when its content hash changed, so re-ingesting
+# identical data produces no dead tuples or WAL. RETURNING yields one row
+# per insert/update; anything missing was unchanged.
+TEAM_UPSERT_SQL = """
+    ON CONFLICT (id) DO UPDATE SET
+        name = EXCLUDED.name,
+        acronym = EXCLUDED.acronym,
+        image_url = EXCLUDED.image_url,
+        content_hash = EXCLUDED.content_hash
+    WHERE teams.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING (xmax = 0) AS inserted
+"""
+
+HISTORICAL_UPSERT_SQL = """
+    ON CONFLICT (id) DO UPDATE SET
+        team1_id = EXCLUDED.team1_id,
+        team2_id = EXCLUDED.team2_id,
+        winner_id = EXCLUDED.winner_id,
+        team1_score = EXCLUDED.team1_score,
+        team2_score = EXCLUDED.team2_score,
+        played_at = EXCLUDED.played_at,
+        map_name = EXCLUDED.map_name,
+        event_name = EXCLUDED.event_name,
+        raw_data = EXCLUDED.raw_data,
+        raw_hash = EXCLUDED.raw_hash,
+        updated_at = NOW()
+    WHERE historical_matches.raw_hash IS DISTINCT FROM EXCLUDED.raw_hash
+    RETURNING team1_id, team2_id, (xmax = 0) AS inserted
+"""
+
+
+def upsert_counts(table: str, returned: List[Tuple], total: int) -> Dict[str, int]:
+    """Turns RETURNING (xmax = 0) rows into new/changed/unchanged counts."""
+    new = sum(1 for r in returned if r[-1])
+    counts = {'new': new, 'changed': len(returned) - new, 'unchanged': total - len(returned)}
+    for result, value in counts.items():
+        if value:
+            metrics.UPSERTS.inc(table, result, amount=value)
+    return counts
+
+
+def _opponents(match: Dict) -> List[Dict]:
+    return [o['opponent'] for o in (match.get('opponents') or []) if o and o.get('opponent')]
+
+
+def team_row(team: Dict) -> Tuple:
+    """(id, name, acronym, image_url, content_hash) for a PandaScore team."""
+    values = (team['name'], team.get('acronym'), team.get('image_url'))
+    return (team['id'],) + values + (payloads.content_hash(values),)
+
+
+def team_rows(match: Dict) -> List[Tuple]:
+    return [team_row(t) for t in _opponents(match)]
+
+
+def upsert_teams(cur, rows: List[Tuple]) -> Dict[str, int]:
+    if not rows:
+        return {'new': 0, 'changed': 0, 'unchanged': 0}
+    returned = psycopg2.extras.execute_values(
+        cur, f"INSERT INTO teams ({', '.join(TEAM_COLUMNS)}) VALUES %s" + TEAM_UPSERT_SQL,
+        rows, fetch=True)
+    return upsert_counts('teams', returned, len(rows))
+
+
+def upsert_historical(cur, rows: List[Tuple]) -> Dict[str, int]:
+    """Upserts historical_matches rows and refreshes the H2H aggregates and
+    form state of the pairs and teams whose matches were inserted or changed."""
+    if not rows:
+        return {'new': 0, 'changed': 0, 'unchanged': 0}
+    returned = psycopg2.extras.execute_values(
+        cur, f"INSERT INTO historical_matches ({', '.join(HISTORICAL_COLUMNS)}) VALUES %s" + HISTORICAL_UPSERT_SQL,
+        rows, fetch=True)
+    pair_stats.refresh_pairs(cur, ((r[0], r[1]) for r in returned))
+    team_form.refresh_teams(cur, (team_id for r in returned for team_id in r[:2]))
+    return upsert_counts('historical_matches', returned, len(rows))
+
+
+def _score(match: Dict, team_id: Optional[int], position: int) -> int:
+    results = match.get('results') or []
+    for result in results:
+        if result.get('team_id') == team_id:
+            return result.get('score', 0)
+    return results[position].get('score', 0) if len(results) > position else 0
+
+
+def historical_match_row(match: Dict, archive_rows: Optional[Dict] = None) -> Optional[Tuple]:
+    """Maps a finished PandaScore match to a historical_matches row.
+
+    Returns None when the match has fewer than two opponents. When
+    `archive_rows` is given, the packed full payload is added to it keyed
+    by content hash so callers can bulk-insert the archive.
+    """
+    opponents = _opponents(match)
+    if len(opponents) < 2:
+        return None
+    team1_id, team2_id = opponents[0]['id'], opponents[1]['id']
+    packed = payloads.pack('match', match)
+    if archive_rows is not None:
+        archive_rows[packed[0]] = packed
+    return (
+        match['id'],
+        team1_id,
+        team2_id,
+        match.get('winner_id'),
+        _score(match, team1_id, 0),
+        _score(match, team2_id, 1),
+        match['scheduled_at'],
+        match.get('match_type'),
+        (match.get('tournament') or {}).get('name'),
+        json.dumps(payloads.project_match(match)),
+        packed[0],
+    )
+
+
+def bulk_load_historical(cur, matches: List[Dict]) -> Dict[str, int]:
+    """COPYs a batch of finished matches (plus their teams and archived
+    payloads) through temp staging tables and merges them.
+
+    Existing rows are only rewritten when their content hash changed, and
+    the team pairs and teams of written rows get their team_pair_stats and
+    team_form refreshed; returns loaded and new/changed/unchanged counts.
+    """
+    archive_rows: Dict = {}
+    teams: Dict = {}
+    rows = []
+    for match in matches:
+        row = historical_match_row(match, archive_rows)
+        if row is None:
+            continue
+        rows.append(row)
+        for team in team_rows(match):
+            teams[team[0]] = team
+    if not rows:
+        return {'loaded': 0, 'new': 0, 'changed': 0, 'unchanged': 0}
+
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS stage_teams (LIKE teams INCLUDING DEFAULTS) ON COMMIT DROP;
+        CREATE TEMP TABLE IF NOT EXISTS stage_payloads (LIKE raw_payload_archive INCLUDING DEFAULTS) ON COMMIT DROP;
+        CREATE TEMP TABLE IF NOT EXISTS stage_historical (LIKE historical_matches INCLUDING DEFAULTS) ON COMMIT DROP;
+        TRUNCATE stage_teams, stage_payloads, stage_historical;
+    """)
+    copy_rows(cur, 'stage_teams', TEAM_COLUMNS, teams.values())
+    copy_rows(cur, 'stage_payloads', ('content_hash', 'resource', 'payload', 'raw_size'),
+              ((h, r, '\\x' + p.hex(), s) for h, r, p, s in archive_rows.values()))
+    copy_rows(cur, 'stage_historical', HISTORICAL_COLUMNS, rows)
+
+    cols = ', '.join(TEAM_COLUMNS)
+    cur.execute(f"INSERT INTO teams ({cols}) SELECT {cols} FROM stage_teams" + TEAM_UPSERT_SQL)
+    upsert_counts('teams', cur.fetchall(), len(teams))
+    cur.execute("""
+        INSERT INTO raw_payload_archive (content_hash, resource, payload, raw_size)
+        SELECT content_hash, resource, payload, raw_size FROM stage_payloads
+        ON CONFLICT (content_hash) DO NOTHING
+    """)
+    cols = ', '.join(HISTORICAL_COLUMNS)
+    cur.execute(f"INSERT INTO historical_matches ({cols}) SELECT {cols} FROM stage_historical" + HISTORICAL_UPSERT_SQL)
+    returned = cur.fetchall()
+    pair_stats.refresh_pairs(cur, ((r[0], r[1]) for r in returned))
+    team_form.refresh_teams(cur, (team_id for r in returned for team_id in r[:2]))
+    counts = upsert_counts('historical_matches', returned, len(rows))
+    return dict(counts, loaded=len(rows))
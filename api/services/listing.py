@@ -0,0 +1,193 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2.extras
+
+from .db import connect_read, fetch_async
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+MATCH_COLUMNS = ('id', 'scheduled_at', 'team1_id', 'team2_id', 'team1_name', 'team2_name',
+                 'league_name', 'match_status')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: List) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> List:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return values
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def teams_args(query: Dict[str, List[str]]) -> Dict:
+    """list_teams kwargs from a parse_qs() dict; raises ValueError on bad input."""
+    return {
+        'cursor': query.get('cursor', [None])[0],
+        'limit': int(query['limit'][0]) if 'limit' in query else None,
+    }
+
+
+def matches_args(query: Dict[str, List[str]]) -> Dict:
+    """list_matches kwargs from a parse_qs() dict; raises ValueError on bad input."""
+    return {
+        'cursor': query.get('cursor', [None])[0],
+        'limit': int(query['limit'][0]) if 'limit' in query else None,
+        'league': query.get('league', [None])[0],
+        'status': query.get('status', [None])[0],
+        'team_id': int(query['team_id'][0]) if 'team_id' in query else None,
+        'descending': query.get('order', ['asc'])[0] == 'desc',
+    }
+
+
+def _teams_query(cursor: Optional[str], limit: int) -> Tuple[str, Dict]:
+    after = 0
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        after = values[0]
+    return """
+        SELECT id, name, acronym, image_url
+        FROM teams
+        WHERE id > %(after)s
+        ORDER BY id
+        LIMIT %(limit)s
+    """, {'after': after, 'limit': limit + 1}
+
+
+def _teams_page(rows, limit: int) -> Dict:
+    items = [dict(r) for r in rows[:limit]]
+    return {
+        'items': items,
+        'limit': limit,
+        'next_cursor': encode_cursor([items[-1]['id']]) if len(rows) > limit else None
+    }
+
+
+def _matches_query(cursor: Optional[str], limit: int, league: Optional[str], status: Optional[str],
+                   team_id: Optional[int], descending: bool) -> Tuple[str, Dict]:
+    op, direction = ('<', 'DESC') if descending else ('>', 'ASC')
+
+    conditions = ['scheduled_at IS NOT NULL']
+    params: Dict = {'limit': limit + 1}
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2:
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        try:
+            params['after_at'] = datetime.fromisoformat(values[0])
+            params['after_id'] = int(values[1])
+        except (TypeError, ValueError) as e:
+            raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+        conditions.append(f"(scheduled_at, id) {op} (%(after_at)s, %(after_id)s)")
+    if league:
+        conditions.append("league_name = %(league)s")
+        params['league'] = league
+    if status:
+        conditions.append("match_status = %(status)s")
+        params['status'] = status
+
+    columns = ', '.join(MATCH_COLUMNS)
+    order = f"ORDER BY scheduled_at {direction}, id {direction} LIMIT %(limit)s"
+    if team_id is None:
+        return f"SELECT {columns} FROM matches WHERE {' AND '.join(conditions)} {order}", params
+
+    # One keyset range per side so each branch walks its own index,
+    # instead of an OR that defeats the (team, scheduled_at, id) order
+    params['team_id'] = team_id
+    where = ' AND '.join(conditions)
+    return f"""
+        SELECT {columns} FROM (
+            (SELECT {columns} FROM matches
+             WHERE team1_id = %(team_id)s AND {where} {order})
+            UNION ALL
+            (SELECT {columns} FROM matches
+             WHERE team2_id = %(team_id)s AND team1_id IS DISTINCT FROM %(team_id)s AND {where} {order})
+        ) m {order}
+    """, params
+
+
+def _matches_page(rows, limit: int) -> Dict:
+    items = []
+    for r in rows[:limit]:
+        item = dict(r)
+        item['scheduled_at'] = item['scheduled_at'].isoformat()
+        items.append(item)
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([items[-1]['scheduled_at'], items[-1]['id']])
+    return {'items': items, 'limit': limit, 'next_cursor': next_cursor}
+
+
+class ListingService:
+    """DB-only, keyset-paginated listings of stored teams and matches.
+
+    Pages are addressed by an opaque cursor holding the sort key of the
+    last row, so every page is an index range scan (see migration 007)
+    instead of an OFFSET that gets slower the deeper you go.
+    """
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+
+    def _get_db_connection(self):
+        return connect_read(self.database_url)
+
+    def _fetch(self, sql: str, params: Dict) -> List[Dict]:
+        with self._get_db_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def list_teams(self, cursor: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+        limit = clamp_page_size(limit)
+        sql, params = _teams_query(cursor, limit)
+        return _teams_page(self._fetch(sql, params), limit)
+
+    def list_matches(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                     league: Optional[str] = None, status: Optional[str] = None,
+                     team_id: Optional[int] = None, descending: bool = False) -> Dict:
+        """Matches ordered by (scheduled_at, id); rows without a date are not listed."""
+        limit = clamp_page_size(limit)
+        sql, params = _matches_query(cursor, limit, league, status, team_id, descending)
+        return _matches_page(self._fetch(sql, params), limit)
+
+
+class AsyncListingService:
+    """Same listings over an asyncpg pool (or server.ReadPools), for the
+    self-hosted server."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def list_teams(self, cursor: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+        limit = clamp_page_size(limit)
+        sql, params = _teams_query(cursor, limit)
+        return _teams_page(await fetch_async(self.pool, 'list_teams', sql, params), limit)
+
+    async def list_matches(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                           league: Optional[str] = None, status: Optional[str] = None,
+                           team_id: Optional[int] = None, descending: bool = False) -> Dict:
+        limit = clamp_page_size(limit)
+        sql, params = _matches_query(cursor, limit, league, status, team_id, descending)
+        return _matches_page(await fetch_async(self.pool, 'list_matches', sql, params), limit)
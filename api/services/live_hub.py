@@ -0,0 +1,152 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from . import live_updates, metrics
+from .db import to_numbered
+
+# Messages a subscriber may have queued before it counts as too slow
+QUEUE_SIZE = 256
+
+
+class Subscriber:
+    """One connected client; `queue` yields messages, then None once closed.
+
+    Transports that write straight to a socket override deliver/shutdown.
+    """
+
+    def __init__(self, transport: str, queue_size: int = QUEUE_SIZE):
+        self.transport = transport
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.topics: Set[str] = set()
+        self.closed = False
+
+    def deliver(self, message) -> bool:
+        """Hands over one message without blocking; False = too far behind."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def shutdown(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class Hub:
+    """In-process fan-out for the self-hosted server (asyncio, single loop).
+
+    Publishers hand over an already encoded message which is queued as the
+    same object for every subscriber of the topic. A subscriber whose queue
+    is full is dropped rather than slowing down publishing.
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.topics: Dict[str, Set[Subscriber]] = {}
+
+    def subscribe(self, topic: str, subscriber: Subscriber) -> None:
+        self.topics.setdefault(topic, set()).add(subscriber)
+        subscriber.topics.add(topic)
+
+    def unsubscribe(self, topic: str, subscriber: Subscriber) -> None:
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.topics[topic]
+        subscriber.topics.discard(topic)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return bool(self.topics.get(topic))
+
+    def connect(self, transport: str) -> Subscriber:
+        return self.register(Subscriber(transport, self.queue_size))
+
+    def register(self, subscriber: Subscriber) -> Subscriber:
+        metrics.LIVE_STREAM_SUBSCRIBERS.inc(subscriber.transport)
+        return subscriber
+
+    def close(self, subscriber: Subscriber) -> None:
+        """Detaches a subscriber and shuts it down (queue consumers get None)."""
+        if subscriber.closed:
+            return
+        subscriber.closed = True
+        for topic in list(subscriber.topics):
+            self.unsubscribe(topic, subscriber)
+        metrics.LIVE_STREAM_SUBSCRIBERS.dec(subscriber.transport)
+        subscriber.shutdown()
+
+    def publish(self, topic: str, message) -> int:
+        """Queues `message` for every subscriber of `topic`; returns how many got it."""
+        delivered = 0
+        for subscriber in list(self.topics.get(topic, ())):
+            if subscriber.deliver(message):
+                delivered += 1
+            else:
+                metrics.LIVE_STREAM_DROPPED.inc(subscriber.transport)
+                self.close(subscriber)
+        return delivered
+
+
+def match_topic(match_id: int) -> str:
+    # Same naming as the Pusher channels
+    return f'match-{match_id}'
+
+
+class PostgresListener:
+    """LISTENs on live_updates.NOTIFY_CHANNEL with one asyncpg connection
+    and publishes (timestamp, SSE frame) for matches that have subscribers.
+    """
+
+    def __init__(self, hub: Hub, database_url: str, pool):
+        self.hub = hub
+        self.database_url = database_url
+        self.pool = pool
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            try:
+                conn = await asyncpg.connect(self.database_url)
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"live listener connect failed: {e}")
+                await asyncio.sleep(5)
+                continue
+            lost = asyncio.get_running_loop().create_future()
+            conn.add_termination_listener(lambda c: lost.done() or lost.set_result(None))
+            try:
+                await conn.add_listener(live_updates.NOTIFY_CHANNEL, self._on_notify)
+                await lost
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(1)
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        event = json.loads(payload)
+        if self.hub.has_subscribers(match_topic(event['match_id'])):
+            asyncio.ensure_future(self._publish(event['match_id'], datetime.fromisoformat(event['timestamp'])))
+
+    async def _publish(self, match_id: int, timestamp: datetime) -> None:
+        sql, args = to_numbered(live_updates.EVENT_SQL, {'match_id': match_id, 'timestamp': timestamp})
+        row = await self.pool.fetchrow(sql, *args)
+        if row is not None:
+            frame = live_updates.sse_frame(match_id, row['timestamp'], row['event_data'])
+            self.hub.publish(match_topic(match_id), (row['timestamp'], frame))
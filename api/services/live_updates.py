@@ -0,0 +1,326 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import psycopg2.extras
+
+from . import metrics, payloads, player_stats, rounds
+from .db import connect
+
+# Postgres NOTIFY channel; the payload is {"match_id", "timestamp"} of the
+# match_statistics row holding the new snapshot
+NOTIFY_CHANNEL = 'live_updates'
+
+# Time budget of one polling cycle (live.py / websocket.py); PandaScore
+# calls are cut short and remaining matches skipped once it is spent
+CYCLE_DEADLINE = float(os.getenv('LIVE_CYCLE_DEADLINE', '25'))
+
+HEARTBEAT_INTERVAL = 15.0
+RETRY_MS = 3000
+HEARTBEAT_FRAME = b': heartbeat\n\n'
+
+# Write-behind flush triggers of SnapshotBuffer: pending snapshots are
+# written once this many are buffered or the oldest is this many seconds old
+FLUSH_SIZE = int(os.getenv('LIVE_FLUSH_SIZE', '50'))
+FLUSH_INTERVAL = float(os.getenv('LIVE_FLUSH_INTERVAL', '2'))
+
+# Rows whose live state did not change are skipped: no dead tuples or WAL,
+# and RETURNING yields only the matches that changed
+UPDATE_MATCHES_SQL = """
+    UPDATE matches AS m
+    SET match_status = v.status,
+        live_score = v.score,
+        player_stats = v.players
+    FROM (VALUES %s) AS v(id, status, score, players)
+    WHERE m.id = v.id
+      AND (m.match_status, m.live_score, m.player_stats)
+          IS DISTINCT FROM (v.status, v.score, v.players)
+    RETURNING m.id
+"""
+UPDATE_MATCHES_TEMPLATE = "(%s::integer, %s, %s::jsonb, %s::jsonb)"
+
+# A running match the sync has not stored yet gets a minimal row, so the
+# match_statistics foreign key holds; the next sync fills in the rest
+INSERT_MISSING_MATCHES_SQL = """
+    INSERT INTO matches (id, team1_name, team2_name, team1_id, team2_id)
+    VALUES %s
+    ON CONFLICT (id) DO NOTHING
+"""
+
+INSERT_SNAPSHOTS_SQL = """
+    INSERT INTO match_statistics
+        (match_id, timestamp, event_type, event_data)
+    VALUES %s
+    ON CONFLICT (match_id, timestamp) DO NOTHING
+"""
+
+# One notification per changed match, in array order
+NOTIFY_SQL = """
+    SELECT pg_notify(%s, json_build_object('match_id', u.match_id, 'timestamp', u.ts)::text)
+    FROM unnest(%s::integer[], %s::timestamptz[]) AS u(match_id, ts)
+"""
+
+EVENTS_SINCE_SQL = """
+    SELECT timestamp, event_data
+    FROM match_statistics
+    WHERE match_id = %(match_id)s AND timestamp > %(since)s
+    ORDER BY timestamp
+    LIMIT %(limit)s
+"""
+
+LATEST_EVENT_SQL = """
+    SELECT timestamp, event_data
+    FROM match_statistics
+    WHERE match_id = %(match_id)s
+    ORDER BY timestamp DESC
+    LIMIT 1
+"""
+
+LATEST_EVENTS_SQL = """
+    SELECT DISTINCT ON (match_id) match_id, timestamp, event_data
+    FROM match_statistics
+    WHERE match_id = ANY(%s)
+    ORDER BY match_id, timestamp DESC
+"""
+
+EVENT_SQL = """
+    SELECT timestamp, event_data
+    FROM match_statistics
+    WHERE match_id = %(match_id)s AND timestamp = %(timestamp)s
+"""
+
+
+def build_match_data(match: Dict, details: Dict) -> Tuple[Dict, Optional[Dict]]:
+    """(match_data, round_state) of a PandaScore match and its /stats
+    payload, as stored by save_match_data and published to subscribers."""
+    match_data = {
+        "match_id": match.get('id'),
+        "status": match.get('status'),
+        "current_score": {
+            "team1": match.get('results', [{'score': 0}])[0].get('score', 0),
+            "team2": match.get('results', [{'score': 0}])[1].get('score', 0) if len(match.get('results', [])) > 1 else 0
+        },
+        "teams": {
+            "team1": {
+                "id": match.get('opponents', [{}])[0].get('opponent', {}).get('id'),
+                "name": match.get('opponents', [{}])[0].get('opponent', {}).get('name', 'TBD'),
+            },
+            "team2": {
+                "id": match.get('opponents', [{}])[1].get('opponent', {}).get('id') if len(match.get('opponents', [])) > 1 else None,
+                "name": match.get('opponents', [{}])[1].get('opponent', {}).get('name', 'TBD') if len(match.get('opponents', [])) > 1 else 'TBD',
+            }
+        },
+        "current_round": details.get('current_round', 0),
+        "map": details.get('map', {}).get('name'),
+        "player_stats": details.get('players', []),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    # Round-level state is not published, only written to match_rounds
+    round_state = rounds.round_state(
+        details, match_data['teams']['team1']['id'], match_data['teams']['team2']['id'])
+    return match_data, round_state
+
+
+def stored_match_data(cur, matches: List[Dict]) -> Dict[int, Dict]:
+    """match_id -> match_data rebuilt from the running-list entry and the
+    latest stored snapshot, for matches that are not polled this cycle
+    (kept up to date by webhooks). Matches without a snapshot are left out.
+    """
+    by_id = {match.get('id'): match for match in matches if match.get('id') is not None}
+    if not by_id:
+        return {}
+    cur.execute(LATEST_EVENTS_SQL, (list(by_id),))
+    stored = {}
+    for match_id, timestamp, event in cur.fetchall():
+        details = {
+            'current_round': event.get('current_round', 0),
+            'map': {'name': event.get('map')},
+            'players': event.get('player_stats', []),
+        }
+        match_data, _ = build_match_data(by_id[match_id], details)
+        # Same naive-UTC format as freshly built match_data
+        match_data['timestamp'] = timestamp.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+        stored[match_id] = match_data
+    return stored
+
+
+def save_match_data(cur, match_data: Dict, round_state: Optional[Dict] = None) -> bool:
+    """Stores one processed live snapshot.
+
+    Updates the match row when its live state changed (creating a minimal
+    row for a match the sync has not stored yet), appends the snapshot to
+    match_statistics and, only on a change, writes the player
+    lines to player_match_stats and NOTIFYs NOTIFY_CHANNEL (delivered when
+    the caller commits). Rounds finished since the previous poll
+    (`round_state`, see rounds.round_state) are appended to match_rounds
+    and matches.round_history. Returns whether the live state changed.
+    """
+    return bool(save_snapshots(cur, [(match_data, round_state)]))
+
+
+def save_snapshots(cur, snapshots: List[Tuple[Dict, Optional[Dict]]]) -> Set[int]:
+    """save_match_data for many (match_data, round_state) pairs with one
+    statement per step instead of one per match; returns the ids of the
+    matches whose live state changed.
+
+    Several snapshots of one match are applied in the given order: the
+    n-th snapshot of every match goes into the n-th round of statements.
+    """
+    changed: Set[int] = set()
+    waves: List[List[Tuple[Dict, Optional[Dict]]]] = []
+    seen: Dict[int, int] = {}
+    for snapshot in snapshots:
+        match_id = snapshot[0]['match_id']
+        n = seen.get(match_id, 0)
+        seen[match_id] = n + 1
+        if n == len(waves):
+            waves.append([])
+        waves[n].append(snapshot)
+    for wave in waves:
+        changed |= _save_wave(cur, wave)
+    return changed
+
+
+def _save_wave(cur, wave: List[Tuple[Dict, Optional[Dict]]]) -> Set[int]:
+    """Snapshots of distinct matches (UPDATE ... FROM VALUES needs one row per match)."""
+    psycopg2.extras.execute_values(cur, INSERT_MISSING_MATCHES_SQL, [(
+        match_data['match_id'],
+        match_data['teams']['team1']['name'],
+        match_data['teams']['team2']['name'],
+        match_data['teams']['team1']['id'],
+        match_data['teams']['team2']['id']
+    ) for match_data, _ in wave], page_size=len(wave))
+    updated = psycopg2.extras.execute_values(cur, UPDATE_MATCHES_SQL, [(
+        match_data['match_id'],
+        match_data['status'],
+        json.dumps(match_data['current_score']),
+        json.dumps(match_data['player_stats'])
+    ) for match_data, _ in wave], template=UPDATE_MATCHES_TEMPLATE, page_size=len(wave), fetch=True)
+    changed = {row[0] for row in updated}
+
+    psycopg2.extras.execute_values(cur, INSERT_SNAPSHOTS_SQL, [(
+        match_data['match_id'],
+        match_data['timestamp'],
+        'live_update',
+        json.dumps(payloads.project_live_event(match_data))
+    ) for match_data, _ in wave], page_size=len(wave))
+
+    for match_data, round_state in wave:
+        rounds.record_rounds(cur, match_data['match_id'], round_state, match_data['timestamp'])
+
+    changed_data = [match_data for match_data, _ in wave if match_data['match_id'] in changed]
+    if changed_data:
+        player_rows = [row for match_data in changed_data for row in player_stats.player_rows(
+            match_data['match_id'], match_data['timestamp'], match_data['player_stats'], match_data.get('map'))]
+        if player_rows:
+            psycopg2.extras.execute_values(cur, player_stats.INSERT_SQL, player_rows, page_size=1000)
+        cur.execute(NOTIFY_SQL, (NOTIFY_CHANNEL,
+                                 [match_data['match_id'] for match_data in changed_data],
+                                 [match_data['timestamp'] for match_data in changed_data]))
+    return changed
+
+
+class SnapshotBuffer:
+    """Write-behind buffer for the snapshots of one polling cycle.
+
+    add() queues a snapshot; the buffer is written with save_snapshots in
+    one transaction on one connection once `max_size` snapshots are queued,
+    when the oldest queued one is `max_delay` seconds old (checked on add,
+    there is no timer thread) and on flush() at the end of the cycle. If a
+    batch fails, its snapshots are retried one transaction each so a single
+    bad row does not drop the others; the match ids of snapshots that still
+    fail are collected in `failed`.
+    """
+
+    def __init__(self, database_url: str, pipeline: str, max_size: int = FLUSH_SIZE,
+                 max_delay: float = FLUSH_INTERVAL):
+        self.database_url = database_url
+        self.pipeline = pipeline
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.pending: List[Tuple[Dict, Optional[Dict]]] = []
+        self.oldest = 0.0
+        self.changed: Set[int] = set()
+        self.failed: Set[int] = set()
+
+    def add(self, match_data: Dict, round_state: Optional[Dict] = None) -> None:
+        if not self.pending:
+            self.oldest = time.monotonic()
+        self.pending.append((match_data, round_state))
+        if len(self.pending) >= self.max_size:
+            self.flush('size')
+        elif time.monotonic() - self.oldest >= self.max_delay:
+            self.flush('time')
+
+    def flush(self, trigger: str = 'final') -> Set[int]:
+        """Writes the queued snapshots; returns the ids of changed matches."""
+        if not self.pending:
+            return set()
+        batch, self.pending = self.pending, []
+        started = time.perf_counter()
+        try:
+            changed = self._write(batch)
+        except Exception as e:
+            print(f"Batched snapshot write failed ({e}), writing {len(batch)} snapshots one by one")
+            changed = set()
+            for snapshot in batch:
+                try:
+                    changed |= self._write([snapshot])
+                except Exception as e:
+                    print(f"Snapshot write failed ({snapshot[0]['match_id']}): {e}")
+                    metrics.LIVE_WRITE_FAILURES.inc(self.pipeline)
+                    self.failed.add(snapshot[0]['match_id'])
+        metrics.LIVE_WRITE_BATCHES.inc(self.pipeline, trigger)
+        metrics.LIVE_WRITE_BATCH_SIZE.observe(len(batch), self.pipeline)
+        metrics.LIVE_WRITE_DURATION.observe(time.perf_counter() - started, self.pipeline)
+        self.changed |= changed
+        return changed
+
+    def _write(self, snapshots: List[Tuple[Dict, Optional[Dict]]]) -> Set[int]:
+        conn = connect(self.database_url)
+        try:
+            with conn.cursor() as cur:
+                changed = save_snapshots(cur, snapshots)
+            conn.commit()
+            return changed
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def parse_event_id(value: Optional[str]) -> Optional[datetime]:
+    """Last-Event-ID -> snapshot timestamp; None if absent or not ours."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is not None else None
+
+
+def sse_frame(match_id: int, timestamp: datetime, event_data) -> bytes:
+    """Encodes a snapshot as one SSE `match-update` event, id = its timestamp."""
+    if isinstance(event_data, str):
+        event_data = json.loads(event_data)
+    data = json.dumps({'match_id': match_id, 'timestamp': timestamp.isoformat(), 'match': event_data},
+                      separators=(',', ':'))
+    return f"id: {timestamp.isoformat()}\nevent: match-update\ndata: {data}\n\n".encode()
+
+
+def replay_frames(match_id: int, rows: Iterable) -> List[bytes]:
+    """Frames for stored snapshots, skipping ones identical to the previous."""
+    frames = []
+    previous = None
+    for timestamp, event_data in rows:
+        if isinstance(event_data, str):
+            event_data = json.loads(event_data)
+        if event_data == previous:
+            continue
+        previous = event_data
+        frames.append(sse_frame(match_id, timestamp, event_data))
+    return frames
@@ -0,0 +1,238 @@
+"""In-process metrics registry rendered in the Prometheus text format.
+
+Updates are a dict lookup and an addition under a per-metric lock, so the
+module-level metrics below can be touched from hot paths. Values are per
+process: on Vercel each warm instance reports its own counters.
+"""
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _sort_key(item) -> Tuple:
+    # Label values may mix types (e.g. status 200 and 'error')
+    return tuple(str(v) for v in item[0])
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items(), key=_sort_key)
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labelvalues) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount=1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # per-bucket counts (+Inf last), sum
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(((k, (list(v[0]), v[1])) for k, v in self._values.items()), key=_sort_key)
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# HTTP handlers
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'Handled HTTP requests.', ('handler', 'status'))
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ('handler',))
+
+# PandaScore API
+PANDASCORE_REQUESTS = REGISTRY.counter(
+    'pandascore_requests_total', 'PandaScore API calls by status code.', ('endpoint', 'status'))
+PANDASCORE_REQUEST_DURATION = REGISTRY.histogram(
+    'pandascore_request_duration_seconds', 'PandaScore API call latency.', ('endpoint',))
+PANDASCORE_RATE_LIMITED = REGISTRY.counter(
+    'pandascore_rate_limited_total', 'PandaScore calls rejected with 429.', ('endpoint',))
+PANDASCORE_RETRIES = REGISTRY.counter(
+    'pandascore_retries_total', 'PandaScore calls retried after a timeout, 429 or 5xx.', ('endpoint',))
+PANDASCORE_HEDGES = REGISTRY.counter(
+    'pandascore_hedges_total', 'Hedged PandaScore calls by which request answered first (primary/hedge).',
+    ('endpoint', 'winner'))
+PANDASCORE_STALE_SERVED = REGISTRY.counter(
+    'pandascore_stale_served_total', 'Last known PandaScore bodies served while the API was unavailable.',
+    ('endpoint',))
+QUOTA_REMAINING = REGISTRY.gauge(
+    'pandascore_quota_remaining', 'Remaining PandaScore quota from the last X-Rate-Limit-Remaining header.')
+QUOTA_QUEUE_DEPTH = REGISTRY.gauge(
+    'pandascore_queue_depth', 'PandaScore calls waiting for budget by priority class.', ('priority',))
+QUOTA_IN_FLIGHT = REGISTRY.gauge(
+    'pandascore_in_flight', 'PandaScore calls admitted and not yet answered.')
+QUOTA_WAIT_DURATION = REGISTRY.histogram(
+    'pandascore_queue_wait_seconds', 'Time PandaScore calls waited for budget by priority class.', ('priority',))
+QUOTA_DEFERRED = REGISTRY.counter(
+    'pandascore_deferred_total', 'PandaScore calls deferred for lack of budget by priority class.', ('priority',))
+PANDASCORE_CIRCUIT_OPEN = REGISTRY.counter(
+    'pandascore_circuit_open_total', 'Times an endpoint circuit breaker opened.', ('endpoint',))
+
+# Postgres
+DB_QUERIES = REGISTRY.counter(
+    'db_queries_total', 'Executed SQL statements by calling function.', ('query',))
+DB_QUERY_DURATION = REGISTRY.histogram(
+    'db_query_duration_seconds', 'SQL statement latency by calling function.', ('query',))
+UPSERTS = REGISTRY.counter(
+    'db_upserts_total', 'Upserted rows by table and result (new/changed/unchanged = write skipped).',
+    ('table', 'result'))
+DB_CONNECTIONS_OPENED = REGISTRY.counter(
+    'db_connections_opened_total', 'Postgres connections opened.')
+DB_CONNECT_DURATION = REGISTRY.histogram(
+    'db_connect_duration_seconds', 'Time to open a Postgres connection.')
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    'db_pool_connections', 'Pooled Postgres connections by pool and state (idle/in_use).', ('pool', 'state'))
+DB_POOL_WAIT_DURATION = REGISTRY.histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled connection.', ('pool',))
+DB_READ_ROUTES = REGISTRY.counter(
+    'db_read_routes_total', 'Read-only connections by target (replica or primary fallback) and reason.',
+    ('target', 'reason'))
+DB_REPLICA_LAG = REGISTRY.gauge(
+    'db_replica_lag_seconds', 'Last measured replication lag per read replica.', ('replica',))
+
+# Caches
+CACHE_LOOKUPS = REGISTRY.counter(
+    'cache_lookups_total', 'Cache lookups by cache and result (hit/miss).', ('cache', 'result'))
+SINGLEFLIGHT_CALLS = REGISTRY.counter(
+    'singleflight_calls_total', 'Single-flight calls by group and outcome (computed/coalesced_local/coalesced_shared).',
+    ('group', 'outcome'))
+
+# Live pipeline
+LIVE_CYCLE_DURATION = REGISTRY.histogram(
+    'live_cycle_duration_seconds', 'Duration of one live polling cycle.', ('pipeline',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+LIVE_MATCHES_PROCESSED = REGISTRY.counter(
+    'live_matches_processed_total', 'Live matches processed and stored.', ('pipeline',))
+LIVE_WRITE_BATCHES = REGISTRY.counter(
+    'live_write_batches_total', 'Write-behind flushes of live snapshots by trigger (size/time/final).',
+    ('pipeline', 'trigger'))
+LIVE_WRITE_BATCH_SIZE = REGISTRY.histogram(
+    'live_write_batch_size', 'Live snapshots written per flush.', ('pipeline',),
+    buckets=(1, 2, 5, 10, 20, 50, 100))
+LIVE_WRITE_FAILURES = REGISTRY.counter(
+    'live_write_failures_total', 'Live snapshots that could not be written, even one by one.', ('pipeline',))
+LIVE_WRITE_DURATION = REGISTRY.histogram(
+    'live_write_duration_seconds', 'Time to write one flush of live snapshots.', ('pipeline',))
+LIVE_STREAM_SUBSCRIBERS = REGISTRY.gauge(
+    'live_stream_subscribers', 'Connected live update subscribers by transport.', ('transport',))
+LIVE_STREAM_DROPPED = REGISTRY.counter(
+    'live_stream_dropped_total', 'Subscribers disconnected for falling behind.', ('transport',))
+BROADCAST_MESSAGES = REGISTRY.counter(
+    'broadcast_messages_total', 'WebSocket messages delivered to subscribers by event.', ('event',))
+BROADCAST_PUBLISH_DURATION = REGISTRY.histogram(
+    'broadcast_publish_seconds', 'Time to encode and fan out one event to all subscribers.',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+
+WEBHOOK_EVENTS = REGISTRY.counter(
+    'webhook_events_total',
+    'Webhook deliveries by event type and result (applied/unchanged/duplicate/stale/ignored/invalid/unauthorized/failed).',
+    ('type', 'result'))
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache, 'hit' if hit else 'miss')
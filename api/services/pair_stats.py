@@ -0,0 +1,139 @@
+"""Head-to-head aggregates per team pair (team_pair_stats).
+
+A pair is stored once under (team_low, team_high) = (min id, max id) with
+wins per side, maps played, the last meeting and the ids of the last
+RECENT_SIZE meetings (newest first). Ingestion refreshes only the pairs of
+the historical_matches rows it inserted or changed, each from that pair's
+own index range, so the row stays exact even when matches arrive out of
+order or are corrected. Reading H2H is a primary-key lookup, joined to
+historical_matches only for the recent meetings.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import psycopg2.extras
+
+RECENT_SIZE = 10
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS team_pair_stats (
+        team_low INTEGER NOT NULL,
+        team_high INTEGER NOT NULL,
+        matches INTEGER NOT NULL DEFAULT 0,
+        low_wins INTEGER NOT NULL DEFAULT 0,
+        high_wins INTEGER NOT NULL DEFAULT 0,
+        maps_played INTEGER NOT NULL DEFAULT 0,
+        last_match_id INTEGER,
+        last_played_at TIMESTAMP WITH TIME ZONE,
+        recent_match_ids INTEGER[] NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        PRIMARY KEY (team_low, team_high),
+        CHECK (team_low < team_high)
+    );
+"""
+
+_AGGREGATES = f"""
+           COUNT(*),
+           COUNT(*) FILTER (WHERE h.winner_id = {{low}}),
+           COUNT(*) FILTER (WHERE h.winner_id = {{high}}),
+           COALESCE(SUM(COALESCE(h.team1_score, 0) + COALESCE(h.team2_score, 0)), 0),
+           (array_agg(h.id ORDER BY h.played_at DESC, h.id DESC))[1],
+           MAX(h.played_at),
+           (array_agg(h.id ORDER BY h.played_at DESC, h.id DESC))[1:{RECENT_SIZE}],
+           NOW()
+"""
+
+_UPSERT = """
+    ON CONFLICT (team_low, team_high) DO UPDATE SET
+        matches = EXCLUDED.matches,
+        low_wins = EXCLUDED.low_wins,
+        high_wins = EXCLUDED.high_wins,
+        maps_played = EXCLUDED.maps_played,
+        last_match_id = EXCLUDED.last_match_id,
+        last_played_at = EXCLUDED.last_played_at,
+        recent_match_ids = EXCLUDED.recent_match_ids,
+        updated_at = EXCLUDED.updated_at
+"""
+
+_COLUMNS = """
+    INSERT INTO team_pair_stats
+        (team_low, team_high, matches, low_wins, high_wins, maps_played,
+         last_match_id, last_played_at, recent_match_ids, updated_at)
+"""
+
+# Same visibility as the H2H queries it replaces: played before now
+REFRESH_SQL = _COLUMNS + """
+    SELECT p.low, p.high,""" + _AGGREGATES.format(low='p.low', high='p.high') + """
+    FROM (VALUES %s) AS p(low, high)
+    JOIN historical_matches h
+      ON (h.team1_id = p.low AND h.team2_id = p.high)
+      OR (h.team1_id = p.high AND h.team2_id = p.low)
+    WHERE h.played_at < NOW()
+    GROUP BY p.low, p.high
+""" + _UPSERT
+
+REBUILD_SQL = _COLUMNS + """
+    SELECT LEAST(h.team1_id, h.team2_id), GREATEST(h.team1_id, h.team2_id),""" + _AGGREGATES.format(
+    low='LEAST(h.team1_id, h.team2_id)', high='GREATEST(h.team1_id, h.team2_id)') + """
+    FROM historical_matches h
+    WHERE h.played_at < NOW() AND h.team1_id <> h.team2_id
+    GROUP BY 1, 2
+""" + _UPSERT
+
+H2H_SQL = """
+    SELECT s.matches, s.low_wins, s.high_wins, s.maps_played, s.last_match_id, s.last_played_at,
+           h.id, h.winner_id, h.team1_id, h.team2_id, h.team1_score, h.team2_score,
+           h.played_at, h.map_name, h.event_name
+    FROM team_pair_stats s
+    LEFT JOIN LATERAL unnest(s.recent_match_ids[1:%(limit)s]) WITH ORDINALITY AS r(match_id, ord) ON TRUE
+    LEFT JOIN historical_matches h ON h.id = r.match_id
+    WHERE s.team_low = %(low)s AND s.team_high = %(high)s
+    ORDER BY r.ord
+"""
+
+
+def pair_key(team1_id: int, team2_id: int) -> Tuple[int, int]:
+    return (team1_id, team2_id) if team1_id < team2_id else (team2_id, team1_id)
+
+
+def refresh_pairs(cur, pairs: Iterable[Tuple[int, int]]) -> int:
+    """Recomputes the given pairs (any orientation); returns how many."""
+    keys = sorted({pair_key(a, b) for a, b in pairs if a is not None and b is not None and a != b})
+    if keys:
+        psycopg2.extras.execute_values(cur, REFRESH_SQL, keys)
+    return len(keys)
+
+
+def rebuild(cur) -> None:
+    """Recomputes every pair, e.g. after loading historical_matches with plain COPY."""
+    cur.execute(REBUILD_SQL)
+
+
+def fetch_pair(cur, team1_id: int, team2_id: int, limit: int = 5) -> Tuple[Optional[Dict], List[Dict]]:
+    """(all-time summary from team1's side or None, last `limit` meetings newest first).
+
+    Expects a RealDictCursor; `limit` is at most RECENT_SIZE.
+    """
+    cur.execute(H2H_SQL, h2h_params(team1_id, team2_id, limit))
+    return pair_from_rows(cur.fetchall(), team1_id, team2_id)
+
+
+def h2h_params(team1_id: int, team2_id: int, limit: int) -> Dict:
+    low, high = pair_key(team1_id, team2_id)
+    return {'low': low, 'high': high, 'limit': min(limit, RECENT_SIZE)}
+
+
+def pair_from_rows(rows: List[Dict], team1_id: int, team2_id: int) -> Tuple[Optional[Dict], List[Dict]]:
+    """fetch_pair's result from H2H_SQL rows (shared with the asyncpg reads)."""
+    if not rows:
+        return None, []
+    first = rows[0]
+    team1_is_low = team1_id == pair_key(team1_id, team2_id)[0]
+    summary = {
+        'matches': first['matches'],
+        'team1_wins': first['low_wins'] if team1_is_low else first['high_wins'],
+        'team2_wins': first['high_wins'] if team1_is_low else first['low_wins'],
+        'maps_played': first['maps_played'],
+        'last_match_id': first['last_match_id'],
+        'last_played_at': first['last_played_at'],
+    }
+    return summary, [row for row in rows if row['id'] is not None]
@@ -0,0 +1,233 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import requests
+
+from . import metrics, quota, tracing
+from .resilience import CircuitBreaker, Deadline, hedged, parse_retry_after, retry_delay
+
+# Overridable for the local fault-injecting stub (scripts/pandascore_stub.py)
+BASE_URL = os.getenv('PANDASCORE_BASE_URL', 'https://api.pandascore.co')
+
+DEFAULT_TIMEOUT = float(os.getenv('PANDASCORE_TIMEOUT', '10'))
+DEFAULT_RETRIES = int(os.getenv('PANDASCORE_RETRIES', '3'))
+# Unset: no hedging. Otherwise seconds before a duplicate request is sent
+HEDGE_AFTER = float(os.getenv('PANDASCORE_HEDGE_AFTER')) if os.getenv('PANDASCORE_HEDGE_AFTER') else None
+BREAKER_THRESHOLD = int(os.getenv('PANDASCORE_BREAKER_THRESHOLD', '5'))
+BREAKER_RESET = float(os.getenv('PANDASCORE_BREAKER_RESET', '30'))
+LAST_VALUES_SIZE = 1024
+
+_ID_SEGMENT = re.compile(r'/\d+')
+
+# One keep-alive session per process; warm instances and the self-hosted
+# server reuse TCP/TLS connections instead of reconnecting per call
+_session = requests.Session()
+
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` calls per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PandaScoreError(Exception):
+    """PandaScore answered with an error, or could not be reached and no
+    earlier value was available."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+# Per process: one breaker per endpoint, and the last good body per request
+_breakers: Dict[str, CircuitBreaker] = {}
+_last_values: 'OrderedDict[tuple, object]' = OrderedDict()
+_state_lock = threading.Lock()
+
+
+def circuit_breaker(endpoint: str) -> CircuitBreaker:
+    with _state_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(
+                BREAKER_THRESHOLD, BREAKER_RESET, on_open=lambda: metrics.PANDASCORE_CIRCUIT_OPEN.inc(endpoint))
+        return breaker
+
+
+def _remember(key: tuple, value) -> None:
+    with _state_lock:
+        _last_values[key] = value
+        _last_values.move_to_end(key)
+        while len(_last_values) > LAST_VALUES_SIZE:
+            _last_values.popitem(last=False)
+
+
+def _last_value(key: tuple):
+    with _state_lock:
+        value = _last_values.get(key)
+    metrics.cache_lookup('pandascore_last_value', value is not None)
+    return value
+
+
+class PandaScoreClient:
+    """Thin wrapper around the PandaScore REST API.
+
+    All outgoing calls go through `get` so they can be timed and counted in
+    one place; `get_json` adds retries, the circuit breaker, the last-value
+    fallback and optional hedging on top of it. `priority` is the quota
+    class the calls are scheduled under (see quota.py).
+    """
+
+    def __init__(self, api_key: str, rate_limiter: Optional[RateLimiter] = None,
+                 priority: str = quota.BACKFILL):
+        if priority not in quota.PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+
+    @staticmethod
+    def endpoint_name(path: str) -> str:
+        # /csgo/matches/123/stats -> csgo.matches.id.stats
+        return _ID_SEGMENT.sub('/id', path).strip('/').replace('/', '.')
+
+    def get(self, path: str, params: Optional[Dict] = None, timeout: Optional[float] = None,
+            max_wait: Optional[float] = None) -> requests.Response:
+        """GET `path` (relative to BASE_URL) and return the raw response.
+
+        Waits for the quota scheduler first; raises quota.QuotaDeferred when
+        no budget is left for this client's priority within `max_wait`.
+        """
+        endpoint = self.endpoint_name(path)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        quota.SCHEDULER.acquire(self.priority, max_wait)
+        response = None
+        try:
+            response = self._send(endpoint, path, params, timeout)
+            return response
+        finally:
+            quota.SCHEDULER.release(response)
+
+    def _send(self, endpoint: str, path: str, params: Optional[Dict], timeout: Optional[float]) -> requests.Response:
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            with tracing.span('pandascore.' + endpoint):
+                response = _session.get(
+                    BASE_URL + path,
+                    headers={'Authorization': f'Bearer {self.api_key}'},
+                    params=params,
+                    timeout=timeout or DEFAULT_TIMEOUT
+                )
+            status = response.status_code
+            if status == 429:
+                metrics.PANDASCORE_RATE_LIMITED.inc(endpoint)
+            return response
+        finally:
+            metrics.PANDASCORE_REQUESTS.inc(endpoint, status)
+            metrics.PANDASCORE_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint)
+
+    def get_json(self, path: str, params: Optional[Dict] = None, deadline: Optional[Deadline] = None,
+                 timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 hedge_after: Optional[float] = HEDGE_AFTER, stale_ok: bool = True):
+        """GET `path` and return the decoded JSON body.
+
+        Timeouts, connection errors, 429 and 5xx are retried with jittered
+        backoff (honouring Retry-After) within `deadline`. Other 4xx raise
+        PandaScoreError at once. When PandaScore stays unreachable, or the
+        endpoint's circuit is open, the last body seen for the same request
+        is returned if `stale_ok`; otherwise PandaScoreError is raised. The
+        same fallback applies when the quota scheduler defers the call
+        (otherwise quota.QuotaDeferred is raised).
+        """
+        endpoint = self.endpoint_name(path)
+        key = (path, tuple(sorted((params or {}).items())))
+        breaker = circuit_breaker(endpoint)
+        error: Exception = PandaScoreError(f"{endpoint}: circuit open")
+
+        for attempt in range(retries + 1):
+            # Before allow(): an attempt that never runs must not take the half-open trial
+            budget = deadline.cap(timeout) if deadline is not None else timeout
+            max_wait = deadline.remaining() if deadline is not None else None
+            if budget <= 0:
+                error = PandaScoreError(f"{endpoint}: deadline exceeded")
+                break
+            if not breaker.allow():
+                break
+
+            retry_after = None
+            try:
+                try:
+                    if hedge_after is not None:
+                        response, winner = hedged(
+                            lambda t: self.get(path, params, timeout=t, max_wait=max_wait), budget, hedge_after)
+                        if winner is not None:
+                            metrics.PANDASCORE_HEDGES.inc(endpoint, winner)
+                    else:
+                        response = self.get(path, params, timeout=budget, max_wait=max_wait)
+                except quota.QuotaDeferred as e:
+                    # Not PandaScore's fault: no retry, no breaker (a half-open
+                    # trial is handed back in finally), last value if any
+                    error = e
+                    break
+                except requests.RequestException as e:
+                    breaker.record_failure()
+                    error = PandaScoreError(f"{endpoint}: {type(e).__name__}: {e}")
+                else:
+                    status = response.status_code
+                    if status < 400:
+                        breaker.record_success()
+                        body = response.json()
+                        _remember(key, body)
+                        return body
+                    error = PandaScoreError(f"{endpoint}: HTTP {status}: {response.text[:200]}", status)
+                    if status == 429:
+                        # Quota, not an outage: back off without tripping the breaker
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    elif status >= 500:
+                        breaker.record_failure()
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    else:
+                        breaker.record_success()
+                        raise error
+            finally:
+                # Exits that recorded no result (429, deferral, unexpected
+                # errors) hand the half-open trial back
+                breaker.release_trial()
+
+            if attempt == retries:
+                break
+            delay = retry_delay(attempt, retry_after)
+            if deadline is not None and delay >= deadline.remaining():
+                error = PandaScoreError(f"{endpoint}: deadline exceeded", getattr(error, 'status', None))
+                break
+            metrics.PANDASCORE_RETRIES.inc(endpoint)
+            time.sleep(delay)
+
+        last = _last_value(key) if stale_ok else None
+        if last is None:
+            raise error
+        metrics.PANDASCORE_STALE_SERVED.inc(endpoint)
+        return last
@@ -0,0 +1,137 @@
+"""Projection and archival of raw PandaScore payloads.
+
+Rows in `matches` / `historical_matches` keep only the projected fields in
+`raw_data`; the full payload is stored once per content hash, zlib
+compressed, in `raw_payload_archive` and is only read on demand.
+
+Configuration:
+    RAW_PAYLOAD_PROJECTION=slim|full   (default slim; full keeps everything inline)
+    RAW_PAYLOAD_EXTRA_FIELDS=a.b,c[].d (extra dotted paths to keep inline)
+"""
+import hashlib
+import json
+import os
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+MATCH_FIELDS = (
+    'id', 'name', 'status', 'match_type', 'number_of_games',
+    'scheduled_at', 'begin_at', 'end_at', 'modified_at', 'winner_id',
+    'league.id', 'league.name',
+    'serie.id', 'serie.full_name',
+    'tournament.id', 'tournament.name',
+    'opponents[].opponent.id', 'opponents[].opponent.name',
+    'opponents[].opponent.acronym', 'opponents[].opponent.image_url',
+    'results[].team_id', 'results[].score',
+    'games[].id', 'games[].position', 'games[].status', 'games[].winner.id',
+    'games[].map.name',
+)
+
+# match_statistics.event_data: keep the per-snapshot state only; team
+# identities live on the matches row and id/timestamp are table columns
+LIVE_EVENT_FIELDS = (
+    'status', 'current_score.team1', 'current_score.team2',
+    'current_round', 'map', 'player_stats',
+)
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS raw_payload_archive (
+        content_hash CHAR(64) PRIMARY KEY,
+        resource VARCHAR(50) NOT NULL,
+        payload BYTEA NOT NULL,
+        raw_size INTEGER NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+"""
+
+
+def compile_projection(paths: Iterable[str]) -> Dict:
+    """Turns dotted paths ('a[].b.c') into a nested spec; True marks a kept leaf."""
+    spec: Dict = {}
+    for path in paths:
+        node = spec
+        parts = path.split('.')
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                node[part] = True
+            else:
+                child = node.get(part)
+                if not isinstance(child, dict):
+                    child = node[part] = {}
+                node = child
+    return spec
+
+
+def _apply(spec: Dict, value):
+    if not isinstance(value, dict):
+        return value
+    out = {}
+    for key, sub in spec.items():
+        is_list = key.endswith('[]')
+        name = key[:-2] if is_list else key
+        if name not in value:
+            continue
+        item = value[name]
+        if sub is True:
+            out[name] = item
+        elif is_list and isinstance(item, list):
+            out[name] = [_apply(sub, element) for element in item]
+        elif item is None:
+            out[name] = None
+        else:
+            out[name] = _apply(sub, item)
+    return out
+
+
+def _extra_fields():
+    raw = os.getenv('RAW_PAYLOAD_EXTRA_FIELDS', '')
+    return tuple(p.strip() for p in raw.split(',') if p.strip())
+
+
+FULL = os.getenv('RAW_PAYLOAD_PROJECTION', 'slim').lower() == 'full'
+MATCH_PROJECTION = compile_projection(MATCH_FIELDS + _extra_fields())
+LIVE_EVENT_PROJECTION = compile_projection(LIVE_EVENT_FIELDS)
+
+
+def project_match(match: Dict) -> Dict:
+    """Keeps only the match fields we read back from raw_data."""
+    return match if FULL else _apply(MATCH_PROJECTION, match)
+
+
+def project_live_event(match_data: Dict) -> Dict:
+    return match_data if FULL else _apply(LIVE_EVENT_PROJECTION, match_data)
+
+
+def _canonical(payload) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+
+def content_hash(payload) -> str:
+    return hashlib.sha256(_canonical(payload)).hexdigest()
+
+
+def pack(resource: str, payload) -> Tuple[str, str, bytes, int]:
+    """Returns a raw_payload_archive row (hash, resource, compressed, raw size)."""
+    canonical = _canonical(payload)
+    return hashlib.sha256(canonical).hexdigest(), resource, zlib.compress(canonical, 6), len(canonical)
+
+
+def archive_payload(cur, resource: str, payload: Dict) -> str:
+    """Stores the full payload once per content hash and returns the hash."""
+    row = pack(resource, payload)
+    cur.execute("""
+        INSERT INTO raw_payload_archive (content_hash, resource, payload, raw_size)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (content_hash) DO NOTHING
+    """, row)
+    return row[0]
+
+
+def load_archived(cur, digest: str) -> Optional[Dict]:
+    """Reads a full payload back from the archive."""
+    cur.execute("SELECT payload FROM raw_payload_archive WHERE content_hash = %s", (digest,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    payload = row['payload'] if isinstance(row, dict) else row[0]
+    return json.loads(zlib.decompress(bytes(payload)))
@@ -0,0 +1,173 @@
+"""Per-player stats as a typed time series (player_match_stats).
+
+Every live snapshot whose state changed writes one row per player keyed by
+(player_id, match_id, snapshot_at); the backfill writes one row per player
+for finished matches. The latest row of a (player, match) is that player's
+line for the match, which is what the aggregates are computed over.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import psycopg2.extras
+
+from .db import connect_read
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS player_match_stats (
+        player_id INTEGER NOT NULL,
+        match_id INTEGER NOT NULL,
+        snapshot_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        player_name VARCHAR(255),
+        team_id INTEGER,
+        map_name VARCHAR(50),
+        kills INTEGER,
+        deaths INTEGER,
+        assists INTEGER,
+        headshots INTEGER,
+        adr NUMERIC(7,2),
+        kast NUMERIC(5,2),
+        rating NUMERIC(5,2),
+        PRIMARY KEY (player_id, match_id, snapshot_at)
+    );
+    CREATE INDEX IF NOT EXISTS idx_player_match_stats_recent
+        ON player_match_stats (player_id, snapshot_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_player_match_stats_match
+        ON player_match_stats (match_id, snapshot_at);
+"""
+
+STAT_COLUMNS = ('kills', 'deaths', 'assists', 'headshots', 'adr', 'kast', 'rating')
+
+COLUMNS = ('player_id', 'match_id', 'snapshot_at', 'player_name', 'team_id', 'map_name') + STAT_COLUMNS
+
+# Where each stat may sit in a PandaScore `players` entry; the first
+# path that holds a number wins
+STAT_PATHS = {
+    'kills': ('kills', 'counts.kills', 'stats.kills'),
+    'deaths': ('deaths', 'counts.deaths', 'stats.deaths'),
+    'assists': ('assists', 'counts.assists', 'stats.assists'),
+    'headshots': ('headshots', 'counts.headshots', 'stats.headshots'),
+    'adr': ('adr', 'averages.adr', 'stats.adr', 'average_damage_per_round'),
+    'kast': ('kast', 'averages.kast', 'stats.kast'),
+    'rating': ('rating', 'averages.rating', 'averages.hltv_game_rating', 'stats.rating', 'hltv_rating'),
+}
+
+INSERT_SQL = f"""
+    INSERT INTO player_match_stats ({', '.join(COLUMNS)})
+    VALUES %s
+    ON CONFLICT (player_id, match_id, snapshot_at) DO NOTHING
+"""
+
+# Latest row per match of the player, newest matches first
+PLAYER_MATCHES_SQL = f"""
+    WITH per_match AS (
+        SELECT DISTINCT ON (match_id)
+            match_id, snapshot_at, player_name, team_id, map_name, {', '.join(STAT_COLUMNS)}
+        FROM player_match_stats
+        WHERE player_id = %(player_id)s
+          AND (%(since)s::timestamptz IS NULL OR snapshot_at >= %(since)s::timestamptz)
+        ORDER BY match_id, snapshot_at DESC
+    )
+    SELECT * FROM per_match
+    ORDER BY snapshot_at DESC
+    LIMIT %(last)s
+"""
+
+PLAYER_AGGREGATES_SQL = f"""
+    WITH recent AS ({PLAYER_MATCHES_SQL})
+    SELECT
+        COUNT(*) AS matches,
+        MIN(snapshot_at) AS first_match_at,
+        MAX(snapshot_at) AS last_match_at,
+        SUM(kills) AS kills,
+        SUM(deaths) AS deaths,
+        SUM(assists) AS assists,
+        ROUND(AVG(kills), 2) AS avg_kills,
+        ROUND(AVG(deaths), 2) AS avg_deaths,
+        ROUND(AVG(assists), 2) AS avg_assists,
+        ROUND(SUM(headshots)::numeric / NULLIF(SUM(kills), 0) * 100, 2) AS headshot_pct,
+        ROUND(SUM(kills)::numeric / NULLIF(SUM(deaths), 0), 2) AS kd_ratio,
+        ROUND(AVG(adr), 2) AS avg_adr,
+        ROUND(AVG(kast), 2) AS avg_kast,
+        ROUND(AVG(rating), 2) AS avg_rating
+    FROM recent
+"""
+
+
+def _lookup(entry: Dict, path: str):
+    value = entry
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _number(entry: Dict, paths: Tuple[str, ...]):
+    for path in paths:
+        value = _lookup(entry, path)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def player_rows(match_id: int, snapshot_at, players: Iterable[Dict], map_name: Optional[str] = None) -> List[Tuple]:
+    """player_match_stats rows for one snapshot; entries without a player id are skipped."""
+    rows = []
+    for entry in players or ():
+        if not isinstance(entry, dict):
+            continue
+        player = entry.get('player') if isinstance(entry.get('player'), dict) else entry
+        player_id = player.get('id') if player is not entry else entry.get('player_id', entry.get('id'))
+        if not isinstance(player_id, int):
+            continue
+        team = entry.get('team') if isinstance(entry.get('team'), dict) else {}
+        rows.append((
+            player_id,
+            match_id,
+            snapshot_at,
+            player.get('name'),
+            team.get('id', entry.get('team_id')),
+            map_name,
+        ) + tuple(_number(entry, STAT_PATHS[column]) for column in STAT_COLUMNS))
+    return rows
+
+
+def save_player_stats(cur, match_id: int, snapshot_at, players: Iterable[Dict],
+                      map_name: Optional[str] = None) -> int:
+    """Appends one snapshot of the match's player lines; returns rows written."""
+    rows = player_rows(match_id, snapshot_at, players, map_name)
+    if rows:
+        psycopg2.extras.execute_values(cur, INSERT_SQL, rows)
+    return len(rows)
+
+
+def _jsonable(row: Dict) -> Dict:
+    out = {}
+    for key, value in row.items():
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif value is not None and not isinstance(value, (int, str)):
+            value = float(value)
+        out[key] = value
+    return out
+
+
+class PlayerStatsService:
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+
+    def _get_db_connection(self):
+        return connect_read(self.database_url)
+
+    def get_player_matches(self, player_id: int, last: int = 20, since=None) -> List[Dict]:
+        """The player's line (latest snapshot) for each of the last N matches."""
+        with self._get_db_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(PLAYER_MATCHES_SQL, {'player_id': player_id, 'last': last, 'since': since})
+                return [_jsonable(row) for row in cur.fetchall()]
+
+    def get_player_aggregates(self, player_id: int, last: int = 20, since=None) -> Dict:
+        """Totals and averages (K/D, ADR, KAST, rating, HS%) over the last N matches."""
+        with self._get_db_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(PLAYER_AGGREGATES_SQL, {'player_id': player_id, 'last': last, 'since': since})
+                return _jsonable(cur.fetchone())
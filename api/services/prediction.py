@@ -1,7 +1,190 @@
+import asyncio
+import json
 import math
+import os
 import psycopg2
 import psycopg2.extras
-from typing import Dict
+from typing import Dict, Optional
+
+from . import metrics, pair_stats, team_form
+from .db import connect, connect_read, fetch_async
+
+
+MODEL_NAME = 'heuristic_v1'
+
+# Look-back windows of the features (matches)
+FORM_WINDOW = 5
+H2H_WINDOW = 5
+
+# Coefficients and windows of heuristic_v1; tuned versions are stored in
+# prediction_models (scripts/tune_model.py) and selected by name
+DEFAULT_PARAMS = {
+    'base_score': 13.0,
+    'win_rate_scale': 20.0,
+    'form_weight': 0.8,
+    'diff_weight': 0.15,
+    'h2h_weight': 0.5,
+    'slope': 0.4,
+    'form_window': FORM_WINDOW,
+    'h2h_window': H2H_WINDOW,
+}
+
+MODELS_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS prediction_models (
+        name VARCHAR(50) PRIMARY KEY,
+        params JSONB NOT NULL,
+        metrics JSONB,
+        search JSONB,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+"""
+
+MODEL_PARAMS_SQL = "SELECT params FROM prediction_models WHERE name = %(name)s"
+
+TEAM_STATS_SQL = """
+    SELECT ts.total_matches, ts.wins, ts.losses, ts.rounds_won, ts.rounds_lost, ts.win_rate, ts.avg_rounds_won
+    FROM team_stats ts
+    WHERE ts.team_id = %(team_id)s
+"""
+
+RECENT_FORM_SQL = """
+    SELECT winner_id = %(team_id)s AS won,
+           CASE WHEN team1_id = %(team_id)s THEN team1_score ELSE team2_score END AS team_score,
+           CASE WHEN team1_id = %(team_id)s THEN team2_score ELSE team1_score END AS opp_score
+    FROM historical_matches
+    WHERE (team1_id = %(team_id)s OR team2_id = %(team_id)s) AND played_at < NOW()
+    ORDER BY played_at DESC
+    LIMIT %(limit)s
+"""
+
+H2H_MATCHES_SQL = """
+    SELECT winner_id, team1_id, team1_score, team2_score
+    FROM historical_matches
+    WHERE ((team1_id = %(team1_id)s AND team2_id = %(team2_id)s)
+        OR (team1_id = %(team2_id)s AND team2_id = %(team1_id)s))
+      AND played_at < NOW()
+    ORDER BY played_at DESC
+    LIMIT %(limit)s
+"""
+
+# name -> params of stored models; records are immutable once written
+_model_cache: Dict[str, Dict] = {}
+
+
+def _cached_params(name: str) -> Optional[Dict]:
+    if name == MODEL_NAME:
+        return DEFAULT_PARAMS
+    params = _model_cache.get(name)
+    metrics.cache_lookup('prediction_model', params is not None)
+    return params
+
+
+def _params_from_row(name: str, row) -> Dict:
+    if row is None:
+        raise ValueError(f"Unknown prediction model '{name}'")
+    stored = row['params'] if isinstance(row, dict) else row[0]
+    params = _model_cache[name] = dict(DEFAULT_PARAMS, **stored)
+    return params
+
+
+def load_model_params(cur, name: str) -> Dict:
+    """Params of a model version; heuristic_v1 is built in."""
+    params = _cached_params(name)
+    if params is None:
+        cur.execute(MODEL_PARAMS_SQL, {'name': name})
+        params = _params_from_row(name, cur.fetchone())
+    return params
+
+
+def next_model_name(cur, prefix: str = 'heuristic_v') -> str:
+    """The next free version name (heuristic_v2, heuristic_v3, ...)."""
+    cur.execute("""
+        SELECT COALESCE(MAX(substring(name FROM '\\d+$')::int), 1) AS latest
+        FROM prediction_models WHERE name ~ %s
+    """, (f'^{prefix}\\d+$',))
+    row = cur.fetchone()
+    latest = row['latest'] if isinstance(row, dict) else row[0]
+    return f"{prefix}{latest + 1}"
+
+
+def save_model(cur, name: str, params: Dict, metrics: Dict, search: Optional[Dict] = None) -> None:
+    """Writes a new model version; existing versions are never overwritten."""
+    cur.execute("""
+        INSERT INTO prediction_models (name, params, metrics, search)
+        VALUES (%s, %s, %s, %s)
+    """, (name, json.dumps(params), json.dumps(metrics), json.dumps(search) if search else None))
+
+
+def heuristic_prediction(t1_win_rate: float, t2_win_rate: float,
+                         t1_recent_wins: int, t2_recent_wins: int,
+                         t1_recent_avg_diff: float, t2_recent_avg_diff: float,
+                         h2h_team1_wins: int, h2h_team2_wins: int,
+                         data_points: int, params: Dict = DEFAULT_PARAMS) -> Dict:
+    """The model itself: features -> predicted score, win probability, confidence.
+
+    Pure so that the backtest (api/services/backtest.py) scores exactly what
+    predict_match serves.
+    """
+    base, scale = params['base_score'], params['win_rate_scale']
+    form, diff, h2h = params['form_weight'], params['diff_weight'], params['h2h_weight']
+
+    # Base score (out of 16) starts from 13 (typical CS:GO round targets) and is adjusted
+    base_team1 = base + (t1_win_rate - 50.0) / scale + (t1_recent_wins - t2_recent_wins) * form + (t1_recent_avg_diff - t2_recent_avg_diff) * diff + (h2h_team1_wins - h2h_team2_wins) * h2h
+    base_team2 = base + (t2_win_rate - 50.0) / scale + (t2_recent_wins - t1_recent_wins) * form + (t2_recent_avg_diff - t1_recent_avg_diff) * diff + (h2h_team2_wins - h2h_team1_wins) * h2h
+
+    # Normalize to 0-16 realistic scores and round
+    team1_score = max(0, min(16, round(base_team1)))
+    team2_score = max(0, min(16, round(base_team2)))
+
+    # If tie, add small perturbation based on recent form difference
+    if team1_score == team2_score:
+        if (t1_recent_wins - t2_recent_wins) > 0:
+            team1_score = min(16, team1_score + 1)
+        elif (t2_recent_wins - t1_recent_wins) > 0:
+            team2_score = min(16, team2_score + 1)
+
+    score_diff = team1_score - team2_score
+
+    # Win probability via logistic on score_diff
+    prob_team1 = 1.0 / (1.0 + math.exp(-params['slope'] * score_diff))
+    prob_team1_pct = round(prob_team1 * 100, 2)
+    prob_team2_pct = round(100 - prob_team1_pct, 2)
+
+    # Confidence: depends on amount of historical data and magnitude of score diff
+    data_factor = min(1.0, data_points / 15.0)
+    diff_factor = min(1.0, abs(score_diff) / 8.0)
+    confidence = round( (0.4 * data_factor + 0.6 * diff_factor) * 100, 2 )
+
+    return {
+        'predicted_score': {'team1': int(team1_score), 'team2': int(team2_score)},
+        'win_probability': {'team1': prob_team1_pct, 'team2': prob_team2_pct},
+        'confidence': confidence
+    }
+
+
+def _predict(params: Dict, team1_id: int, team2_id: int, t1, t2, recent1, recent2, h2h) -> Dict:
+    """predict_match's result from its fetched rows (shared with the asyncpg reads)."""
+    # Fallback defaults
+    t1_win_rate = float(t1['win_rate']) if t1 and t1.get('win_rate') is not None else 50.0
+    t2_win_rate = float(t2['win_rate']) if t2 and t2.get('win_rate') is not None else 50.0
+
+    t1_recent_wins = sum(1 for r in recent1 if r.get('won')) if recent1 else 0
+    t2_recent_wins = sum(1 for r in recent2 if r.get('won')) if recent2 else 0
+
+    t1_recent_avg_diff = (sum((r['team_score'] - r['opp_score']) for r in recent1) / len(recent1)) if recent1 else 0
+    t2_recent_avg_diff = (sum((r['team_score'] - r['opp_score']) for r in recent2) / len(recent2)) if recent2 else 0
+
+    h2h_team1_wins = sum(1 for m in h2h if m['winner_id'] == team1_id)
+    h2h_team2_wins = sum(1 for m in h2h if m['winner_id'] == team2_id)
+
+    return heuristic_prediction(
+        t1_win_rate, t2_win_rate,
+        t1_recent_wins, t2_recent_wins,
+        t1_recent_avg_diff, t2_recent_avg_diff,
+        h2h_team1_wins, h2h_team2_wins,
+        len(recent1 or []) + len(recent2 or []) + len(h2h or []),
+        params,
+    )
 
 
 class PredictionModel:
@@ -12,42 +195,46 @@ class PredictionModel:
     serverless environment without scikit-learn/numpy/pandas.
     """
 
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, model_name: Optional[str] = None):
         self.database_url = database_url
+        # Stored as predictions.prediction_model
+        self.model_name = model_name or os.getenv('PREDICTION_MODEL', MODEL_NAME)
 
     def _get_db_connection(self):
-        return psycopg2.connect(self.database_url)
+        return connect(self.database_url)
+
+    def _get_read_connection(self):
+        return connect_read(self.database_url)
+
+    def load(self) -> Dict:
+        """Params of the selected model; ValueError if it does not exist."""
+        if self.model_name == MODEL_NAME or self.model_name in _model_cache:
+            return load_model_params(None, self.model_name)
+        with self._get_read_connection() as conn:
+            with conn.cursor() as cur:
+                return load_model_params(cur, self.model_name)
 
     def _fetch_team_stats(self, cur, team_id: int):
-        cur.execute("""
-            SELECT ts.total_matches, ts.wins, ts.losses, ts.rounds_won, ts.rounds_lost, ts.win_rate, ts.avg_rounds_won
-            FROM team_stats ts
-            WHERE ts.team_id = %s
-        """, (team_id,))
+        cur.execute(TEAM_STATS_SQL, {'team_id': team_id})
         row = cur.fetchone()
         return row if row else None
 
-    def _fetch_recent_form(self, cur, team_id: int, limit: int = 5):
-        cur.execute("""
-            SELECT winner_id = %s AS won,
-                   CASE WHEN team1_id = %s THEN team1_score ELSE team2_score END AS team_score,
-                   CASE WHEN team1_id = %s THEN team2_score ELSE team1_score END AS opp_score
-            FROM historical_matches
-            WHERE (team1_id = %s OR team2_id = %s) AND played_at < NOW()
-            ORDER BY played_at DESC
-            LIMIT %s
-        """, (team_id, team_id, team_id, team_id, team_id, limit))
+    def _fetch_recent_form(self, cur, team_id: int, limit: int = FORM_WINDOW):
+        if limit <= team_form.RECENT_SIZE:
+            form = team_form.fetch_form(cur, team_id, limit)
+            if form is not None:
+                return form['recent']
+            # No team_form row (no matches, or not rebuilt yet): read the matches
+        cur.execute(RECENT_FORM_SQL, {'team_id': team_id, 'limit': limit})
         return cur.fetchall()
 
-    def _fetch_h2h(self, cur, team1_id: int, team2_id: int, limit: int = 5):
-        cur.execute("""
-            SELECT winner_id, team1_id, team1_score, team2_score
-            FROM historical_matches
-            WHERE ((team1_id = %s AND team2_id = %s) OR (team1_id = %s AND team2_id = %s))
-              AND played_at < NOW()
-            ORDER BY played_at DESC
-            LIMIT %s
-        """, (team1_id, team2_id, team2_id, team1_id, limit))
+    def _fetch_h2h(self, cur, team1_id: int, team2_id: int, limit: int = H2H_WINDOW):
+        if limit <= pair_stats.RECENT_SIZE:
+            summary, matches = pair_stats.fetch_pair(cur, team1_id, team2_id, limit)
+            if summary is not None:
+                return matches
+            # No team_pair_stats row (never met, or not rebuilt yet): read the matches
+        cur.execute(H2H_MATCHES_SQL, {'team1_id': team1_id, 'team2_id': team2_id, 'limit': limit})
         return cur.fetchall()
 
     def predict_match(self, team1_id: int, team2_id: int) -> Dict:
@@ -55,64 +242,24 @@ class PredictionModel:
 
         Returns a dict with predicted_score, win_probability and confidence.
         """
-        with self._get_db_connection() as conn:
+        with self._get_read_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                params = load_model_params(cur, self.model_name)
+
                 t1 = self._fetch_team_stats(cur, team1_id)
                 t2 = self._fetch_team_stats(cur, team2_id)
 
-                recent1 = self._fetch_recent_form(cur, team1_id)
-                recent2 = self._fetch_recent_form(cur, team2_id)
-
-                h2h = self._fetch_h2h(cur, team1_id, team2_id)
-
-        # Fallback defaults
-        t1_win_rate = float(t1['win_rate']) if t1 and t1.get('win_rate') is not None else 50.0
-        t2_win_rate = float(t2['win_rate']) if t2 and t2.get('win_rate') is not None else 50.0
+                recent1 = self._fetch_recent_form(cur, team1_id, params['form_window'])
+                recent2 = self._fetch_recent_form(cur, team2_id, params['form_window'])
 
-        t1_recent_wins = sum(1 for r in recent1 if r.get('won')) if recent1 else 0
-        t2_recent_wins = sum(1 for r in recent2 if r.get('won')) if recent2 else 0
+                h2h = self._fetch_h2h(cur, team1_id, team2_id, params['h2h_window'])
 
-        t1_recent_avg_diff = (sum((r['team_score'] - r['opp_score']) for r in recent1) / len(recent1)) if recent1 else 0
-        t2_recent_avg_diff = (sum((r['team_score'] - r['opp_score']) for r in recent2) / len(recent2)) if recent2 else 0
+        return _predict(params, team1_id, team2_id, t1, t2, recent1, recent2, h2h)
 
-        h2h_team1_wins = sum(1 for m in h2h if m['winner_id'] == team1_id)
-        h2h_team2_wins = sum(1 for m in h2h if m['winner_id'] == team2_id)
-
-        # Base score (out of 16) starts from 13 (typical CS:GO round targets) and is adjusted
-        base_team1 = 13.0 + (t1_win_rate - 50.0) / 20.0 + (t1_recent_wins - t2_recent_wins) * 0.8 + (t1_recent_avg_diff - t2_recent_avg_diff) * 0.15 + (h2h_team1_wins - h2h_team2_wins) * 0.5
-        base_team2 = 13.0 + (t2_win_rate - 50.0) / 20.0 + (t2_recent_wins - t1_recent_wins) * 0.8 + (t2_recent_avg_diff - t1_recent_avg_diff) * 0.15 + (h2h_team2_wins - h2h_team1_wins) * 0.5
-
-        # Normalize to 0-16 realistic scores and round
-        team1_score = max(0, min(16, round(base_team1)))
-        team2_score = max(0, min(16, round(base_team2)))
-
-        # If tie, add small perturbation based on recent form difference
-        if team1_score == team2_score:
-            if (t1_recent_wins - t2_recent_wins) > 0:
-                team1_score = min(16, team1_score + 1)
-            elif (t2_recent_wins - t1_recent_wins) > 0:
-                team2_score = min(16, team2_score + 1)
-
-        score_diff = team1_score - team2_score
-
-        # Win probability via logistic on score_diff
-        prob_team1 = 1.0 / (1.0 + math.exp(-0.4 * score_diff))
-        prob_team1_pct = round(prob_team1 * 100, 2)
-        prob_team2_pct = round(100 - prob_team1_pct, 2)
-
-        # Confidence: depends on amount of historical data and magnitude of score diff
-        data_factor = min(1.0, ( (len(recent1 or []) + len(recent2 or []) + len(h2h or [])) / 15.0 ))
-        diff_factor = min(1.0, abs(score_diff) / 8.0)
-        confidence = round( (0.4 * data_factor + 0.6 * diff_factor) * 100, 2 )
-
-        return {
-            'predicted_score': {'team1': int(team1_score), 'team2': int(team2_score)},
-            'win_probability': {'team1': prob_team1_pct, 'team2': prob_team2_pct},
-            'confidence': confidence
-        }
-
-    def store_prediction(self, match_id: int, team1_id: int, team2_id: int) -> None:
-        prediction = self.predict_match(team1_id, team2_id)
+    def store_prediction(self, match_id: int, team1_id: int, team2_id: int, prediction: Optional[Dict] = None) -> None:
+        """Upserts the prediction for a match; pass `prediction` to reuse one already computed."""
+        if prediction is None:
+            prediction = self.predict_match(team1_id, team2_id)
         predicted_winner = team1_id if prediction['win_probability']['team1'] > prediction['win_probability']['team2'] else team2_id
         with self._get_db_connection() as conn:
             with conn.cursor() as cur:
@@ -127,11 +274,69 @@ class PredictionModel:
                         predicted_team2_score = EXCLUDED.predicted_team2_score,
                         prediction_model = EXCLUDED.prediction_model,
                         created_at = NOW()
+                    WHERE (predictions.predicted_winner_id, predictions.confidence_score,
+                           predictions.predicted_team1_score, predictions.predicted_team2_score,
+                           predictions.prediction_model)
+                        IS DISTINCT FROM
+                          (EXCLUDED.predicted_winner_id, EXCLUDED.confidence_score,
+                           EXCLUDED.predicted_team1_score, EXCLUDED.predicted_team2_score,
+                           EXCLUDED.prediction_model)
                 """, (
                     match_id,
                     predicted_winner,
                     prediction['confidence'],
                     prediction['predicted_score']['team1'],
                     prediction['predicted_score']['team2'],
-                    'heuristic_v1'
-                ))
\ No newline at end of file
+                    self.model_name
+                ))
+
+class AsyncPredictionModel:
+    """PredictionModel.predict_match over an asyncpg pool, for the self-hosted
+    server; storing predictions stays on PredictionModel."""
+
+    def __init__(self, pool, model_name: Optional[str] = None):
+        self.pool = pool
+        self.model_name = model_name or os.getenv('PREDICTION_MODEL', MODEL_NAME)
+
+    async def load(self) -> Dict:
+        """Params of the selected model; ValueError if it does not exist."""
+        params = _cached_params(self.model_name)
+        if params is None:
+            rows = await fetch_async(self.pool, 'load_model_params', MODEL_PARAMS_SQL, {'name': self.model_name})
+            params = _params_from_row(self.model_name, rows[0] if rows else None)
+        return params
+
+    async def _fetch_team_stats(self, team_id: int):
+        rows = await fetch_async(self.pool, '_fetch_team_stats', TEAM_STATS_SQL, {'team_id': team_id})
+        return rows[0] if rows else None
+
+    async def _fetch_recent_form(self, team_id: int, limit: int):
+        if limit <= team_form.RECENT_SIZE:
+            rows = await fetch_async(self.pool, 'fetch_form', team_form.FETCH_SQL, {'team_id': team_id})
+            form = team_form.form_from_row(rows[0] if rows else None, limit)
+            if form is not None:
+                return form['recent']
+        return await fetch_async(self.pool, '_fetch_recent_form', RECENT_FORM_SQL,
+                                 {'team_id': team_id, 'limit': limit})
+
+    async def _fetch_h2h(self, team1_id: int, team2_id: int, limit: int):
+        if limit <= pair_stats.RECENT_SIZE:
+            summary, matches = pair_stats.pair_from_rows(
+                await fetch_async(self.pool, 'fetch_pair', pair_stats.H2H_SQL,
+                                  pair_stats.h2h_params(team1_id, team2_id, limit)),
+                team1_id, team2_id)
+            if summary is not None:
+                return matches
+        return await fetch_async(self.pool, '_fetch_h2h', H2H_MATCHES_SQL,
+                                 {'team1_id': team1_id, 'team2_id': team2_id, 'limit': limit})
+
+    async def predict_match(self, team1_id: int, team2_id: int) -> Dict:
+        params = await self.load()
+        t1, t2, recent1, recent2, h2h = await asyncio.gather(
+            self._fetch_team_stats(team1_id),
+            self._fetch_team_stats(team2_id),
+            self._fetch_recent_form(team1_id, params['form_window']),
+            self._fetch_recent_form(team2_id, params['form_window']),
+            self._fetch_h2h(team1_id, team2_id, params['h2h_window']),
+        )
+        return _predict(params, team1_id, team2_id, t1, t2, recent1, recent2, h2h)
@@ -0,0 +1,175 @@
+"""Priority scheduling of PandaScore calls against the shared API quota.
+
+Every PandaScoreClient.get passes through the process-wide SCHEDULER with
+the client's priority class (live > upcoming > team_stats > backfill).
+The remaining quota is read from the X-Rate-Limit-Remaining /
+X-Rate-Limit-Limit headers of each response; since they describe the
+whole account, a process learns about calls made by the other pollers
+with its next response.
+
+Each class keeps a share of the limit in reserve for the classes above
+it: while the remaining budget is at or below a class's reserve, its
+calls wait (highest priority first) and give up with QuotaDeferred after
+the class's maximum wait. Live calls are only held back when the quota is
+exhausted. A 429 blocks every class until its Retry-After has passed.
+Without a fresh observation (QUOTA_WINDOW seconds, the quota period) the
+budget is treated as unknown and calls are admitted.
+
+At most QUOTA_MAX_IN_FLIGHT calls run at once per process, so under a
+burst the queue drains in priority order as well.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from . import metrics
+from .resilience import parse_retry_after
+
+LIVE, UPCOMING, TEAM_STATS, BACKFILL = 'live', 'upcoming', 'team_stats', 'backfill'
+PRIORITIES = {LIVE: 0, UPCOMING: 1, TEAM_STATS: 2, BACKFILL: 3}
+
+# Share of the quota limit held back from each class
+RESERVES = {LIVE: 0.0, UPCOMING: 0.05, TEAM_STATS: 0.15, BACKFILL: 0.30}
+# Seconds a call of each class may wait for budget before it is deferred
+MAX_WAIT = {LIVE: 5.0, UPCOMING: 10.0, TEAM_STATS: 2.0, BACKFILL: 3600.0}
+
+QUOTA_LIMIT = int(os.getenv('QUOTA_LIMIT', '1000'))
+QUOTA_WINDOW = float(os.getenv('QUOTA_WINDOW', '3600'))
+MAX_IN_FLIGHT = int(os.getenv('QUOTA_MAX_IN_FLIGHT', '8'))
+
+
+class QuotaDeferred(Exception):
+    """A call was not admitted within its class's maximum wait."""
+
+    def __init__(self, priority: str, retry_after: float):
+        super().__init__(f"PandaScore quota low: {priority} call deferred, retry in {retry_after:.0f}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class QuotaScheduler:
+    def __init__(self, limit: int = QUOTA_LIMIT, window: float = QUOTA_WINDOW, max_in_flight: int = MAX_IN_FLIGHT,
+                 reserves: Dict[str, float] = RESERVES, max_wait: Dict[str, float] = MAX_WAIT):
+        self.limit = limit
+        self.window = window
+        self.max_in_flight = max_in_flight
+        self.reserves = reserves
+        self.max_wait = max_wait
+        self.remaining: Optional[int] = None
+        self.observed_at = 0.0
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self._waiting = []  # heap of (priority rank, seq)
+        self._depth = {p: 0 for p in PRIORITIES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _budget(self, now: float) -> Optional[int]:
+        if self.remaining is None or now - self.observed_at > self.window:
+            return None
+        return self.remaining
+
+    def _admissible(self, priority: str, now: float) -> bool:
+        if now < self.blocked_until:
+            return False
+        budget = self._budget(now)
+        if budget is None:
+            return True
+        return budget > 0 and budget > self.reserves[priority] * self.limit
+
+    def _retry_after(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return max(1.0, self.observed_at + self.window - now)
+
+    def _update_gauges(self) -> None:
+        for priority, depth in self._depth.items():
+            metrics.QUOTA_QUEUE_DEPTH.set(depth, priority)
+        metrics.QUOTA_IN_FLIGHT.set(self.in_flight)
+        if self.remaining is not None:
+            metrics.QUOTA_REMAINING.set(self.remaining)
+
+    def acquire(self, priority: str, max_wait: Optional[float] = None) -> None:
+        """Blocks until a call of `priority` may go out; raises QuotaDeferred
+        after `max_wait` (default: the class's MAX_WAIT)."""
+        rank = PRIORITIES[priority]
+        limit = self.max_wait[priority] if max_wait is None else max_wait
+        entry = (rank, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._depth[priority] += 1
+            self._update_gauges()
+            try:
+                while True:
+                    now = time.monotonic()
+                    if (self._waiting[0] == entry and self.in_flight < self.max_in_flight
+                            and self._admissible(priority, now)):
+                        heapq.heappop(self._waiting)
+                        self.in_flight += 1
+                        if self.remaining is not None:
+                            # Count the call before its response reports the new value
+                            self.remaining -= 1
+                        metrics.QUOTA_WAIT_DURATION.observe(now - started, priority)
+                        return
+                    left = limit - (now - started)
+                    if left <= 0:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        metrics.QUOTA_DEFERRED.inc(priority)
+                        raise QuotaDeferred(priority, self._retry_after(now))
+                    # Re-check at least every second: budgets recover with time, not only on notify
+                    self._cond.wait(min(left, 1.0))
+            finally:
+                self._depth[priority] -= 1
+                self._update_gauges()
+                self._cond.notify_all()
+
+    def release(self, response=None) -> None:
+        """Ends a call started with acquire; `response` updates the budget."""
+        with self._cond:
+            self.in_flight -= 1
+            if response is not None:
+                self._observe(response)
+            self._update_gauges()
+            self._cond.notify_all()
+
+    def _observe(self, response) -> None:
+        now = time.monotonic()
+        remaining = _header_int(response.headers, 'X-Rate-Limit-Remaining')
+        limit = _header_int(response.headers, 'X-Rate-Limit-Limit')
+        if limit:
+            self.limit = limit
+        if remaining is not None:
+            self.remaining = remaining
+            self.observed_at = now
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            # Blocked until Retry-After, then unknown again rather than empty
+            self.remaining = None
+            self.blocked_until = now + (retry_after if retry_after is not None else 1.0)
+
+    def snapshot(self) -> Dict:
+        """Current budget and queue depth per class."""
+        with self._cond:
+            now = time.monotonic()
+            return {
+                'remaining': self._budget(now),
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'blocked_for': round(max(0.0, self.blocked_until - now), 1),
+                'queue': dict(self._depth),
+            }
+
+
+SCHEDULER = QuotaScheduler()
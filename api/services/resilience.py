@@ -0,0 +1,147 @@
+"""Building blocks for calls to a flaky upstream (see PandaScoreClient.get_json).
+
+- Deadline: a time budget shared by several calls (e.g. one live cycle);
+  each call's timeout is capped by what is left of it.
+- retry_delay: exponential backoff with full jitter that never retries
+  earlier than the server's Retry-After.
+- CircuitBreaker: after `threshold` consecutive failures calls are
+  rejected for `reset_after` seconds, then one trial call decides whether
+  to close again.
+- hedged: runs a call and, if it has not finished after `hedge_after`
+  seconds, a duplicate; the first successful result wins.
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, Tuple
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, timeout: float) -> float:
+        return min(timeout, self.remaining())
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full-jitter backoff for retry number `attempt` (0-based); at least
+    `retry_after` when the server sent one."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        # Spread clients that got the same Retry-After
+        delay = retry_after + random.uniform(0, base)
+    return delay
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, on_open: Optional[Callable[[], None]] = None):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.on_open = on_open
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release_trial(self) -> None:
+        """Gives back a half-open trial whose call ended without a result
+        (e.g. a 429); the next allow() makes a new trial."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            opened = self.state != self.OPEN and (self.state == self.HALF_OPEN or self.failures >= self.threshold)
+            if opened:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+        if opened and self.on_open is not None:
+            self.on_open()
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='hedge')
+        return _hedge_pool
+
+
+def hedged(call: Callable[[float], object], timeout: float, hedge_after: float) -> Tuple[object, Optional[str]]:
+    """(result, winner) of `call(timeout)`, duplicated after `hedge_after`;
+    winner is 'primary' or 'hedge', or None when no duplicate was sent.
+
+    Only a result below HTTP 400 wins, so a fast 503 or 429 does not beat
+    a slower 200. The slower call is not cancelled; it finishes (or times
+    out) in the background. If neither succeeds, the primary's result is
+    returned (the hedge's if the primary raised) or its exception raised.
+    """
+    primary = _pool().submit(call, timeout)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done or timeout <= hedge_after:
+        return primary.result(), None
+    hedge = _pool().submit(call, timeout - hedge_after)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None and getattr(future.result(), 'status_code', 0) < 400:
+                return future.result(), 'hedge' if future is hedge else 'primary'
+    if primary.exception() is not None and hedge.exception() is None:
+        return hedge.result(), None
+    return primary.result(), None
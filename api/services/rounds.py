@@ -0,0 +1,176 @@
+"""Append-only per-round events of live matches (match_rounds).
+
+Each live poll of /csgo/matches/{id}/stats is reduced to a round state
+(map, current round, per-team round score and side, plus the per-round
+list when PandaScore sends one). Rounds that finished since the previous
+poll are appended to match_rounds and the same compact records are
+appended to matches.round_history, which therefore is never rebuilt.
+
+Rounds missed between two polls are still recorded, with the winner left
+empty unless the score change shows who won.
+"""
+import json
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2.extras
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS match_rounds (
+        id BIGSERIAL,
+        match_id INTEGER NOT NULL,
+        map_name VARCHAR(50) NOT NULL DEFAULT '',
+        round_number INTEGER NOT NULL,
+        winner_team_id INTEGER,
+        winner_side VARCHAR(10),
+        team1_score INTEGER,
+        team2_score INTEGER,
+        recorded_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        PRIMARY KEY (match_id, map_name, round_number)
+    );
+    CREATE INDEX IF NOT EXISTS idx_match_rounds_timeline ON match_rounds (match_id, id);
+"""
+
+COLUMNS = ('match_id', 'map_name', 'round_number', 'winner_team_id', 'winner_side',
+           'team1_score', 'team2_score', 'recorded_at')
+
+INSERT_SQL = f"""
+    INSERT INTO match_rounds ({', '.join(COLUMNS)})
+    VALUES %s
+    ON CONFLICT (match_id, map_name, round_number) DO NOTHING
+    RETURNING id, map_name, round_number, winner_team_id, winner_side, team1_score, team2_score
+"""
+
+LAST_ROUND_SQL = """
+    SELECT round_number, team1_score, team2_score
+    FROM match_rounds
+    WHERE match_id = %s AND map_name = %s
+    ORDER BY round_number DESC
+    LIMIT 1
+"""
+
+APPEND_HISTORY_SQL = """
+    UPDATE matches
+    SET round_history = COALESCE(round_history, '[]'::jsonb) || %s::jsonb
+    WHERE id = %s
+"""
+
+TIMELINE_SQL = """
+    SELECT id, map_name, round_number, winner_team_id, winner_side,
+           team1_score, team2_score, recorded_at
+    FROM match_rounds
+    WHERE match_id = %(match_id)s AND id > %(after)s
+    ORDER BY id
+    LIMIT %(limit)s
+"""
+
+
+def _first(entry: Dict, *paths):
+    for path in paths:
+        value = entry
+        for part in path.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value is not None:
+            return value
+    return None
+
+
+def round_state(details: Dict, team1_id: Optional[int], team2_id: Optional[int]) -> Dict:
+    """Compact round state of one /stats response (see record_rounds)."""
+    scores = {}
+    sides = {}
+    for team in details.get('teams') or []:
+        if not isinstance(team, dict):
+            continue
+        team_id = _first(team, 'id', 'team.id', 'team_id')
+        score = _first(team, 'round_score', 'rounds_won', 'score')
+        if team_id is not None and isinstance(score, int):
+            scores[team_id] = score
+        side = _first(team, 'side', 'current_side')
+        if team_id is not None and side:
+            sides[team_id] = str(side).lower()
+
+    rounds = []
+    for entry in details.get('rounds') or []:
+        if not isinstance(entry, dict):
+            continue
+        number = _first(entry, 'round', 'number', 'round_number')
+        if not isinstance(number, int):
+            continue
+        side = _first(entry, 'winner_side', 'side', 'winner.side')
+        rounds.append({
+            'round': number,
+            'winner_id': _first(entry, 'winner_id', 'winner.id', 'winner_team_id'),
+            'side': str(side).lower() if side else None,
+            'score': [_first(entry, 'team1_score', 'score.team1'), _first(entry, 'team2_score', 'score.team2')],
+        })
+
+    return {
+        'map': (details.get('map') or {}).get('name'),
+        'current_round': details.get('current_round') or 0,
+        'team1_id': team1_id,
+        'team2_id': team2_id,
+        'score': [scores.get(team1_id), scores.get(team2_id)],
+        'sides': [sides.get(team1_id), sides.get(team2_id)],
+        'rounds': rounds,
+    }
+
+
+def _from_score(state: Dict, last: Optional[Tuple[int, int, int]]) -> List[Dict]:
+    """Rounds finished since `last` (round, team1_score, team2_score), from scores."""
+    score1, score2 = state['score']
+    if score1 is None or score2 is None:
+        return []
+    last_round, last1, last2 = last or (0, 0, 0)
+    last1, last2 = last1 or 0, last2 or 0
+    played = score1 + score2
+    if played <= last_round:
+        return []
+    records = [{'round': n, 'winner_id': None, 'side': None, 'score': [None, None]}
+               for n in range(last_round + 1, played)]
+    winner, side = None, None
+    if played - last_round == 1:
+        # Exactly one round since the last record: the team whose score moved won it
+        index = 0 if score1 > last1 else 1 if score2 > last2 else None
+        if index is not None:
+            winner = (state['team1_id'], state['team2_id'])[index]
+            side = state['sides'][index]
+    records.append({'round': played, 'winner_id': winner, 'side': side, 'score': [score1, score2]})
+    return records
+
+
+def record_rounds(cur, match_id: int, state: Optional[Dict], recorded_at) -> List[Dict]:
+    """Appends the rounds of `state` not stored yet; returns the new records
+    (in round order) after appending them to matches.round_history."""
+    if not state:
+        return []
+    map_name = state.get('map') or ''
+    records = state.get('rounds') or []
+    if not records:
+        cur.execute(LAST_ROUND_SQL, (match_id, map_name))
+        records = _from_score(state, cur.fetchone())
+    if not records:
+        return []
+
+    rows = [(match_id, map_name, r['round'], r['winner_id'], r['side'],
+             r['score'][0], r['score'][1], recorded_at) for r in records]
+    inserted = psycopg2.extras.execute_values(cur, INSERT_SQL, rows, fetch=True)
+    if not inserted:
+        return []
+    new = [{'id': row[0], 'map': row[1] or None, 'round': row[2], 'winner_id': row[3],
+            'side': row[4], 'score': [row[5], row[6]]} for row in sorted(inserted)]
+    cur.execute(APPEND_HISTORY_SQL, (json.dumps(new), match_id))
+    return new
+
+
+def get_timeline(cur, match_id: int, after: int = 0, limit: int = 500) -> List[Dict]:
+    """Rounds of a match after event id `after`, oldest first (one index range scan)."""
+    cur.execute(TIMELINE_SQL, {'match_id': match_id, 'after': after, 'limit': limit})
+    return [{
+        'id': row['id'],
+        'map': row['map_name'] or None,
+        'round': row['round_number'],
+        'winner_id': row['winner_team_id'],
+        'side': row['winner_side'],
+        'score': [row['team1_score'], row['team2_score']],
+        'recorded_at': row['recorded_at'].isoformat(),
+    } for row in cur.fetchall()]
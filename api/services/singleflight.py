@@ -0,0 +1,152 @@
+"""Single-flight execution of identical concurrent computations.
+
+Callers pass a key identifying the request and a function computing its
+(JSON-serializable) result. While a computation for a key is running in
+this process, further calls with the same key wait for it and get its
+result (or its exception) instead of running their own.
+
+With SINGLEFLIGHT_SHARED set, the leader of each process additionally
+coordinates through Postgres: a transaction-level advisory lock on the key
+lets one process compute while the others wait, and the result is left in
+singleflight_results for SINGLEFLIGHT_TTL seconds so the waiters (and
+requests arriving just after) read it instead of recomputing. If the lock
+is not granted within SINGLEFLIGHT_LOCK_TIMEOUT the caller computes on its
+own rather than failing. The lock connection stays open while the result
+is computed, so in a pooled process it comes from a pool of its own
+(SINGLEFLIGHT_CONNECTIONS); when all of those are busy the caller computes
+on its own as well.
+
+Every call is counted in singleflight_calls_total by outcome: computed,
+coalesced_local (waited on this process) or coalesced_shared (result of
+another process).
+"""
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import psycopg2.errors
+import psycopg2.pool
+
+from . import metrics
+from .db import connect, side_pool
+
+SHARED = os.getenv('SINGLEFLIGHT_SHARED', '') not in ('', '0')
+RESULT_TTL = float(os.getenv('SINGLEFLIGHT_TTL', '2'))
+LOCK_TIMEOUT = float(os.getenv('SINGLEFLIGHT_LOCK_TIMEOUT', '10'))
+LOCK_CONNECTIONS = int(os.getenv('SINGLEFLIGHT_CONNECTIONS', '4'))
+
+COMPUTED, COALESCED_LOCAL, COALESCED_SHARED = 'computed', 'coalesced_local', 'coalesced_shared'
+
+# Unlogged: results live for seconds and are recomputed after a crash anyway
+SCHEMA_SQL = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS singleflight_results (
+        key TEXT PRIMARY KEY,
+        result JSONB NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+    );
+"""
+
+FRESH_SQL = """
+    SELECT result FROM singleflight_results
+    WHERE key = %s AND created_at > clock_timestamp() - make_interval(secs => %s)
+"""
+
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))"
+
+PURGE_SQL = "DELETE FROM singleflight_results WHERE created_at < clock_timestamp() - make_interval(secs => %s)"
+
+STORE_SQL = """
+    INSERT INTO singleflight_results (key, result, created_at)
+    VALUES (%s, %s, clock_timestamp())
+    ON CONFLICT (key) DO UPDATE SET result = EXCLUDED.result, created_at = EXCLUDED.created_at
+"""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls per key; `name` labels the metrics."""
+
+    def __init__(self, name: str, ttl: float = RESULT_TTL):
+        self.name = name
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], object], database_url: Optional[str] = None) -> Tuple[object, str]:
+        """Returns (result, outcome). Cross-process coalescing is used when
+        SINGLEFLIGHT_SHARED is set and `database_url` is given."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            metrics.SINGLEFLIGHT_CALLS.inc(self.name, COALESCED_LOCAL)
+            if call.error is not None:
+                raise call.error
+            return call.result, COALESCED_LOCAL
+
+        try:
+            if SHARED and database_url:
+                call.result, outcome = self._shared(key, fn, database_url)
+            else:
+                call.result, outcome = fn(), COMPUTED
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        metrics.SINGLEFLIGHT_CALLS.inc(self.name, outcome)
+        return call.result, outcome
+
+    def _shared(self, key: str, fn: Callable[[], object], database_url: str) -> Tuple[object, str]:
+        key = f'{self.name}:{key}'
+        # Not from the main pool: fn() takes its own connections from there
+        pool = side_pool(database_url, 'singleflight', LOCK_CONNECTIONS, LOCK_TIMEOUT)
+        try:
+            conn = pool.acquire() if pool is not None else connect(database_url)
+        except psycopg2.pool.PoolError:
+            return fn(), COMPUTED
+        try:
+            with conn.cursor() as cur:
+                cur.execute(FRESH_SQL, (key, self.ttl))
+                row = cur.fetchone()
+                metrics.cache_lookup('singleflight_results', row is not None)
+                if row is not None:
+                    return row[0], COALESCED_SHARED
+
+                cur.execute("SET LOCAL lock_timeout = %s", (f'{int(LOCK_TIMEOUT * 1000)}ms',))
+                try:
+                    cur.execute(LOCK_SQL, (key,))
+                except psycopg2.errors.LockNotAvailable:
+                    conn.rollback()
+                    return fn(), COMPUTED
+
+                # Whoever held the lock may have just stored the result
+                cur.execute(FRESH_SQL, (key, self.ttl))
+                row = cur.fetchone()
+                metrics.cache_lookup('singleflight_results', row is not None)
+                if row is not None:
+                    return row[0], COALESCED_SHARED
+
+                result = fn()
+                cur.execute(PURGE_SQL, (self.ttl,))
+                cur.execute(STORE_SQL, (key, json.dumps(result)))
+                # Commit publishes the result and releases the lock together
+                conn.commit()
+                return result, COMPUTED
+        finally:
+            conn.close()
@@ -0,0 +1,162 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import psycopg2.extras
+
+from . import ingest, payloads
+from .pandascore import PandaScoreClient
+
+PAGE_SIZE = 100
+
+# First run of the past-matches sync only looks this far back; older
+# history is the backfill's job (scripts/backfill.py)
+PAST_INITIAL_WINDOW = timedelta(days=7)
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        resource VARCHAR(100) PRIMARY KEY,
+        last_modified_at TIMESTAMP WITH TIME ZONE,
+        last_run_at TIMESTAMP WITH TIME ZONE,
+        last_run_counts JSONB
+    );
+"""
+
+
+def _match_row(match: Dict, archive_rows: Dict):
+    opponents = [o['opponent'] for o in (match.get('opponents') or []) if o and o.get('opponent')]
+    team1 = opponents[0] if len(opponents) > 0 else {}
+    team2 = opponents[1] if len(opponents) > 1 else {}
+    packed = payloads.pack('match', match)
+    archive_rows[packed[0]] = packed
+    return (
+        match['id'],
+        team1.get('id'),
+        team2.get('id'),
+        team1.get('name', 'TBD'),
+        team2.get('name', 'TBD'),
+        match.get('scheduled_at'),
+        (match.get('league') or {}).get('name'),
+        match.get('status'),
+        json.dumps(payloads.project_match(match)),
+        packed[0],
+    )
+
+
+class MatchSync:
+    """Incremental sync of PandaScore match lists keyed on modified_at.
+
+    Each run asks only for records modified since the stored cursor, pages
+    through all of them and upserts only rows whose content hash changed.
+    """
+
+    RESOURCES = {
+        'upcoming': '/csgo/matches/upcoming',
+        'past': '/csgo/matches/past',
+    }
+
+    def __init__(self, client: PandaScoreClient, conn):
+        self.client = client
+        self.conn = conn
+
+    def _cursor(self, resource: str) -> Optional[datetime]:
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT last_modified_at FROM sync_state WHERE resource = %s", (resource,))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def _save_cursor(self, cur, resource: str, modified_at, counts: Optional[Dict] = None) -> None:
+        cur.execute("""
+            INSERT INTO sync_state (resource, last_modified_at, last_run_at, last_run_counts)
+            VALUES (%s, %s, NOW(), %s)
+            ON CONFLICT (resource) DO UPDATE SET
+                last_modified_at = GREATEST(sync_state.last_modified_at, EXCLUDED.last_modified_at),
+                last_run_at = EXCLUDED.last_run_at,
+                last_run_counts = COALESCE(EXCLUDED.last_run_counts, sync_state.last_run_counts)
+        """, (resource, modified_at, json.dumps(counts) if counts is not None else None))
+
+    def _fetch_page(self, path: str, since: Optional[datetime], page: int) -> List[Dict]:
+        params = {'sort': 'modified_at', 'page[number]': page, 'page[size]': PAGE_SIZE}
+        if since is not None:
+            now = datetime.now(timezone.utc)
+            params['range[modified_at]'] = f"{since.isoformat()},{now.isoformat()}"
+        response = self.client.get(path, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def _store_upcoming(self, cur, matches: List[Dict]) -> Dict[str, int]:
+        archive_rows: Dict = {}
+        rows = [_match_row(m, archive_rows) for m in matches]
+        returned = psycopg2.extras.execute_values(cur, """
+            INSERT INTO matches
+                (id, team1_id, team2_id, team1_name, team2_name, scheduled_at, league_name,
+                 match_status, raw_data, raw_hash)
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE SET
+                team1_id = EXCLUDED.team1_id,
+                team2_id = EXCLUDED.team2_id,
+                team1_name = EXCLUDED.team1_name,
+                team2_name = EXCLUDED.team2_name,
+                scheduled_at = EXCLUDED.scheduled_at,
+                league_name = EXCLUDED.league_name,
+                match_status = EXCLUDED.match_status,
+                raw_data = EXCLUDED.raw_data,
+                raw_hash = EXCLUDED.raw_hash
+            WHERE matches.raw_hash IS DISTINCT FROM EXCLUDED.raw_hash
+            RETURNING raw_hash, (xmax = 0) AS inserted
+        """, rows, fetch=True)
+        self._archive(cur, archive_rows, {r[0] for r in returned})
+        return ingest.upsert_counts('matches', returned, len(rows))
+
+    def _store_past(self, cur, matches: List[Dict]) -> Dict[str, int]:
+        archive_rows: Dict = {}
+        teams = {}
+        rows = []
+        for match in matches:
+            row = ingest.historical_match_row(match, archive_rows)
+            if row is not None:
+                rows.append(row)
+                teams.update((t[0], t) for t in ingest.team_rows(match))
+        ingest.upsert_teams(cur, list(teams.values()))
+        counts = ingest.upsert_historical(cur, rows)
+        self._archive(cur, archive_rows, archive_rows.keys())
+        return counts
+
+    def _archive(self, cur, archive_rows: Dict, hashes) -> None:
+        rows = [archive_rows[h] for h in hashes if h in archive_rows]
+        if rows:
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO raw_payload_archive (content_hash, resource, payload, raw_size)
+                VALUES %s
+                ON CONFLICT (content_hash) DO NOTHING
+            """, rows)
+
+    def sync(self, resource: str) -> Dict:
+        """Runs one incremental pass; commits after every page."""
+        path = self.RESOURCES[resource]
+        since = self._cursor(resource)
+        if since is None and resource == 'past':
+            since = datetime.now(timezone.utc) - PAST_INITIAL_WINDOW
+        store = self._store_upcoming if resource == 'upcoming' else self._store_past
+
+        counts = {'fetched': 0, 'new': 0, 'changed': 0, 'unchanged': 0, 'pages': 0}
+        page = 1
+        while True:
+            matches = self._fetch_page(path, since, page)
+            if matches:
+                with self.conn.cursor() as cur:
+                    for key, value in store(cur, matches).items():
+                        counts[key] += value
+                    newest = max((m.get('modified_at') for m in matches if m.get('modified_at')), default=None)
+                    self._save_cursor(cur, resource, newest)
+                self.conn.commit()
+            counts['fetched'] += len(matches)
+            counts['pages'] += 1
+            if len(matches) < PAGE_SIZE:
+                break
+            page += 1
+
+        with self.conn.cursor() as cur:
+            self._save_cursor(cur, resource, None, counts)
+        self.conn.commit()
+        return counts
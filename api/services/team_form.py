@@ -0,0 +1,155 @@
+"""Rolling form state per team (team_form).
+
+One row per team holds the team's last RECENT_SIZE results (newest first)
+and the form score over the standard windows, computed with the same
+formula get_team_form always used (form_score below). Ingestion refreshes
+only the teams of the historical_matches rows it inserted or changed, each
+from that team's own latest matches, so late or corrected results are
+picked up exactly. Reading form is a primary-key lookup.
+"""
+import json
+from typing import Dict, Iterable, List, Optional
+
+import psycopg2.extras
+
+RECENT_SIZE = 10
+WINDOWS = (5, 10)
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS team_form (
+        team_id INTEGER PRIMARY KEY,
+        recent JSONB NOT NULL DEFAULT '[]',
+        form_score_5 DOUBLE PRECISION,
+        form_score_10 DOUBLE PRECISION,
+        last_played_at TIMESTAMP WITH TIME ZONE,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_historical_matches_team1_played
+        ON historical_matches (team1_id, played_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_historical_matches_team2_played
+        ON historical_matches (team2_id, played_at DESC);
+"""
+
+# Same visibility as the form queries it replaces: played before now
+RECENT_SQL = f"""
+    SELECT t.team_id, r.id, r.winner_id, r.team_score, r.opp_score, r.played_at
+    FROM unnest(%s::int[]) AS t(team_id)
+    CROSS JOIN LATERAL (
+        SELECT * FROM (
+            (SELECT id, winner_id, team1_score AS team_score, team2_score AS opp_score, played_at
+             FROM historical_matches
+             WHERE team1_id = t.team_id AND played_at < NOW()
+             ORDER BY played_at DESC, id DESC LIMIT {RECENT_SIZE})
+            UNION ALL
+            (SELECT id, winner_id, team2_score, team1_score, played_at
+             FROM historical_matches
+             WHERE team2_id = t.team_id AND played_at < NOW()
+             ORDER BY played_at DESC, id DESC LIMIT {RECENT_SIZE})
+        ) sides
+        ORDER BY played_at DESC, id DESC
+        LIMIT {RECENT_SIZE}
+    ) r
+    ORDER BY t.team_id, r.played_at DESC, r.id DESC
+"""
+
+UPSERT_SQL = """
+    INSERT INTO team_form (team_id, recent, form_score_5, form_score_10, last_played_at, updated_at)
+    VALUES %s
+    ON CONFLICT (team_id) DO UPDATE SET
+        recent = EXCLUDED.recent,
+        form_score_5 = EXCLUDED.form_score_5,
+        form_score_10 = EXCLUDED.form_score_10,
+        last_played_at = EXCLUDED.last_played_at,
+        updated_at = EXCLUDED.updated_at
+"""
+
+FETCH_SQL = "SELECT recent, form_score_5, form_score_10 FROM team_form WHERE team_id = %(team_id)s"
+
+REBUILD_BATCH = 1000
+
+
+def form_score(results: List[Dict]) -> float:
+    """Recency-weighted form (0-100) of results ordered newest first.
+
+    Each result has 'won', 'team_score' and 'opp_score'. A team without
+    results scores 0.
+    """
+    n = len(results)
+    if not n:
+        return 0.0
+    score = 0
+    for i, result in enumerate(results):
+        score_diff = result['team_score'] - result['opp_score']
+        # More recent matches count more
+        weight = 1 + (0.2 * (n - i))
+        if result['won']:
+            # Win gives 20 points, boosted by score difference
+            score += (20 + min(score_diff * 2, 10)) * weight
+        else:
+            # Loss takes away points, but less if it was close
+            score -= (10 - min(abs(score_diff), 5)) * weight
+
+    # Normalize to 0-100
+    max_possible = sum((20 + 10) * (1 + 0.2 * i) for i in range(n))
+    min_possible = -sum((10) * (1 + 0.2 * i) for i in range(n))
+    return max(0, min(100, ((score - min_possible) / (max_possible - min_possible)) * 100))
+
+
+def refresh_teams(cur, team_ids: Iterable[Optional[int]]) -> int:
+    """Recomputes the form state of the given teams; returns how many."""
+    ids = sorted({t for t in team_ids if t is not None})
+    if not ids:
+        return 0
+    cur.execute(RECENT_SQL, (ids,))
+    recent: Dict[int, List[Dict]] = {team_id: [] for team_id in ids}
+    for team_id, match_id, winner_id, team_score, opp_score, played_at in cur.fetchall():
+        recent[team_id].append({
+            'match_id': match_id,
+            'won': winner_id == team_id,
+            'team_score': team_score,
+            'opp_score': opp_score,
+            'played_at': played_at.isoformat(),
+        })
+    rows = [(team_id,
+             json.dumps(results),
+             form_score(results[:WINDOWS[0]]),
+             form_score(results[:WINDOWS[1]]),
+             results[0]['played_at'] if results else None)
+            for team_id, results in recent.items()]
+    psycopg2.extras.execute_values(cur, UPSERT_SQL, rows, template="(%s, %s, %s, %s, %s, NOW())")
+    return len(rows)
+
+
+def rebuild(cur) -> int:
+    """Recomputes every team seen in historical_matches, e.g. after COPY loads."""
+    cur.execute("""
+        SELECT team1_id FROM historical_matches
+        UNION
+        SELECT team2_id FROM historical_matches
+    """)
+    ids = [row[0] for row in cur.fetchall() if row[0] is not None]
+    for start in range(0, len(ids), REBUILD_BATCH):
+        refresh_teams(cur, ids[start:start + REBUILD_BATCH])
+    return len(ids)
+
+
+def fetch_form(cur, team_id: int, limit: int) -> Optional[Dict]:
+    """{'form_score', 'recent'} over the last `limit` matches, or None when the
+    team has no state yet.
+
+    Expects a RealDictCursor; `limit` is at most RECENT_SIZE.
+    """
+    cur.execute(FETCH_SQL, {'team_id': team_id})
+    return form_from_row(cur.fetchone(), limit)
+
+
+def form_from_row(row: Optional[Dict], limit: int) -> Optional[Dict]:
+    """fetch_form's result from a FETCH_SQL row (shared with the asyncpg reads)."""
+    if row is None:
+        return None
+    recent = row['recent'][:limit]
+    score = row.get(f'form_score_{limit}') if limit in WINDOWS else None
+    return {
+        'form_score': score if score is not None else form_score(recent),
+        'recent': recent,
+    }
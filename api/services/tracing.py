@@ -0,0 +1,130 @@
+import contextvars
+import json
+import os
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from . import metrics
+
+# Tracing is opt-in; when disabled no trace is ever started and span()
+# returns a shared no-op object.
+ENABLED = os.getenv('TRACING_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+_current: contextvars.ContextVar = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """Per-request collection of span durations."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = None
+        self.started = time.perf_counter()
+        self.spans: Dict[str, list] = {}
+
+    def add(self, name: str, duration: float) -> None:
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Formats spans as a Server-Timing header value (durations in ms)."""
+        parts = [f'{name};dur={total * 1000:.2f};desc="{count}x"'
+                 for name, (count, total) in self.spans.items()]
+        parts.append(f'total;dur={self.elapsed_ms():.2f}')
+        return ', '.join(parts)
+
+    def log_line(self) -> str:
+        return json.dumps({
+            'trace': self.name,
+            'status': self.status,
+            'total_ms': round(self.elapsed_ms(), 2),
+            'spans': {name: {'count': count, 'ms': round(total * 1000, 2)}
+                      for name, (count, total) in self.spans.items()},
+        })
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def span(name: str):
+    """Times the enclosed block under `name` if a trace is active."""
+    trace = _current.get()
+    if trace is None:
+        return NULL_SPAN
+    return _Span(trace, name)
+
+
+class TracedHandlerMixin:
+    """Mixin for BaseHTTPRequestHandler subclasses.
+
+    Always records request count and latency metrics. When TRACING_ENABLED
+    is set it also starts a trace per request, adds a Server-Timing header
+    to the response and prints one JSON log line.
+    """
+
+    def handle_one_request(self):
+        self._status = None
+        started = time.perf_counter()
+        token = _current.set(Trace('request')) if ENABLED else None
+        try:
+            return super().handle_one_request()
+        finally:
+            if getattr(self, 'path', None):
+                route = urlparse(self.path).path
+                metrics.HTTP_REQUESTS.inc(route, self._status)
+                metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, route)
+            if token is not None:
+                trace = _current.get()
+                _current.reset(token)
+                if getattr(self, 'path', None):
+                    trace.name = urlparse(self.path).path
+                    trace.status = self._status
+                    print(trace.log_line())
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        trace = _current.get()
+        if trace is not None:
+            self.send_header('Server-Timing', trace.server_timing())
+        super().end_headers()
@@ -0,0 +1,170 @@
+"""Signed webhook events (api/webhooks.py).
+
+A delivery is signed with HMAC-SHA256 over `<timestamp>.<raw body>` using
+WEBHOOK_SECRET, sent as
+
+    X-Webhook-Timestamp: <unix seconds>
+    X-Webhook-Signature: sha256=<hex digest>
+
+and rejected when the timestamp is more than WEBHOOK_TOLERANCE seconds
+away from now (replays of captured requests). WEBHOOK_SECRET may hold
+several comma-separated secrets so the sender's secret can be rotated.
+
+The body is one event:
+
+    {"id": ..., "type": "match" | "game", "event_type": ..., "object": {...},
+     "stats": {...}}  # optional, the match's /stats payload
+
+Event ids are recorded in webhook_events in the transaction that applies
+the event, so a redelivered event is acknowledged without being applied
+twice and a failed one is applied again on retry. The match's modified_at
+is recorded with it; events older than one already applied for the same
+match are acknowledged but skipped, as deliveries may arrive out of order.
+
+The live pollers skip matches that received an event within
+WEBHOOK_RECONCILE_AFTER seconds (see recently_pushed): with webhooks
+enabled polling only reconciles matches whose events stopped arriving.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+WEBHOOK_SECRETS = [s.strip() for s in os.getenv('WEBHOOK_SECRET', '').split(',') if s.strip()]
+TOLERANCE = float(os.getenv('WEBHOOK_TOLERANCE', '300'))
+RECONCILE_AFTER = float(os.getenv('WEBHOOK_RECONCILE_AFTER', '300'))
+RETENTION_DAYS = int(os.getenv('WEBHOOK_RETENTION_DAYS', '7'))
+MAX_BODY_BYTES = 1024 * 1024
+
+EVENT_TYPES = ('match', 'game')
+
+# Match states whose events are stored; others are acknowledged only
+APPLIED_STATUSES = ('running', 'finished')
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS webhook_events (
+        event_id TEXT PRIMARY KEY,
+        event_type VARCHAR(50) NOT NULL,
+        match_id INTEGER,
+        modified_at TIMESTAMP WITH TIME ZONE,
+        received_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_webhook_events_match
+        ON webhook_events (match_id, modified_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_webhook_events_received
+        ON webhook_events (received_at);
+"""
+
+RECORD_SQL = """
+    INSERT INTO webhook_events (event_id, event_type, match_id)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (event_id) DO NOTHING
+    RETURNING event_id
+"""
+
+NEWER_SQL = """
+    SELECT 1 FROM webhook_events
+    WHERE match_id = %s AND modified_at > %s AND event_id <> %s
+    LIMIT 1
+"""
+
+SET_VERSION_SQL = "UPDATE webhook_events SET modified_at = %s WHERE event_id = %s"
+
+MATCH_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtextextended('webhook_match:' || %s, 0))"
+
+RECENT_SQL = """
+    SELECT DISTINCT match_id FROM webhook_events
+    WHERE match_id = ANY(%s) AND received_at > NOW() - make_interval(secs => %s)
+"""
+
+PURGE_SQL = "DELETE FROM webhook_events WHERE received_at < NOW() - make_interval(days => %s)"
+
+
+class InvalidEvent(ValueError):
+    pass
+
+
+def enabled() -> bool:
+    return bool(WEBHOOK_SECRETS)
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """Signature header value for a delivery (also used by the replayer)."""
+    digest = hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+    return f'sha256={digest}'
+
+
+def verify_signature(body: bytes, timestamp: Optional[str], signature: Optional[str],
+                     secrets: Optional[List[str]] = None, now: Optional[float] = None) -> bool:
+    secrets = WEBHOOK_SECRETS if secrets is None else secrets
+    if not (secrets and timestamp and signature):
+        return False
+    try:
+        sent_at = float(timestamp)
+    except ValueError:
+        return False
+    if abs((time.time() if now is None else now) - sent_at) > TOLERANCE:
+        return False
+    return any(hmac.compare_digest(sign(secret, timestamp, body), signature) for secret in secrets)
+
+
+def parse_event(body: bytes) -> Dict:
+    """Decoded event; raises InvalidEvent when required fields are missing."""
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise InvalidEvent('body is not valid JSON')
+    if not isinstance(event, dict):
+        raise InvalidEvent('event must be an object')
+    if event.get('id') in (None, ''):
+        raise InvalidEvent('missing event id')
+    if event.get('type') not in EVENT_TYPES:
+        raise InvalidEvent(f"unsupported event type: {event.get('type')!r}")
+    if not isinstance(event.get('object'), dict):
+        raise InvalidEvent('missing event object')
+    stats = event.get('stats')
+    if stats is not None and not isinstance(stats, dict):
+        raise InvalidEvent('stats must be an object')
+    return event
+
+
+def event_match_id(event: Dict) -> Optional[int]:
+    obj = event['object']
+    return obj.get('id') if event['type'] == 'match' else obj.get('match_id')
+
+
+def record_event(cur, event: Dict, match_id: Optional[int]) -> bool:
+    """Records the event id; False if it was already recorded (the
+    statement waits for a concurrent delivery of the same id to finish)."""
+    cur.execute(RECORD_SQL, (str(event['id']), event['type'], match_id))
+    return cur.fetchone() is not None
+
+
+def claim_version(cur, event: Dict, match_id: int, modified_at: Optional[str]) -> bool:
+    """Stores the match state's modified_at with the event; False when a
+    newer state of the match was already applied. Holds a per-match lock
+    until commit so events of one match are applied one at a time."""
+    cur.execute(MATCH_LOCK_SQL, (match_id,))
+    if modified_at is None:
+        return True
+    cur.execute(NEWER_SQL, (match_id, modified_at, str(event['id'])))
+    if cur.fetchone() is not None:
+        return False
+    cur.execute(SET_VERSION_SQL, (modified_at, str(event['id'])))
+    return True
+
+
+def recently_pushed(cur, match_ids: Iterable[int], within: float = RECONCILE_AFTER) -> Set[int]:
+    """Ids among `match_ids` that received an event in the last `within` seconds."""
+    ids = [i for i in match_ids if i is not None]
+    if not ids:
+        return set()
+    cur.execute(RECENT_SQL, (ids, within))
+    return {row[0] for row in cur.fetchall()}
+
+
+def purge(cur, days: int = RETENTION_DAYS) -> int:
+    cur.execute(PURGE_SQL, (days,))
+    return cur.rowcount
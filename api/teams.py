@@ -1,5 +1,4 @@
 import os
-import requests
 import psycopg2
 import psycopg2.extras
 import json
@@ -7,56 +6,63 @@ from datetime import datetime, timezone
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 
-class handler(BaseHTTPRequestHandler):
+from .services import ingest, quota
+from .services.db import connect
+from .services.listing import InvalidCursor, ListingService, teams_args
+from .services.pandascore import PandaScoreClient
+from .services.tracing import TracedHandlerMixin, span
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             # Check required environment variables
             api_key = os.getenv('PANDASCORE_API_KEY')
             database_url = os.getenv('DATABASE_URL')
-            
-            if not api_key or not database_url:
-                self.send_error(500, "Missing required environment variables")
-                return
 
             # Parse query parameters
             query = parse_qs(urlparse(self.path).query)
             team_id = query.get('team_id', [None])[0]
+            refresh = query.get('refresh', ['0'])[0] in ('1', 'true')
+
+            if not database_url or ((team_id or refresh) and not api_key):
+                self.send_error(500, "Missing required environment variables")
+                return
 
-            # If team_id provided, fetch specific team stats
             if team_id:
+                # If team_id provided, fetch specific team stats
                 response_data = self.fetch_team_stats(api_key, database_url, team_id)
-            else:
-                # Otherwise fetch all teams' stats
+            elif refresh:
+                # Refresh the stored teams from PandaScore
                 response_data = self.fetch_all_teams(api_key, database_url)
+            else:
+                # Otherwise list stored teams (DB only, keyset pagination)
+                try:
+                    response_data = ListingService(database_url).list_teams(**teams_args(query))
+                except (InvalidCursor, ValueError) as e:
+                    self.send_error(400, str(e))
+                    return
 
             # Send response
+            with span('serialize'):
+                body = json.dumps(response_data).encode()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode())
+            self.wfile.write(body)
 
+        except quota.QuotaDeferred as e:
+            # Quota is being saved for live updates; try again later
+            self.send_error(503, str(e))
         except Exception as e:
             self.send_error(500, str(e))
 
     def fetch_team_stats(self, api_key, database_url, team_id):
         # Fetch team details from PandaScore
-        headers = {'Authorization': f'Bearer {api_key}'}
-        team_url = f'https://api.pandascore.co/csgo/teams/{team_id}'
-        team_response = requests.get(team_url, headers=headers)
-        
-        if team_response.status_code != 200:
-            raise Exception(f"Error fetching team data: {team_response.text}")
-
-        team_data = team_response.json()
+        client = PandaScoreClient(api_key, priority=quota.TEAM_STATS)
+        team_data = client.get_json(f'/csgo/teams/{team_id}')
 
         # Fetch team's past matches
-        matches_url = f'https://api.pandascore.co/csgo/matches/past?filter[team_id]={team_id}&page[size]=50'
-        matches_response = requests.get(matches_url, headers=headers)
-        
-        if matches_response.status_code != 200:
-            raise Exception(f"Error fetching match data: {matches_response.text}")
-
-        matches_data = matches_response.json()
+        matches_data = client.get_json('/csgo/matches/past', params={'filter[team_id]': team_id, 'page[size]': 50})
 
         # Calculate stats
         total_matches = len(matches_data)
@@ -72,17 +78,10 @@ class handler(BaseHTTPRequestHandler):
                          for r, match in zip(rounds, matches_data))
 
         # Store team and stats in database
-        with psycopg2.connect(database_url) as conn:
+        with connect(database_url) as conn:
             with conn.cursor() as cur:
-                # Insert/update team
-                cur.execute("""
-                    INSERT INTO teams (id, name, acronym, image_url)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (id) DO UPDATE SET
-                        name = EXCLUDED.name,
-                        acronym = EXCLUDED.acronym,
-                        image_url = EXCLUDED.image_url
-                """, (team_id, team_data['name'], team_data.get('acronym'), team_data.get('image_url')))
+                # Insert/update team (only when its content changed)
+                ingest.upsert_teams(cur, [ingest.team_row(team_data)])
 
                 # Insert/update team stats
                 cur.execute("""
@@ -98,6 +97,13 @@ class handler(BaseHTTPRequestHandler):
                         win_rate = EXCLUDED.win_rate,
                         avg_rounds_won = EXCLUDED.avg_rounds_won,
                         last_updated = NOW()
+                    WHERE (team_stats.total_matches, team_stats.wins, team_stats.losses,
+                           team_stats.rounds_won, team_stats.rounds_lost,
+                           team_stats.win_rate, team_stats.avg_rounds_won)
+                        IS DISTINCT FROM
+                          (EXCLUDED.total_matches, EXCLUDED.wins, EXCLUDED.losses,
+                           EXCLUDED.rounds_won, EXCLUDED.rounds_lost,
+                           EXCLUDED.win_rate, EXCLUDED.avg_rounds_won)
                 """, (
                     team_id, 
                     total_matches,
@@ -109,26 +115,8 @@ class handler(BaseHTTPRequestHandler):
                     (rounds_won / total_matches) if total_matches > 0 else 0
                 ))
 
-                # Store historical matches
-                for match in matches_data:
-                    cur.execute("""
-                        INSERT INTO historical_matches 
-                        (id, team1_id, team2_id, winner_id, team1_score, team2_score, 
-                         played_at, map_name, event_name, raw_data)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (id) DO NOTHING
-                    """, (
-                        match['id'],
-                        match['opponents'][0]['opponent']['id'] if match.get('opponents') else None,
-                        match['opponents'][1]['opponent']['id'] if match.get('opponents') and len(match['opponents']) > 1 else None,
-                        match['winner_id'],
-                        match.get('results', [{'score': 0}])[0]['score'],
-                        match.get('results', [{'score': 0}, {'score': 0}])[1]['score'],
-                        match['scheduled_at'],
-                        match.get('match_type'),
-                        match.get('tournament', {}).get('name'),
-                        json.dumps(match)
-                    ))
+                # Store historical matches (and their opponents, for the FKs)
+                ingest.bulk_load_historical(cur, matches_data)
 
         return {
             'team': team_data,
@@ -145,11 +133,11 @@ class handler(BaseHTTPRequestHandler):
         }
 
     def fetch_all_teams(self, api_key, database_url):
-    # Fetch top teams from PandaScore
-    headers = {'Authorization': f'Bearer {api_key}'}
+        # Fetch top teams from PandaScore
+        client = PandaScoreClient(api_key, priority=quota.TEAM_STATS)
         # Use a plain teams list request first (no paging/sort) to avoid
         # parameter-related errors from the PandaScore API.
-        teams_url = 'https://api.pandascore.co/csgo/teams'
+        teams_url = '/csgo/teams'
 
         # Debugging logs (safe: do not print the full API key)
         try:
@@ -159,37 +147,19 @@ class handler(BaseHTTPRequestHandler):
         print(f"[teams] Requesting PandaScore teams list url={teams_url} auth_present={key_len>0} key_len={key_len}")
 
         try:
-            response = requests.get(teams_url, headers=headers, timeout=15)
+            # Retries 429/5xx; while PandaScore is down the last list is served
+            teams_data = client.get_json(teams_url, timeout=15)
         except Exception as e:
             # Log the exception to help debugging in production logs
             print(f"[teams] Request exception: {type(e).__name__}: {e}")
             raise
-
-        # Log response status and a short snippet of body for debugging
-        resp_snippet = (response.text[:1000] + '...') if response.text and len(response.text) > 1000 else response.text
-        print(f"[teams] PandaScore response status={response.status_code} body_snippet={resp_snippet}")
-
-        # If the API returns an error, include HTTP status for easier debugging
-        if response.status_code != 200:
-            raise Exception(f"Error fetching teams data (status={response.status_code}): {response.text}")
-        
-        if response.status_code != 200:
-            raise Exception(f"Error fetching teams data: {response.text}")
-
-        teams_data = response.json()
+        print(f"[teams] PandaScore returned {len(teams_data)} teams")
 
         # Store teams in database and return basic info
-        with psycopg2.connect(database_url) as conn:
+        with connect(database_url) as conn:
             with conn.cursor() as cur:
-                for team in teams_data:
-                    cur.execute("""
-                        INSERT INTO teams (id, name, acronym, image_url)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (id) DO UPDATE SET
-                            name = EXCLUDED.name,
-                            acronym = EXCLUDED.acronym,
-                            image_url = EXCLUDED.image_url
-                    """, (team['id'], team['name'], team.get('acronym'), team.get('image_url')))
+                counts = ingest.upsert_teams(cur, [ingest.team_row(team) for team in teams_data])
+        print(f"[teams] upsert new={counts['new']} changed={counts['changed']} unchanged(skipped)={counts['unchanged']}")
 
         return [{
             'id': team['id'],
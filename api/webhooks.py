@@ -0,0 +1,151 @@
+from http.server import BaseHTTPRequestHandler
+import os
+import json
+from datetime import datetime
+
+from .services import broadcast, live_updates, metrics, quota, webhooks
+from .services.db import connect
+from .services.pandascore import PandaScoreClient
+from .services.resilience import Deadline
+from .services.tracing import TracedHandlerMixin, span
+
+# Bir olayın işlenmesi için PandaScore çağrılarına ayrılan süre
+EVENT_DEADLINE = float(os.getenv('WEBHOOK_DEADLINE', '10'))
+
+
+class handler(TracedHandlerMixin, BaseHTTPRequestHandler):
+    def do_POST(self):
+        db_url = os.environ.get("DATABASE_URL")
+        api_key = os.environ.get("PANDASCORE_API_KEY")
+
+        # send_error mesajları durum satırına yazılır (latin-1), bu yüzden İngilizce
+        if not webhooks.enabled() or not db_url:
+            self.send_error(503, "Missing WEBHOOK_SECRET or DATABASE_URL")
+            return
+
+        # 1. İmzayı ham gövde üzerinden doğrula
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > webhooks.MAX_BODY_BYTES:
+            self.send_error(413 if length > 0 else 400, "Invalid Content-Length")
+            return
+        body = self.rfile.read(length)
+        if not webhooks.verify_signature(body, self.headers.get('X-Webhook-Timestamp'),
+                                         self.headers.get('X-Webhook-Signature')):
+            metrics.WEBHOOK_EVENTS.inc('unknown', 'unauthorized')
+            self.send_error(401, "Invalid signature")
+            return
+
+        try:
+            event = webhooks.parse_event(body)
+        except webhooks.InvalidEvent as e:
+            metrics.WEBHOOK_EVENTS.inc('unknown', 'invalid')
+            self.send_error(400, str(e))
+            return
+
+        # 2. Kaydet ve yayınla; hata olursa olay kaydı da geri alınır,
+        # gönderici tekrar denediğinde olay yeniden işlenir
+        try:
+            result, match_data = self._apply_event(event, db_url, api_key)
+        except quota.QuotaDeferred as e:
+            metrics.WEBHOOK_EVENTS.inc(event['type'], 'failed')
+            self.send_error(503, str(e))
+            return
+        except Exception as e:
+            metrics.WEBHOOK_EVENTS.inc(event['type'], 'failed')
+            self.send_error(500, str(e))
+            return
+
+        metrics.WEBHOOK_EVENTS.inc(event['type'], result)
+        if result == 'applied':
+            self._publish(match_data)
+
+        self._send_json({
+            "status": result,
+            "event_id": str(event['id']),
+            "match_id": match_data['match_id'] if match_data else webhooks.event_match_id(event)
+        })
+
+    def _apply_event(self, event, db_url, api_key):
+        """Olayı tekilleştirip canlı snapshot olarak kaydeder.
+
+        (sonuç, match_data) döner; sonuç 'applied', 'unchanged', 'duplicate',
+        'stale' (aynı maçın daha yeni durumu işlenmiş) veya 'ignored'
+        (canlı olmayan maç) olur.
+        """
+        match_id = webhooks.event_match_id(event)
+        conn = None
+        try:
+            conn = connect(db_url)
+            with conn.cursor() as cur:
+                # Aynı olay eşzamanlı gelirse ikinci teslimat ilkinin commit'ini bekler
+                if not webhooks.record_event(cur, event, match_id):
+                    conn.rollback()
+                    return 'duplicate', None
+                if match_id is None:
+                    conn.commit()
+                    return 'ignored', None
+
+                match, details = self._resolve_match(event, match_id, api_key)
+                if match.get('status') not in webhooks.APPLIED_STATUSES:
+                    conn.commit()
+                    return 'ignored', None
+                if not webhooks.claim_version(cur, event, match_id, match.get('modified_at')):
+                    conn.commit()
+                    return 'stale', None
+
+                # Polling döngüsüyle aynı kayıt yolu (NOTIFY ile SSE aboneleri de haberdar olur)
+                match_data, round_state = live_updates.build_match_data(match, details)
+                changed = live_updates.save_match_data(cur, match_data, round_state)
+            conn.commit()
+            return ('applied' if changed else 'unchanged'), match_data
+        finally:
+            if conn:
+                conn.close()
+
+    def _resolve_match(self, event, match_id, api_key):
+        """Olaydaki maç nesnesi ve /stats verisi; eksikleri PandaScore'dan çekilir"""
+        match = event['object'] if event['type'] == 'match' else None
+        details = event.get('stats')
+        if match is not None and details is not None:
+            return match, details
+        if not api_key:
+            raise RuntimeError("PANDASCORE_API_KEY missing, cannot complete event")
+
+        deadline = Deadline(EVENT_DEADLINE)
+        client = PandaScoreClient(api_key, priority=quota.LIVE)
+        if match is None:
+            # game olayları sadece haritayı taşır, maçın güncel hali çekilir
+            match = client.get_json(f"/csgo/matches/{match_id}", deadline=deadline)
+        if details is None:
+            details = client.get_json(f"/csgo/matches/{match_id}/stats", deadline=deadline)
+        return match, details
+
+    def _publish(self, match_data):
+        """Maç güncellemesini Pusher'a ve self-hosted broadcaster'a yayınlar"""
+        message = {'match': match_data, 'timestamp': datetime.utcnow().isoformat()}
+        channel = f"match-{match_data['match_id']}"
+
+        pusher_client = broadcast.get_pusher_client()
+        if pusher_client is not None:
+            try:
+                with span('pusher.trigger'):
+                    pusher_client.trigger(channel, 'match-update', message)
+            except Exception as e:
+                print(f"Pusher publish hata: {e}")
+
+        try:
+            with span('broadcast.publish'):
+                broadcast.publish_events([{'channel': channel, 'event': 'match-update', 'data': message}])
+        except Exception as e:
+            print(f"Broadcast publish hata: {e}")
+
+    def _send_json(self, data):
+        with span('serialize'):
+            body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
@@ -57,8 +57,8 @@ CREATE TABLE IF NOT EXISTS predictions (
 );
 
 -- Create indexes for performance
-CREATE INDEX idx_historical_matches_teams ON historical_matches(team1_id, team2_id);
-CREATE INDEX idx_historical_matches_winner ON historical_matches(winner_id);
-CREATE INDEX idx_historical_matches_played_at ON historical_matches(played_at);
-CREATE INDEX idx_predictions_match ON predictions(match_id);
-CREATE INDEX idx_team_stats_win_rate ON team_stats(win_rate DESC);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_historical_matches_teams ON historical_matches(team1_id, team2_id);
+CREATE INDEX IF NOT EXISTS idx_historical_matches_winner ON historical_matches(winner_id);
+CREATE INDEX IF NOT EXISTS idx_historical_matches_played_at ON historical_matches(played_at);
+CREATE INDEX IF NOT EXISTS idx_predictions_match ON predictions(match_id);
+CREATE INDEX IF NOT EXISTS idx_team_stats_win_rate ON team_stats(win_rate DESC);
\ No newline at end of file
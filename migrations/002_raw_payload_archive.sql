@@ -0,0 +1,13 @@
+-- Full PandaScore payloads, deduplicated by content hash and zlib compressed.
+-- matches/historical_matches keep a projected raw_data plus the hash.
+
+CREATE TABLE IF NOT EXISTS raw_payload_archive (
+    content_hash CHAR(64) PRIMARY KEY,
+    resource VARCHAR(50) NOT NULL,
+    payload BYTEA NOT NULL,
+    raw_size INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS raw_hash CHAR(64);
+ALTER TABLE historical_matches ADD COLUMN IF NOT EXISTS raw_hash CHAR(64);
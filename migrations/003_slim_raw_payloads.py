@@ -0,0 +1,84 @@
+"""Slim existing rows: archive full raw_data, keep the projection inline.
+
+Also drops the static match fields repeated in every match_statistics
+snapshot. Space is reused by new rows after the next (auto)vacuum; run
+VACUUM FULL or pg_repack on the tables to return it to the OS.
+"""
+import json
+
+import psycopg2.extras
+
+from api.services import payloads
+
+BATCH_SIZE = 1000
+
+
+def _slim_table(conn, table):
+    slimmed = 0
+    before = after = 0
+    last_id = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id, raw_data FROM {table}
+                WHERE raw_hash IS NULL AND raw_data IS NOT NULL AND id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+
+            archive_rows = {}
+            updates = []
+            for row_id, raw in rows:
+                packed = payloads.pack('match', raw)
+                archive_rows[packed[0]] = packed
+                slim = json.dumps(payloads.project_match(raw))
+                updates.append((row_id, slim, packed[0]))
+                before += packed[3]
+                after += len(slim)
+
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO raw_payload_archive (content_hash, resource, payload, raw_size)
+                VALUES %s
+                ON CONFLICT (content_hash) DO NOTHING
+            """, list(archive_rows.values()))
+            psycopg2.extras.execute_values(cur, f"""
+                UPDATE {table} AS t
+                SET raw_data = v.raw_data::jsonb, raw_hash = v.raw_hash
+                FROM (VALUES %s) AS v(id, raw_data, raw_hash)
+                WHERE t.id = v.id
+            """, updates)
+        conn.commit()
+        slimmed += len(rows)
+        last_id = rows[-1][0]
+    print(f"{table}: slimmed {slimmed} rows, raw_data {before:,} -> {after:,} bytes")
+
+
+def _slim_live_events(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT match_id FROM match_statistics WHERE event_data ? 'teams'")
+        match_ids = [row[0] for row in cur.fetchall()]
+    for match_id in match_ids:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE match_statistics
+                SET event_data = event_data - 'teams' - 'match_id' - 'timestamp'
+                WHERE match_id = %s AND event_data ? 'teams'
+            """, (match_id,))
+        conn.commit()
+    print(f"match_statistics: slimmed snapshots of {len(match_ids)} matches")
+
+
+def migrate(conn):
+    conn.autocommit = False
+    try:
+        for table in ('matches', 'historical_matches'):
+            _slim_table(conn, table)
+        _slim_live_events(conn)
+    finally:
+        # Batches are committed; end the read-only transaction left by the
+        # last SELECT (autocommit cannot be switched inside a transaction)
+        conn.rollback()
+        conn.autocommit = True
@@ -0,0 +1,10 @@
+-- Resumable backfill jobs: next_page is the first page not yet loaded
+-- (every page before it is committed).
+
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    job VARCHAR(100) PRIMARY KEY,
+    next_page INTEGER NOT NULL DEFAULT 1,
+    rows_loaded BIGINT NOT NULL DEFAULT 0,
+    finished BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
@@ -0,0 +1,12 @@
+-- Incremental sync cursor per PandaScore resource (last seen modified_at)
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    resource VARCHAR(100) PRIMARY KEY,
+    last_modified_at TIMESTAMP WITH TIME ZONE,
+    last_run_at TIMESTAMP WITH TIME ZONE,
+    last_run_counts JSONB
+);
+
+-- Team ids on upcoming matches (matchstats joins teams through these)
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS team1_id INTEGER;
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS team2_id INTEGER;
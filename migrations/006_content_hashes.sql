@@ -0,0 +1,8 @@
+-- Content hash for conditional upserts (WHERE hash IS DISTINCT FROM EXCLUDED.hash).
+-- matches and historical_matches use raw_hash (migration 002), the hash of
+-- the full PandaScore payload, for the same purpose.
+
+ALTER TABLE teams ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+
+-- store_prediction upserts ON CONFLICT (match_id), which needs a unique index
+CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_match_unique ON predictions(match_id);
@@ -0,0 +1,21 @@
+-- Covering indexes for the keyset-paginated listings (/api/teams, /api/matches).
+-- Each filter gets its own (filter, scheduled_at, id) index so a page is a
+-- single index-only range scan regardless of depth.
+
+CREATE INDEX IF NOT EXISTS idx_teams_list ON teams (id) INCLUDE (name, acronym, image_url);
+
+CREATE INDEX IF NOT EXISTS idx_matches_list
+    ON matches (scheduled_at, id)
+    INCLUDE (team1_id, team2_id, team1_name, team2_name, league_name, match_status);
+CREATE INDEX IF NOT EXISTS idx_matches_league_list
+    ON matches (league_name, scheduled_at, id)
+    INCLUDE (team1_id, team2_id, team1_name, team2_name, match_status);
+CREATE INDEX IF NOT EXISTS idx_matches_status_list
+    ON matches (match_status, scheduled_at, id)
+    INCLUDE (team1_id, team2_id, team1_name, team2_name, league_name);
+CREATE INDEX IF NOT EXISTS idx_matches_team1_list
+    ON matches (team1_id, scheduled_at, id)
+    INCLUDE (team2_id, team1_name, team2_name, league_name, match_status);
+CREATE INDEX IF NOT EXISTS idx_matches_team2_list
+    ON matches (team2_id, scheduled_at, id)
+    INCLUDE (team1_id, team1_name, team2_name, league_name, match_status);
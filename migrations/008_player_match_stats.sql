@@ -0,0 +1,25 @@
+-- Typed per-player stats per live snapshot (api/services/player_stats.py).
+-- The latest row of a (player_id, match_id) is the player's line for the match.
+
+CREATE TABLE IF NOT EXISTS player_match_stats (
+    player_id INTEGER NOT NULL,
+    match_id INTEGER NOT NULL,
+    snapshot_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    player_name VARCHAR(255),
+    team_id INTEGER,
+    map_name VARCHAR(50),
+    kills INTEGER,
+    deaths INTEGER,
+    assists INTEGER,
+    headshots INTEGER,
+    adr NUMERIC(7,2),
+    kast NUMERIC(5,2),
+    rating NUMERIC(5,2),
+    PRIMARY KEY (player_id, match_id, snapshot_at)
+);
+
+-- "Last N matches of a player" and per-match lookups
+CREATE INDEX IF NOT EXISTS idx_player_match_stats_recent
+    ON player_match_stats (player_id, snapshot_at DESC);
+CREATE INDEX IF NOT EXISTS idx_player_match_stats_match
+    ON player_match_stats (match_id, snapshot_at);
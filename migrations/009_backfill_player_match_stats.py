@@ -0,0 +1,42 @@
+"""Fill player_match_stats from the player_stats stored in existing
+match_statistics snapshots.
+
+Like the live path, a snapshot only produces rows when the player lines
+differ from the previous snapshot of the match. Re-running is harmless
+(ON CONFLICT DO NOTHING).
+"""
+from api.services import player_stats
+
+
+def migrate(conn):
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT match_id FROM match_statistics
+                WHERE jsonb_array_length(COALESCE(event_data->'player_stats', '[]'::jsonb)) > 0
+            """)
+            match_ids = [row[0] for row in cur.fetchall()]
+
+        written = 0
+        for match_id in match_ids:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT timestamp, event_data->'player_stats', event_data->>'map'
+                    FROM match_statistics
+                    WHERE match_id = %s
+                    ORDER BY timestamp
+                """, (match_id,))
+                previous = None
+                for snapshot_at, players, map_name in cur.fetchall():
+                    if not players or players == previous:
+                        continue
+                    previous = players
+                    written += player_stats.save_player_stats(cur, match_id, snapshot_at, players, map_name)
+            conn.commit()
+        print(f"player_match_stats: {written} rows from snapshots of {len(match_ids)} matches")
+    finally:
+        # Batches are committed; end the read-only transaction left by the
+        # last SELECT (autocommit cannot be switched inside a transaction)
+        conn.rollback()
+        conn.autocommit = True
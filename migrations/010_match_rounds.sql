@@ -0,0 +1,20 @@
+-- Append-only round events of live matches (api/services/rounds.py).
+-- matches.round_history is appended from the same records, never rebuilt.
+
+CREATE TABLE IF NOT EXISTS match_rounds (
+    id BIGSERIAL,
+    match_id INTEGER NOT NULL,
+    map_name VARCHAR(50) NOT NULL DEFAULT '',
+    round_number INTEGER NOT NULL,
+    winner_team_id INTEGER,
+    winner_side VARCHAR(10),
+    team1_score INTEGER,
+    team2_score INTEGER,
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (match_id, map_name, round_number)
+);
+
+-- Timeline of a match (optionally after the last seen id) is one range scan
+CREATE INDEX IF NOT EXISTS idx_match_rounds_timeline ON match_rounds (match_id, id);
+
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS round_history JSONB;
@@ -0,0 +1,11 @@
+-- Versioned prediction model parameters written by scripts/tune_model.py.
+-- PredictionModel loads a version by name (predictions.prediction_model),
+-- heuristic_v1 is built in and has no row.
+
+CREATE TABLE IF NOT EXISTS prediction_models (
+    name VARCHAR(50) PRIMARY KEY,
+    params JSONB NOT NULL,
+    metrics JSONB,
+    search JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
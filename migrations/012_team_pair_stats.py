@@ -0,0 +1,15 @@
+"""Create team_pair_stats and build it from the existing historical_matches.
+
+Afterwards api/services/ingest.py keeps the pairs it touches up to date.
+Re-running recomputes every pair (upsert), which is also the way to repair
+the table after historical_matches was changed outside ingest.
+"""
+from api.services import pair_stats
+
+
+def migrate(conn):
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        cur.execute(pair_stats.SCHEMA_SQL)
+        pair_stats.rebuild(cur)
+    conn.commit()
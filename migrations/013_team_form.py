@@ -0,0 +1,15 @@
+"""Create team_form and build it from the existing historical_matches.
+
+Afterwards api/services/ingest.py keeps the teams it touches up to date.
+Re-running recomputes every team, which is also the way to repair the
+table after historical_matches was changed outside ingest.
+"""
+from api.services import team_form
+
+
+def migrate(conn):
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        cur.execute(team_form.SCHEMA_SQL)
+        team_form.rebuild(cur)
+    conn.commit()
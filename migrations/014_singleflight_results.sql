@@ -0,0 +1,8 @@
+-- Short-lived results shared between processes by api/services/singleflight.py
+-- (only used with SINGLEFLIGHT_SHARED). Unlogged: rows live for seconds.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS singleflight_results (
+    key TEXT PRIMARY KEY,
+    result JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,17 @@
+-- Event ids of signed webhook deliveries (api/webhooks.py), recorded in the
+-- transaction that applies the event so redeliveries are not applied twice.
+-- modified_at is the applied match state, used to skip out-of-order events.
+
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_id TEXT PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    match_id INTEGER,
+    modified_at TIMESTAMP WITH TIME ZONE,
+    received_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_events_match
+    ON webhook_events (match_id, modified_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_events_received
+    ON webhook_events (received_at);
@@ -0,0 +1,10 @@
+-- Watermarks for incremental exports (api/services/export.py).
+-- historical_matches.updated_at is set by every ingest insert or change,
+-- existing rows get the migration time.
+
+ALTER TABLE historical_matches
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_historical_matches_updated_at ON historical_matches (updated_at);
+
+CREATE INDEX IF NOT EXISTS idx_match_statistics_timestamp ON match_statistics (timestamp);
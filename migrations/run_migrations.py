@@ -1,7 +1,44 @@
+import importlib.util
 import os
+import sys
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(MIGRATIONS_DIR)
+
+
+def _migration_files():
+    """Numbered .sql and .py migrations in apply order"""
+    names = [n for n in os.listdir(MIGRATIONS_DIR)
+             if n[:3].isdigit() and n.endswith(('.sql', '.py'))]
+    return sorted(names)
+
+
+def _run_sql(cur, path):
+    with open(path, 'r') as f:
+        migration_sql = f.read()
+    # Split and execute statements individually; chunks holding only
+    # comments (e.g. text after a ';' in a header comment) are skipped,
+    # psycopg2 rejects them as empty queries
+    statements = migration_sql.split(';')
+    for statement in statements:
+        code = [line for line in statement.splitlines()
+                if line.strip() and not line.strip().startswith('--')]
+        if code:
+            cur.execute(statement)
+
+
+def _run_python(conn, path):
+    # Python migrations expose migrate(conn) and may import api.services
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.migrate(conn)
+
+
 def run_migrations():
     # Get database URL from environment
     database_url = os.getenv('DATABASE_URL')
@@ -14,14 +51,26 @@ def run_migrations():
     cur = conn.cursor()
 
     try:
-        # Read and execute migration file
-        with open('migrations/001_create_analysis_tables.sql', 'r') as f:
-            migration_sql = f.read()
-            # Split and execute statements individually
-            statements = migration_sql.split(';')
-            for statement in statements:
-                if statement.strip():
-                    cur.execute(statement)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR(255) PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        """)
+        cur.execute("SELECT name FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+
+        for name in _migration_files():
+            if name in applied:
+                continue
+            print(f"Applying {name}")
+            path = os.path.join(MIGRATIONS_DIR, name)
+            if name.endswith('.sql'):
+                _run_sql(cur, path)
+            else:
+                _run_python(conn, path)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
         print("Migration completed successfully")
     
     except Exception as e:
@@ -33,4 +82,4 @@ def run_migrations():
         conn.close()
 
 if __name__ == '__main__':
-    run_migrations()
\ No newline at end of file
+    run_migrations()
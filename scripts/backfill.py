@@ -0,0 +1,184 @@
+"""Resumable parallel backfill of /csgo/matches/past into historical_matches.
+
+Pages are requested in ascending id order (so matches finishing during the
+run only append new pages) by several worker threads that share one rate
+limiter. Each page is COPY-loaded as soon as it arrives; the checkpoint in
+backfill_checkpoints only advances over contiguous committed pages, so an
+interrupted run resumes without gaps (at worst reloading a few pages, which
+is idempotent).
+
+Usage (from the repository root, after migrations/run_migrations.py):
+
+    python -m scripts.backfill --workers 4 --rate 0.25
+    python -m scripts.backfill --restart        # start again from page 1
+    python -m scripts.backfill --player-stats   # also fill player_match_stats
+"""
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from api.services import ingest, player_stats, quota
+from api.services.db import connect
+from api.services.pandascore import PandaScoreClient, RateLimiter
+
+PATH = '/csgo/matches/past'
+
+
+def load_checkpoint(conn, job, restart):
+    with conn.cursor() as cur:
+        if restart:
+            cur.execute("DELETE FROM backfill_checkpoints WHERE job = %s", (job,))
+        cur.execute("""
+            INSERT INTO backfill_checkpoints (job) VALUES (%s)
+            ON CONFLICT (job) DO NOTHING
+        """, (job,))
+        cur.execute("SELECT next_page, rows_loaded, finished FROM backfill_checkpoints WHERE job = %s", (job,))
+        row = cur.fetchone()
+    conn.commit()
+    return row
+
+
+def save_checkpoint(cur, job, next_page, rows_loaded, finished=False):
+    cur.execute("""
+        UPDATE backfill_checkpoints
+        SET next_page = %s, rows_loaded = %s, finished = %s, updated_at = NOW()
+        WHERE job = %s
+    """, (next_page, rows_loaded, finished, job))
+
+
+def fetch_json(client, path, params=None, label=None):
+    """GETs one resource, retrying on 429 / 5xx."""
+    label = label or path
+    for attempt in range(6):
+        response = client.get(path, params=params, timeout=30)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 429 or response.status_code >= 500:
+            delay = float(response.headers.get('Retry-After') or 2 ** attempt)
+            print(f"{label}: HTTP {response.status_code}, retrying in {delay:.0f}s")
+            time.sleep(delay)
+            continue
+        raise Exception(f"Error fetching {label} (status={response.status_code}): {response.text}")
+    raise Exception(f"Giving up on {label} after repeated errors")
+
+
+def fetch_page(client, page, page_size, with_players=False):
+    """Returns the matches on one page and, if with_players, each
+    match's player lines from /csgo/matches/{id}/stats."""
+    matches = fetch_json(client, PATH, {'sort': 'id', 'page[number]': page, 'page[size]': page_size},
+                         label=f"page {page}")
+    players = {}
+    if with_players:
+        for match in matches:
+            stats = fetch_json(client, f"/csgo/matches/{match['id']}/stats", label=f"match {match['id']} stats")
+            players[match['id']] = stats.get('players') or []
+    return matches, players
+
+
+def save_player_stats(cur, matches, players):
+    """One player_match_stats row per player of each finished match.
+
+    Matches without any date are skipped: snapshot_at is part of the key.
+    """
+    written = 0
+    for match in matches:
+        if players.get(match['id']):
+            snapshot_at = match.get('end_at') or match.get('begin_at') or match.get('scheduled_at')
+            if snapshot_at is None:
+                print(f"match {match['id']}: no end_at/begin_at/scheduled_at, player stats skipped")
+                continue
+            written += player_stats.save_player_stats(cur, match['id'], snapshot_at, players[match['id']])
+    return written
+
+
+def run(args):
+    client = PandaScoreClient(args.api_key, rate_limiter=RateLimiter(args.rate, burst=args.workers),
+                              priority=quota.BACKFILL)
+    conn = connect(args.database_url)
+    try:
+        next_page, rows_loaded, finished = load_checkpoint(conn, args.job, args.restart)
+        if finished:
+            print(f"job {args.job} already finished ({rows_loaded} rows); use --restart to run again")
+            return
+        print(f"job {args.job}: resuming at page {next_page} ({rows_loaded} rows loaded so far)")
+
+        started = time.monotonic()
+        run_rows = 0
+        player_rows = 0
+        pages_done = 0
+        to_submit = next_page
+        last_page = None if args.max_pages is None else next_page + args.max_pages - 1
+        end_reached = False
+        completed = {}
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            while True:
+                while len(in_flight) < args.workers * 2 and (last_page is None or to_submit <= last_page):
+                    in_flight[pool.submit(fetch_page, client, to_submit, args.page_size,
+                                          args.player_stats)] = to_submit
+                    to_submit += 1
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = in_flight.pop(future)
+                    matches, players = future.result()
+                    with conn.cursor() as cur:
+                        counts = ingest.bulk_load_historical(cur, matches)
+                        player_rows += save_player_stats(cur, matches, players)
+                    conn.commit()
+                    completed[page] = counts['loaded']
+                    run_rows += counts['loaded']
+                    pages_done += 1
+                    if len(matches) < args.page_size and (last_page is None or page <= last_page):
+                        # Short page: this is the end of the collection
+                        last_page = page
+                        end_reached = True
+
+                # Advance the checkpoint over contiguous loaded pages only
+                while next_page in completed:
+                    rows_loaded += completed.pop(next_page)
+                    next_page += 1
+                with conn.cursor() as cur:
+                    save_checkpoint(cur, args.job, next_page, rows_loaded)
+                conn.commit()
+
+                elapsed = max(time.monotonic() - started, 1e-6)
+                print(f"checkpoint page {next_page} | {pages_done} pages, {run_rows} rows this run | "
+                      f"{pages_done / elapsed:.2f} pages/s, {run_rows / elapsed:.1f} rows/s"
+                      + (f" | {player_rows} player rows" if args.player_stats else ""))
+
+        with conn.cursor() as cur:
+            save_checkpoint(cur, args.job, next_page, rows_loaded, finished=end_reached)
+        conn.commit()
+        print(f"{'finished' if end_reached else 'stopped'}: {rows_loaded} rows total, "
+              f"{run_rows} this run in {time.monotonic() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--api-key', default=os.getenv('PANDASCORE_API_KEY'))
+    parser.add_argument('--job', default='csgo_matches_past', help="checkpoint name")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0.25,
+                        help="max PandaScore requests per second across all workers")
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--max-pages', type=int, help="stop after this many pages (resumable)")
+    parser.add_argument('--player-stats', action='store_true',
+                        help="also load player_match_stats (one extra request per match)")
+    parser.add_argument('--restart', action='store_true', help="discard the checkpoint")
+    args = parser.parse_args(argv)
+
+    if not args.api_key or not args.database_url:
+        raise ValueError("PANDASCORE_API_KEY and DATABASE_URL are required")
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Backtest the prediction model against historical_matches.
+
+Loads the whole history once, recomputes point-in-time features (form,
+head-to-head, win rate as of each match; no lookahead) and reports
+accuracy, log-loss, Brier score and calibration buckets.
+
+Usage (from the repository root):
+
+    python -m scripts.backtest
+    python -m scripts.backtest --since 2023-01-01 --buckets 10 --json
+    python -m scripts.backtest --model heuristic_v2   # a tuned version
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from api.services import backtest, prediction
+from api.services.db import connect_read
+
+
+def print_report(report):
+    if not report['matches']:
+        print("no matches with a result to score")
+        return
+    print(f"matches     {report['matches']}")
+    print(f"accuracy    {report['accuracy']:.4f}")
+    print(f"log-loss    {report['log_loss']:.4f}  (coin flip {report['baseline']['log_loss']:.4f})")
+    print(f"brier       {report['brier']:.4f}  (coin flip {report['baseline']['brier']:.4f})")
+    print("calibration (P(team1 wins) bucket: matches, mean predicted, observed)")
+    for b in report['calibration']:
+        print(f"  {b['bucket']}  {b['matches']:>8}  {b['mean_predicted']:.3f}  {b['observed']:.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--model', default=prediction.MODEL_NAME, help="prediction_models version to score")
+    parser.add_argument('--since', help="only score matches from this date (earlier ones are warm-up)")
+    parser.add_argument('--buckets', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        raise ValueError("DATABASE_URL is required")
+
+    since_epoch = None
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        since_epoch = (since if since.tzinfo else since.replace(tzinfo=timezone.utc)).timestamp()
+
+    started = time.perf_counter()
+    with connect_read(args.database_url) as conn:
+        with conn.cursor() as cur:
+            params = prediction.load_model_params(cur, args.model)
+        history = backtest.MatchHistory.load(conn)
+    loaded = time.perf_counter()
+    features = backtest.compute_features(history, params['form_window'], params['h2h_window'])
+    featurized = time.perf_counter()
+    probs = backtest.score(features, params)
+    report = backtest.evaluate(probs, history.labels(), backtest.since_mask(history, since_epoch), args.buckets)
+    scored = time.perf_counter()
+
+    report['timings'] = {
+        'load': round(loaded - started, 3),
+        'features': round(featurized - loaded, 3),
+        'score': round(scored - featurized, 3),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.model} on {len(history)} matches: load {report['timings']['load']}s, "
+              f"features {report['timings']['features']}s, score {report['timings']['score']}s")
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
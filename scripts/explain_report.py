@@ -0,0 +1,253 @@
+"""EXPLAIN (ANALYZE, BUFFERS) regression report for the analysis queries.
+
+Runs every query issued by AnalysisService and PredictionModel against a
+sample of teams, captures the executed plan of each one and aggregates
+timings and buffer usage per query. Pass a previous report with --baseline
+to flag regressions; the exit status is 1 when any query regressed.
+
+Usage (from the repository root, typically after scripts.generate_dataset):
+
+    python -m scripts.explain_report --samples 25 --output report.json
+    python -m scripts.explain_report --baseline report.json
+"""
+import argparse
+import inspect
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import datetime, timezone
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+from api.services.analysis import AnalysisService
+from api.services.prediction import PredictionModel
+
+SERVICE_FILES = {inspect.getsourcefile(AnalysisService), inspect.getsourcefile(PredictionModel)}
+
+
+class PlanRecorder:
+    """Collects one plan summary per executed statement, keyed by caller."""
+
+    def __init__(self):
+        self.plans = {}
+        self.errors = {}
+
+    @staticmethod
+    def caller_label():
+        # The innermost service method on the stack identifies the query
+        frame = inspect.currentframe()
+        while frame is not None:
+            if frame.f_code.co_filename in SERVICE_FILES:
+                name = frame.f_code.co_name
+                owner = frame.f_locals.get('self')
+                defining = next((c for c in type(owner).__mro__ if name in vars(c)), type(owner))
+                return f"{defining.__name__}.{name}"
+            frame = frame.f_back
+        return 'unknown'
+
+    def add(self, label, plan):
+        root = plan['Plan']
+        self.plans.setdefault(label, []).append({
+            'execution_ms': plan.get('Execution Time', 0.0),
+            'planning_ms': plan.get('Planning Time', 0.0),
+            'shared_hit': root.get('Shared Hit Blocks', 0),
+            'shared_read': root.get('Shared Read Blocks', 0),
+            'rows': root.get('Actual Rows', 0),
+            'node': root.get('Node Type'),
+        })
+
+    def add_error(self, label, error):
+        self.errors[label] = str(error).strip()
+
+
+recorder = PlanRecorder()
+
+
+class ExplainCursor(psycopg2.extras.RealDictCursor):
+    """Runs EXPLAIN ANALYZE before every read; writes are explained and rolled back."""
+
+    def execute(self, query, vars=None):
+        label = recorder.caller_label()
+        is_read = query.lstrip().upper().startswith(('SELECT', 'WITH'))
+        explain = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query
+        try:
+            if is_read:
+                super().execute(explain, vars)
+                recorder.add(label, self.fetchone()['QUERY PLAN'][0])
+            else:
+                super().execute("SAVEPOINT explain_report")
+                super().execute(explain, vars)
+                recorder.add(label, self.fetchone()['QUERY PLAN'][0])
+                super().execute("ROLLBACK TO SAVEPOINT explain_report")
+        except psycopg2.Error as e:
+            recorder.add_error(label, e)
+            self.connection.rollback()
+            if not is_read:
+                return
+        if is_read:
+            return super().execute(query, vars)
+
+
+class ExplainConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = ExplainCursor
+        return super().cursor(*args, **kwargs)
+
+
+class ExplainAnalysisService(AnalysisService):
+    def _get_db_connection(self):
+        return psycopg2.connect(self.database_url, connection_factory=ExplainConnection)
+
+
+class ExplainPredictionModel(PredictionModel):
+    def _get_db_connection(self):
+        return psycopg2.connect(self.database_url, connection_factory=ExplainConnection)
+
+    # Reads too: explained on the primary, not a DATABASE_READ_URL replica
+    _get_read_connection = _get_db_connection
+
+
+def sample_workload(database_url, samples, seed):
+    """Picks teams, frequent opponent pairs and a match id to exercise every query."""
+    rng = random.Random(seed)
+    with psycopg2.connect(database_url) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT team_id FROM team_stats WHERE total_matches > 0 ORDER BY team_id")
+            team_ids = [r[0] for r in cur.fetchall()]
+            if not team_ids:
+                raise ValueError("team_stats is empty; load data first (python -m scripts.generate_dataset)")
+            teams = rng.sample(team_ids, min(samples, len(team_ids)))
+
+            pairs = []
+            for team_id in teams:
+                cur.execute("""
+                    SELECT CASE WHEN team1_id = %s THEN team2_id ELSE team1_id END AS opponent
+                    FROM historical_matches
+                    WHERE team1_id = %s OR team2_id = %s
+                    GROUP BY 1
+                    ORDER BY COUNT(*) DESC, 1
+                    LIMIT 1
+                """, (team_id, team_id, team_id))
+                row = cur.fetchone()
+                if row:
+                    pairs.append((team_id, row[0]))
+
+            cur.execute("SELECT to_regclass('matches') IS NOT NULL")
+            match_id = None
+            if cur.fetchone()[0]:
+                cur.execute("SELECT id FROM matches ORDER BY id LIMIT 1")
+                row = cur.fetchone()
+                match_id = row[0] if row else None
+    return teams, pairs, match_id
+
+
+def run_workload(database_url, teams, pairs, match_id):
+    analysis = ExplainAnalysisService(database_url)
+    prediction = ExplainPredictionModel(database_url)
+    for team_id in teams:
+        analysis.get_team_form(team_id)
+        analysis.get_team_form(team_id, last_n_matches=10)
+        analysis.get_map_performance(team_id)
+    for team1_id, team2_id in pairs:
+        analysis.get_head_to_head(team1_id, team2_id)
+        prediction.predict_match(team1_id, team2_id)
+    if match_id is not None and pairs:
+        prediction.store_prediction(match_id, *pairs[0])
+
+
+def summarize(plans):
+    summary = {}
+    for label, runs in sorted(plans.items()):
+        execution = sorted(r['execution_ms'] for r in runs)
+        summary[label] = {
+            'calls': len(runs),
+            'execution_ms_median': round(statistics.median(execution), 3),
+            'execution_ms_p95': round(execution[min(len(execution) - 1, int(len(execution) * 0.95))], 3),
+            'execution_ms_max': round(execution[-1], 3),
+            'planning_ms_median': round(statistics.median(r['planning_ms'] for r in runs), 3),
+            'shared_hit_median': statistics.median(r['shared_hit'] for r in runs),
+            'shared_read_median': statistics.median(r['shared_read'] for r in runs),
+            'root_nodes': sorted({r['node'] for r in runs if r['node']}),
+        }
+    return summary
+
+
+def compare(current, baseline, threshold, min_delta_ms):
+    """Returns labels whose median time or buffer usage grew past the threshold."""
+    regressions = []
+    for label, now in current.items():
+        before = baseline.get(label)
+        if not before:
+            continue
+        t_before, t_now = before['execution_ms_median'], now['execution_ms_median']
+        if t_now > t_before * threshold and t_now - t_before >= min_delta_ms:
+            regressions.append((label, 'execution_ms_median', t_before, t_now))
+        b_before = before['shared_hit_median'] + before['shared_read_median']
+        b_now = now['shared_hit_median'] + now['shared_read_median']
+        if b_before and b_now > b_before * threshold:
+            regressions.append((label, 'buffers_median', b_before, b_now))
+    return regressions
+
+
+def print_table(summary):
+    print(f"{'query':<45} {'calls':>5} {'med ms':>9} {'p95 ms':>9} {'hit':>8} {'read':>8}  plan")
+    for label, s in summary.items():
+        print(f"{label:<45} {s['calls']:>5} {s['execution_ms_median']:>9.3f} {s['execution_ms_p95']:>9.3f} "
+              f"{s['shared_hit_median']:>8} {s['shared_read_median']:>8}  {','.join(s['root_nodes'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--samples', type=int, default=20, help="number of teams to exercise")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--baseline', help="previous JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="regression ratio")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="ignore timing regressions smaller than this")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        raise ValueError("DATABASE_URL environment variable or --database-url is required")
+
+    teams, pairs, match_id = sample_workload(args.database_url, args.samples, args.seed)
+    run_workload(args.database_url, teams, pairs, match_id)
+
+    summary = summarize(recorder.plans)
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'seed': args.seed,
+        'samples': len(teams),
+        'queries': summary,
+        'errors': recorder.errors,
+    }
+    print_table(summary)
+    for label, error in recorder.errors.items():
+        print(f"error in {label}: {error}")
+    if match_id is None:
+        print("no row in matches; PredictionModel.store_prediction was not explained")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['queries']
+        regressions = compare(summary, baseline, args.threshold, args.min_delta_ms)
+        for label, metric, before, now in regressions:
+            print(f"REGRESSION {label} {metric}: {before} -> {now}")
+        if regressions:
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Streams analysis tables to NDJSON or Parquet files.
+
+Reads through a server-side cursor (see api/services/export.py), so memory
+stays flat however large the table. With --state, the watermark of each
+table is kept in a JSON file: every run exports only the rows inserted or
+changed since the previous one and then advances the watermark.
+
+Usage (from the repository root):
+
+    # full dump, gzip it yourself if needed
+    python -m scripts.export historical_matches --output historical_matches.ndjson
+
+    # nightly incremental Parquet files (needs pyarrow)
+    python -m scripts.export historical_matches team_stats predictions match_statistics \\
+        --format parquet --output-dir exports/ --state exports/watermarks.json
+
+    # explicit watermark, to stdout
+    python -m scripts.export match_statistics --since 2024-05-01T00:00:00Z > stats.ndjson
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from api.services import export
+from api.services.db import connect_read
+
+
+def load_state(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    # Replace atomically so an interrupted run keeps the previous watermarks
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tables', nargs='+', choices=sorted(export.TABLES))
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--format', default=export.NDJSON, choices=[export.NDJSON, export.PARQUET])
+    parser.add_argument('--since', help="ISO 8601 watermark; overrides --state")
+    parser.add_argument('--state', help="JSON file holding the watermark per table")
+    parser.add_argument('--output', help="output file for a single table (default: stdout)")
+    parser.add_argument('--output-dir', help="one file per table and run: <table>-<UTC time>.<format>")
+    parser.add_argument('--include-raw', action='store_true', help="also export raw_data / raw_hash")
+    parser.add_argument('--itersize', type=int, default=export.ITERSIZE, help="rows per server round trip")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error("DATABASE_URL is not set")
+    if args.format == export.PARQUET and export.PARQUET not in export.formats():
+        parser.error("parquet export needs pyarrow (pip install pyarrow)")
+    if len(args.tables) > 1 and not args.output_dir:
+        parser.error("exporting several tables needs --output-dir")
+    if args.output and args.output_dir:
+        parser.error("--output and --output-dir are exclusive")
+    if args.format == export.PARQUET and not (args.output or args.output_dir) and sys.stdout.isatty():
+        parser.error("refusing to write Parquet to a terminal; use --output")
+
+    state = load_state(args.state)
+    run_at = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    conn = connect_read(args.database_url)
+    try:
+        for table in args.tables:
+            since = export.parse_since(args.since or state.get(table))
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                path = os.path.join(args.output_dir, f'{table}-{run_at}.{args.format}')
+            else:
+                path = args.output
+
+            out = open(path, 'wb') if path else sys.stdout.buffer
+            try:
+                result = export.export_table(conn, table, out, fmt=args.format, since=since,
+                                             include_raw=args.include_raw, itersize=args.itersize)
+            except BaseException:
+                if path:
+                    out.close()
+                    os.remove(path)
+                raise
+            if path:
+                out.close()
+            else:
+                out.flush()
+
+            print(f"{table}: {result['rows']} rows since {result['since'] or 'the beginning'} "
+                  f"-> watermark {result['watermark']}" + (f" ({path})" if path else ''), file=sys.stderr)
+            if args.state and result['watermark']:
+                state[table] = result['watermark']
+                save_state(args.state, state)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
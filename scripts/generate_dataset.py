@@ -0,0 +1,293 @@
+"""Synthetic historical dataset generator for scale testing.
+
+Produces teams, historical matches (with maps and round scores) and the
+derived team_stats rows, then bulk-loads them with COPY into the schema from
+migrations/001_create_analysis_tables.sql.
+
+Usage (from the repository root):
+
+    python -m scripts.generate_dataset --seed 42 --scale 1.0 --truncate
+
+Scale 1.0 produces 5,000 teams and 1,000,000 historical matches.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+import psycopg2
+
+from api.services import pair_stats, team_form
+
+BASE_TEAMS = 5000
+BASE_MATCHES = 1000000
+
+# Map pool with rough pick-rate weights
+MAP_POOL = [
+    ('Mirage', 18), ('Inferno', 16), ('Nuke', 14), ('Ancient', 13),
+    ('Anubis', 11), ('Overpass', 10), ('Vertigo', 9), ('Dust2', 9),
+]
+
+# CS2 (MR12) replaced CS:GO (MR15) on this date
+CS2_RELEASE = datetime(2023, 9, 27, tzinfo=timezone.utc)
+
+# Default end of the generated history: fixed, so a seed always yields the
+# same played_at values
+DEFAULT_END = '2025-01-01'
+
+SYLLABLES = ['ar', 'ko', 'vi', 'ta', 'ne', 'zu', 'ra', 'mo', 'li', 'xo',
+             'pe', 'da', 'fu', 'gi', 'sa', 'on', 'ex', 'ul', 'by', 'qu']
+
+
+def _team_name(rng, team_id):
+    parts = [rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))]
+    return f"{''.join(parts).capitalize()} {team_id}"
+
+
+def generate_teams(rng, n_teams, id_offset):
+    """Returns team dicts with a latent skill, activity weight and map bias."""
+    teams = []
+    for i in range(n_teams):
+        team_id = id_offset + i + 1
+        name = _team_name(rng, team_id)
+        teams.append({
+            'id': team_id,
+            'name': name,
+            'acronym': name[:3].upper() + str(team_id % 100),
+            'image_url': f"https://cdn.example.invalid/teams/{team_id}.png",
+            'skill': rng.gauss(0.0, 1.0),
+            # Heavy-tailed activity: a few teams play most of the matches
+            'activity': rng.lognormvariate(0.0, 0.9),
+            'map_bias': {m: rng.gauss(0.0, 0.3) for m, _ in MAP_POOL},
+        })
+    # Teams mostly meet opponents of similar strength, so keep a skill ranking
+    teams.sort(key=lambda t: t['skill'])
+    return teams
+
+
+def _round_score(rng, played_at, skill_diff):
+    """Returns (winner_rounds, loser_rounds) for one map."""
+    target = 13 if played_at >= CS2_RELEASE else 16
+    closeness = math.exp(-abs(skill_diff))
+    if rng.random() < 0.09 * closeness:
+        # Overtime: MR3 periods, winner needs 4 of 6 rounds
+        winner = target + 3 * rng.choice((1, 1, 1, 2, 2, 3))
+        return winner, winner - rng.choice((2, 3, 4))
+    # Regulation: the loser tops out at target - 2 (e.g. 16-14), bigger
+    # skill gaps produce more one-sided maps
+    spread = 3.5 + 2.5 * abs(skill_diff)
+    return target, max(0, target - 2 - int(abs(rng.gauss(0.0, spread))))
+
+
+def generate_matches(rng, teams, n_matches, id_offset, years, end):
+    """Yields historical match dicts in chronological order."""
+    n_teams = len(teams)
+    cum_activity = list(accumulate(t['activity'] for t in teams))
+    total_activity = cum_activity[-1]
+    map_names = [m for m, _ in MAP_POOL]
+    cum_maps = list(accumulate(w for _, w in MAP_POOL))
+    start = end - timedelta(days=365 * years)
+    step = (end - start).total_seconds() / max(n_matches, 1)
+    opponent_spread = max(5.0, n_teams * 0.03)
+    matches_per_event = 120
+
+    for i in range(n_matches):
+        rank1 = bisect_left(cum_activity, rng.random() * total_activity)
+        rank2 = rank1
+        while rank2 == rank1:
+            rank2 = min(n_teams - 1, max(0, rank1 + int(rng.gauss(0.0, opponent_spread))))
+        team1, team2 = teams[rank1], teams[rank2]
+        if rng.random() < 0.5:
+            team1, team2 = team2, team1
+
+        map_name = map_names[bisect_left(cum_maps, rng.random() * cum_maps[-1])]
+        diff = (team1['skill'] + team1['map_bias'][map_name]) - (team2['skill'] + team2['map_bias'][map_name])
+        team1_won = rng.random() < 1.0 / (1.0 + math.exp(-1.2 * diff))
+        played_at = start + timedelta(seconds=step * i + rng.uniform(0, step))
+        winner_rounds, loser_rounds = _round_score(rng, played_at, diff)
+
+        yield {
+            'id': id_offset + i + 1,
+            'team1': team1,
+            'team2': team2,
+            'winner_id': team1['id'] if team1_won else team2['id'],
+            'team1_score': winner_rounds if team1_won else loser_rounds,
+            'team2_score': loser_rounds if team1_won else winner_rounds,
+            'played_at': played_at,
+            'map_name': map_name,
+            'event_name': f"Synthetic Series {i // matches_per_event + 1}",
+        }
+
+
+def _raw_payload(match):
+    """Compact imitation of a PandaScore /matches/past item."""
+    return json.dumps({
+        'id': match['id'],
+        'status': 'finished',
+        'match_type': 'best_of_1',
+        'scheduled_at': match['played_at'].isoformat(),
+        'winner_id': match['winner_id'],
+        'opponents': [
+            {'opponent': {'id': match['team1']['id'], 'name': match['team1']['name'], 'acronym': match['team1']['acronym']}},
+            {'opponent': {'id': match['team2']['id'], 'name': match['team2']['name'], 'acronym': match['team2']['acronym']}},
+        ],
+        'results': [
+            {'team_id': match['team1']['id'], 'score': match['team1_score']},
+            {'team_id': match['team2']['id'], 'score': match['team2_score']},
+        ],
+        'games': [{'position': 1, 'map': {'name': match['map_name']}, 'winner': {'id': match['winner_id']}}],
+        'tournament': {'name': match['event_name']},
+    }, separators=(',', ':'))
+
+
+def _copy_rows(cur, table, columns, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def load(conn, teams, matches, batch_size, with_raw_data):
+    """COPY teams and matches in batches, returning the number of matches loaded."""
+    with conn.cursor() as cur:
+        _copy_rows(cur, 'teams', ('id', 'name', 'acronym', 'image_url'),
+                   ((t['id'], t['name'], t['acronym'], t['image_url']) for t in teams))
+        conn.commit()
+        print(f"loaded {len(teams)} teams")
+
+        columns = ('id', 'team1_id', 'team2_id', 'winner_id', 'team1_score', 'team2_score',
+                   'played_at', 'map_name', 'event_name', 'raw_data')
+        loaded = 0
+        batch = []
+        started = time.monotonic()
+        for match in matches:
+            batch.append((
+                match['id'], match['team1']['id'], match['team2']['id'], match['winner_id'],
+                match['team1_score'], match['team2_score'], match['played_at'].isoformat(),
+                match['map_name'], match['event_name'],
+                _raw_payload(match) if with_raw_data else None,
+            ))
+            if len(batch) >= batch_size:
+                _copy_rows(cur, 'historical_matches', columns, batch)
+                conn.commit()
+                loaded += len(batch)
+                batch = []
+                elapsed = time.monotonic() - started
+                print(f"loaded {loaded} matches ({loaded / elapsed:,.0f} rows/s)")
+        if batch:
+            _copy_rows(cur, 'historical_matches', columns, batch)
+            conn.commit()
+            loaded += len(batch)
+    return loaded
+
+
+def rebuild_team_stats(conn, team_ids):
+    """Derives team_stats for the generated teams from historical_matches."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO team_stats
+            (team_id, total_matches, wins, losses, rounds_won, rounds_lost, win_rate, avg_rounds_won)
+            SELECT team_id,
+                   COUNT(*),
+                   SUM(won),
+                   COUNT(*) - SUM(won),
+                   SUM(rounds_won),
+                   SUM(rounds_lost),
+                   ROUND(SUM(won)::numeric / COUNT(*) * 100, 2),
+                   ROUND(SUM(rounds_won)::numeric / COUNT(*), 2)
+            FROM (
+                SELECT team1_id AS team_id, (winner_id = team1_id)::int AS won,
+                       team1_score AS rounds_won, team2_score AS rounds_lost
+                FROM historical_matches WHERE team1_id = ANY(%s)
+                UNION ALL
+                SELECT team2_id, (winner_id = team2_id)::int, team2_score, team1_score
+                FROM historical_matches WHERE team2_id = ANY(%s)
+            ) per_team
+            GROUP BY team_id
+            ON CONFLICT (team_id) DO UPDATE SET
+                total_matches = EXCLUDED.total_matches,
+                wins = EXCLUDED.wins,
+                losses = EXCLUDED.losses,
+                rounds_won = EXCLUDED.rounds_won,
+                rounds_lost = EXCLUDED.rounds_lost,
+                win_rate = EXCLUDED.win_rate,
+                avg_rounds_won = EXCLUDED.avg_rounds_won,
+                last_updated = NOW()
+        """, (team_ids, team_ids))
+    conn.commit()
+
+
+def truncate_synthetic(conn, id_offset):
+    """Removes rows from a previous run with the same id offset."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM historical_matches WHERE id > %s", (id_offset,))
+        cur.execute("DELETE FROM team_stats WHERE team_id > %s", (id_offset,))
+        cur.execute("DELETE FROM teams WHERE id > %s", (id_offset,))
+        cur.execute("DELETE FROM team_pair_stats WHERE team_low > %s", (id_offset,))
+        cur.execute("DELETE FROM team_form WHERE team_id > %s", (id_offset,))
+    conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f"1.0 = {BASE_TEAMS} teams / {BASE_MATCHES} matches")
+    parser.add_argument('--years', type=int, default=5, help="history length ending at --end")
+    parser.add_argument('--end', default=DEFAULT_END,
+                        help="ISO date the history ends at (default %(default)s); use a past date, "
+                             "analysis queries only read matches played before now")
+    parser.add_argument('--id-offset', type=int, default=900000000,
+                        help="synthetic ids start above this value to avoid real PandaScore ids")
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--no-raw-data', action='store_true', help="leave raw_data NULL")
+    parser.add_argument('--truncate', action='store_true', help="delete a previous synthetic run first")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        raise ValueError("DATABASE_URL environment variable or --database-url is required")
+
+    rng = random.Random(args.seed)
+    n_teams = max(2, int(BASE_TEAMS * args.scale))
+    n_matches = max(1, int(BASE_MATCHES * args.scale))
+    end = datetime.fromisoformat(args.end)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    print(f"generating seed={args.seed} scale={args.scale} end={end.date()}: {n_teams} teams, {n_matches} matches")
+
+    teams = generate_teams(rng, n_teams, args.id_offset)
+    matches = generate_matches(rng, teams, n_matches, args.id_offset, args.years, end)
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.truncate:
+            truncate_synthetic(conn, args.id_offset)
+        started = time.monotonic()
+        loaded = load(conn, sorted(teams, key=lambda t: t['id']), matches,
+                      args.batch_size, not args.no_raw_data)
+        rebuild_team_stats(conn, [t['id'] for t in teams])
+        with conn.cursor() as cur:
+            # COPY bypasses ingest, so the pair aggregates and form state are rebuilt here
+            pair_stats.rebuild(cur)
+            team_form.rebuild(cur)
+        conn.commit()
+
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for table in ('teams', 'team_stats', 'historical_matches', 'team_pair_stats', 'team_form'):
+                cur.execute(f"ANALYZE {table}")
+        print(f"done: {loaded} matches in {time.monotonic() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""Local PandaScore stub with fault injection, for exercising the client's
+retries, Retry-After handling, circuit breaker, last-value fallback,
+deadlines, hedging and quota scheduling without touching the real API.
+
+Serves canned /csgo/matches/running, /csgo/matches/{id}/stats,
+/csgo/matches/past, /csgo/teams and /csgo/teams/{id} responses with
+X-Rate-Limit-Limit / X-Rate-Limit-Remaining headers counting down from
+--quota. Faults are injected at random rates (serve mode) or scripted per
+scenario (--check).
+
+Usage (from the repository root):
+
+    # run the live endpoints against a degraded API
+    python -m scripts.pandascore_stub --port 8765 --error-rate 0.2 --slow-rate 0.1 --rate-limit-rate 0.05 --quota 200
+    PANDASCORE_BASE_URL=http://127.0.0.1:8765 python -m server
+
+    # scripted scenarios against PandaScoreClient.get_json, exits 1 on failure
+    python -m scripts.pandascore_stub --check
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from api.services import metrics, pandascore, quota
+from api.services.resilience import Deadline
+
+
+class Faults:
+    """Random fault rates plus scripted one-shot faults (consumed in order)."""
+
+    def __init__(self, error_rate=0.0, slow_rate=0.0, rate_limit_rate=0.0, slow_delay=5.0, retry_after=1,
+                 quota_limit=1000):
+        self.quota_limit = quota_limit
+        self.quota_remaining = quota_limit
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_delay = slow_delay
+        self.retry_after = retry_after
+        self.script = []  # 'error' | 'slow' | 'rate_limit' | 'ok'
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        with self._lock:
+            self.requests += 1
+            self.quota_remaining = max(0, self.quota_remaining - 1)
+            if self.script:
+                return self.script.pop(0)
+        roll = random.random()
+        if roll < self.error_rate:
+            return 'error'
+        if roll < self.error_rate + self.rate_limit_rate:
+            return 'rate_limit'
+        if roll < self.error_rate + self.rate_limit_rate + self.slow_rate:
+            return 'slow'
+        return 'ok'
+
+
+def _team(team_id):
+    return {'id': team_id, 'name': f'Team {team_id}', 'acronym': f'T{team_id}', 'image_url': None}
+
+
+def _match(match_id, status='running'):
+    return {
+        'id': match_id,
+        'status': status,
+        'scheduled_at': '2024-01-01T18:00:00Z',
+        'winner_id': 1 if status == 'finished' else None,
+        'results': [{'team_id': 1, 'score': 1}, {'team_id': 2, 'score': 0}],
+        'opponents': [{'opponent': _team(1)}, {'opponent': _team(2)}],
+        'tournament': {'name': 'Stub Cup'},
+    }
+
+
+def _stats(match_id):
+    return {
+        'id': match_id,
+        'current_round': 17,
+        'map': {'name': 'de_mirage'},
+        'teams': [{'id': 1, 'round_score': 9, 'side': 'ct'}, {'id': 2, 'round_score': 7, 'side': 't'}],
+        'players': [],
+    }
+
+
+ROUTES = [
+    (re.compile(r'^/csgo/matches/running$'), lambda m: [_match(1000 + i) for i in range(5)]),
+    (re.compile(r'^/csgo/matches/past$'), lambda m: [_match(2000 + i, 'finished') for i in range(5)]),
+    (re.compile(r'^/csgo/matches/(\d+)/stats$'), lambda m: _stats(int(m.group(1)))),
+    (re.compile(r'^/csgo/teams$'), lambda m: [_team(i) for i in range(1, 11)]),
+    (re.compile(r'^/csgo/teams/(\d+)$'), lambda m: _team(int(m.group(1)))),
+]
+
+
+def make_handler(faults: Faults):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, headers=()):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('X-Rate-Limit-Limit', str(faults.quota_limit))
+            self.send_header('X-Rate-Limit-Remaining', str(faults.quota_remaining))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client gave up on a stalled response
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            for pattern, build in ROUTES:
+                match = pattern.match(path)
+                if match:
+                    break
+            else:
+                self._send(404, {'error': 'Not found'})
+                return
+
+            fault = faults.next()
+            if faults.quota_remaining == 0 and fault == 'ok':
+                fault = 'rate_limit'
+            if fault == 'error':
+                self._send(503, {'error': 'injected'})
+                return
+            if fault == 'rate_limit':
+                self._send(429, {'error': 'Too many requests'}, [('Retry-After', str(faults.retry_after))])
+                return
+            if fault == 'slow':
+                time.sleep(faults.slow_delay)
+            self._send(200, build(match))
+
+    return StubHandler
+
+
+def start(faults: Faults, host='127.0.0.1', port=0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(faults))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _metric(counter, *labels):
+    return counter._values.get(labels, 0)
+
+
+def run_checks(faults: Faults) -> bool:
+    """Scripted scenarios; each resets the client state it relies on."""
+    client = pandascore.PandaScoreClient('stub-key')
+    endpoint = 'csgo.matches.id.stats'
+    results = []
+
+    def check(name, ok, detail):
+        results.append(ok)
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+
+    def reset(script=()):
+        pandascore._breakers.clear()
+        pandascore._last_values.clear()
+        faults.script = list(script)
+        faults.quota_remaining = faults.quota_limit
+        quota.SCHEDULER = quota.QuotaScheduler()
+
+    # 1. Transient 5xx is retried
+    reset(['error', 'error', 'ok'])
+    started = time.monotonic()
+    body = client.get_json('/csgo/matches/1/stats', retries=3)
+    check('retry 5xx', body['id'] == 1, f"succeeded after 2 errors in {time.monotonic() - started:.2f}s")
+
+    # 2. 429 waits at least Retry-After
+    faults.retry_after = 1
+    reset(['rate_limit', 'ok'])
+    started = time.monotonic()
+    client.get_json('/csgo/matches/2/stats')
+    waited = time.monotonic() - started
+    check('Retry-After', waited >= 1.0, f"second attempt after {waited:.2f}s (Retry-After: 1)")
+
+    # 3. Slow call is cut by the per-call timeout, the retry succeeds
+    faults.slow_delay = 3.0
+    reset(['slow', 'ok'])
+    started = time.monotonic()
+    client.get_json('/csgo/matches/3/stats', timeout=0.5)
+    elapsed = time.monotonic() - started
+    check('call timeout', elapsed < 2.0, f"{elapsed:.2f}s with a 3s stall and timeout=0.5")
+
+    # 4. Cycle deadline bounds the total time, last value is served
+    reset(['ok'])
+    client.get_json('/csgo/matches/4/stats')
+    faults.script = ['slow'] * 5
+    started = time.monotonic()
+    body = client.get_json('/csgo/matches/4/stats', deadline=Deadline(1.0))
+    elapsed = time.monotonic() - started
+    check('cycle deadline', elapsed < 1.5 and body['id'] == 4, f"returned the cached body after {elapsed:.2f}s")
+
+    # 5. Outage opens the breaker; cached value served without calling out
+    reset(['ok'])
+    client.get_json('/csgo/matches/5/stats')
+    faults.script = ['error'] * pandascore.BREAKER_THRESHOLD
+    stale_before = _metric(metrics.PANDASCORE_STALE_SERVED, endpoint)
+    client.get_json('/csgo/matches/5/stats', retries=pandascore.BREAKER_THRESHOLD)
+    breaker = pandascore.circuit_breaker(endpoint)
+    calls_before = faults.requests
+    body = client.get_json('/csgo/matches/5/stats')
+    check('circuit breaker', breaker.state == breaker.OPEN and faults.requests == calls_before and body['id'] == 5,
+          f"state={breaker.state}, stale served "
+          f"{_metric(metrics.PANDASCORE_STALE_SERVED, endpoint) - stale_before} times, no upstream call while open")
+
+    # 6. Breaker closes after a successful trial call
+    breaker.reset_after = 0.2
+    time.sleep(0.3)
+    client.get_json('/csgo/matches/5/stats')
+    check('half-open recovery', breaker.state == breaker.CLOSED, f"state={breaker.state}")
+
+    # 7. No cached value: the error surfaces
+    reset(['error'] * 10)
+    try:
+        client.get_json('/csgo/matches/6/stats', retries=1)
+        check('no fallback', False, "expected PandaScoreError")
+    except pandascore.PandaScoreError as e:
+        check('no fallback', e.status == 503, str(e))
+
+    # 8. Hedging: a stalled primary is overtaken by the duplicate
+    faults.slow_delay = 2.0
+    reset(['slow', 'ok'])
+    started = time.monotonic()
+    client.get_json('/csgo/matches/7/stats', hedge_after=0.2)
+    elapsed = time.monotonic() - started
+    check('hedging', elapsed < 1.0 and _metric(metrics.PANDASCORE_HEDGES, endpoint, 'hedge') >= 1,
+          f"{elapsed:.2f}s with a 2s stall, hedge after 0.2s")
+
+    # 9. 4xx is not retried
+    reset()
+    calls_before = faults.requests
+    try:
+        client.get_json('/csgo/unknown')
+    except pandascore.PandaScoreError as e:
+        check('4xx not retried', e.status == 404 and faults.requests == calls_before,
+              f"HTTP {e.status} after one call")
+
+    # 10. Low budget: team stats are deferred, live still goes out
+    reset()
+    faults.quota_remaining = 101  # 100 after the next call, below team_stats' 15% reserve
+    live = pandascore.PandaScoreClient('stub-key', priority=quota.LIVE)
+    teams = pandascore.PandaScoreClient('stub-key', priority=quota.TEAM_STATS)
+    live.get_json('/csgo/matches/running')
+    quota.SCHEDULER.max_wait = dict(quota.MAX_WAIT, team_stats=0.2)
+    calls_before = faults.requests
+    try:
+        teams.get_json('/csgo/teams/1', stale_ok=False)
+        check('quota reserve', False, "team_stats call was admitted")
+    except quota.QuotaDeferred as e:
+        live.get_json('/csgo/matches/1/stats')
+        check('quota reserve', faults.requests == calls_before + 1,
+              f"team_stats deferred ({e}); live admitted; budget {quota.SCHEDULER.snapshot()}")
+
+    # 11. Queue drains by priority: with one slot, waiting live calls overtake backfill
+    reset()
+    quota.SCHEDULER.max_in_flight = 1
+    faults.slow_delay = 0.3
+    faults.script = ['slow'] + ['ok'] * 6
+    order = []
+
+    def call(priority, path):
+        pandascore.PandaScoreClient('stub-key', priority=priority).get(path)
+        order.append(priority)
+
+    blocker = threading.Thread(target=call, args=(quota.BACKFILL, '/csgo/teams'))
+    blocker.start()
+    time.sleep(0.1)
+    waiters = [threading.Thread(target=call, args=(p, '/csgo/teams'))
+               for p in (quota.BACKFILL, quota.BACKFILL, quota.TEAM_STATS, quota.LIVE, quota.UPCOMING)]
+    for t in waiters:
+        t.start()
+        time.sleep(0.02)
+    depth = quota.SCHEDULER.snapshot()['queue']
+    for t in [blocker] + waiters:
+        t.join()
+    expected = [quota.BACKFILL, quota.LIVE, quota.UPCOMING, quota.TEAM_STATS, quota.BACKFILL, quota.BACKFILL]
+    check('priority order', order == expected, f"queue while blocked {depth}; served {order}")
+
+    # 12. A half-open trial answered with 429 (or skipped for an expired
+    # deadline) is handed back; the next call gets to try and closes the breaker
+    reset(['error'] * pandascore.BREAKER_THRESHOLD + ['rate_limit'] + ['ok'] * 3)
+    faults.retry_after = 0
+    try:
+        client.get_json('/csgo/matches/8/stats', retries=pandascore.BREAKER_THRESHOLD - 1, stale_ok=False)
+    except pandascore.PandaScoreError:
+        pass
+    breaker = pandascore.circuit_breaker(endpoint)
+    breaker.reset_after = 0.1
+    time.sleep(0.2)
+    try:
+        client.get_json('/csgo/matches/8/stats', retries=0, stale_ok=False)
+    except pandascore.PandaScoreError:
+        pass
+    expired = Deadline(0.0)
+    try:
+        client.get_json('/csgo/matches/8/stats', deadline=expired, stale_ok=False)
+    except pandascore.PandaScoreError:
+        pass
+    calls_before = faults.requests
+    body = client.get_json('/csgo/matches/8/stats', retries=0, stale_ok=False)
+    check('half-open trial released', breaker.state == breaker.CLOSED and faults.requests == calls_before + 1
+          and body['id'] == 8, f"state={breaker.state} after a 429 trial and an expired deadline")
+
+    # 13. A quota deferral during the half-open trial does not lock the breaker
+    reset(['error'] * pandascore.BREAKER_THRESHOLD + ['ok'] * 3)
+    try:
+        client.get_json('/csgo/matches/9/stats', retries=pandascore.BREAKER_THRESHOLD - 1, stale_ok=False)
+    except pandascore.PandaScoreError:
+        pass
+    breaker = pandascore.circuit_breaker(endpoint)
+    breaker.reset_after = 0.1
+    time.sleep(0.2)
+    faults.quota_remaining = 101
+    live.get_json('/csgo/matches/running')
+    quota.SCHEDULER.max_wait = dict(quota.MAX_WAIT, team_stats=0.2)
+    try:
+        teams.get_json('/csgo/matches/9/stats', stale_ok=False)
+    except quota.QuotaDeferred:
+        pass
+    calls_before = faults.requests
+    body = live.get_json('/csgo/matches/9/stats', retries=0, stale_ok=False)
+    check('deferred trial released', breaker.state == breaker.CLOSED and faults.requests == calls_before + 1
+          and body['id'] == 9, f"state={breaker.state} after a deferred team_stats trial")
+
+    # 14. Hedging: a fast 503 from the duplicate does not beat a slower 200
+    faults.slow_delay = 0.6
+    reset(['slow', 'error'])
+    body = client.get_json('/csgo/matches/10/stats', retries=0, hedge_after=0.2, stale_ok=False)
+    breaker = pandascore.circuit_breaker(endpoint)
+    check('hedge ignores errors', body['id'] == 10 and breaker.state == breaker.CLOSED,
+          "slow 200 from the primary kept over the hedge's 503")
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    return all(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share answered with 429")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="share delayed by --slow-delay")
+    parser.add_argument('--slow-delay', type=float, default=5.0)
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After sent with 429")
+    parser.add_argument('--quota', type=int, default=1000, help="quota reported in X-Rate-Limit-* (429 once spent)")
+    parser.add_argument('--check', action='store_true', help="run the scripted client checks and exit")
+    args = parser.parse_args(argv)
+
+    faults = Faults(args.error_rate, args.slow_rate, args.rate_limit_rate, args.slow_delay, args.retry_after,
+                    args.quota)
+    if args.check:
+        server = start(faults)
+        pandascore.BASE_URL = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            ok = run_checks(faults)
+        finally:
+            server.shutdown()
+        sys.exit(0 if ok else 1)
+
+    server = start(faults, args.host, args.port)
+    print(f"PandaScore stub on http://{args.host}:{args.port} "
+          f"(errors {args.error_rate:.0%}, 429 {args.rate_limit_rate:.0%}, slow {args.slow_rate:.0%})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
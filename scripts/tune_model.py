@@ -0,0 +1,167 @@
+"""Hyperparameter search for the prediction model coefficients and windows.
+
+Loads historical_matches once, computes the point-in-time features once
+per (form_window, h2h_window) pair, then scores the candidates on a
+process pool. The workers inherit the feature arrays from this process
+(pool initializer; with the default fork start method nothing is copied
+or reloaded). The best candidate is written to prediction_models as a new
+version, which PredictionModel / PREDICTION_MODEL can then select by name.
+
+Usage (from the repository root, after migrations/run_migrations.py):
+
+    python -m scripts.tune_model --random 200 --workers 4
+    python -m scripts.tune_model --grid --since 2023-01-01 --metric brier
+    python -m scripts.tune_model --random 50 --dry-run
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from api.services import backtest, prediction
+from api.services.db import connect, connect_read
+
+GRID = {
+    'win_rate_scale': [10.0, 20.0, 40.0],
+    'form_weight': [0.4, 0.8, 1.2],
+    'diff_weight': [0.05, 0.15, 0.3],
+    'h2h_weight': [0.25, 0.5, 1.0],
+    'slope': [0.2, 0.3, 0.4, 0.6],
+    'form_window': [3, 5, 10],
+    'h2h_window': [3, 5],
+}
+
+# Random search: (low, high) floats or a list of choices
+RANGES = {
+    'win_rate_scale': (5.0, 60.0),
+    'form_weight': (0.0, 2.0),
+    'diff_weight': (0.0, 0.5),
+    'h2h_weight': (0.0, 1.5),
+    'slope': (0.1, 1.0),
+    'form_window': [3, 5, 7, 10],
+    'h2h_window': [3, 5, 7, 10],
+}
+
+# Whether a larger value of the metric is better
+HIGHER_IS_BETTER = {'accuracy': True, 'log_loss': False, 'brier': False}
+
+# Set in the workers by _init_worker
+_shared = None
+
+
+def grid_candidates():
+    keys = list(GRID)
+    for values in itertools.product(*(GRID[k] for k in keys)):
+        yield dict(prediction.DEFAULT_PARAMS, **dict(zip(keys, values)))
+
+
+def random_candidates(n, seed):
+    rng = random.Random(seed)
+    for _ in range(n):
+        params = dict(prediction.DEFAULT_PARAMS)
+        for key, space in RANGES.items():
+            params[key] = rng.choice(space) if isinstance(space, list) else round(rng.uniform(*space), 4)
+        yield params
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _evaluate(params):
+    features = _shared['features'][(params['form_window'], params['h2h_window'])]
+    probs = backtest.score(features, params)
+    return params, backtest.evaluate(probs, _shared['labels'], _shared['mask'], _shared['buckets'])
+
+
+def _sort_key(metric):
+    sign = -1 if HIGHER_IS_BETTER[metric] else 1
+    return lambda result: sign * result[1][metric]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    search = parser.add_mutually_exclusive_group()
+    search.add_argument('--grid', action='store_true', help="evaluate the full GRID")
+    search.add_argument('--random', type=int, default=100, help="number of random candidates (default 100)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--metric', choices=sorted(HIGHER_IS_BETTER), default='log_loss')
+    parser.add_argument('--since', help="only score matches from this date (earlier ones are warm-up)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--buckets', type=int, default=10)
+    parser.add_argument('--name', help="model version to write (default: next heuristic_vN)")
+    parser.add_argument('--top', type=int, default=5, help="candidates to print")
+    parser.add_argument('--dry-run', action='store_true', help="do not write prediction_models")
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        raise ValueError("DATABASE_URL is required")
+
+    since_epoch = None
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        since_epoch = (since if since.tzinfo else since.replace(tzinfo=timezone.utc)).timestamp()
+
+    started = time.perf_counter()
+    with connect_read(args.database_url) as conn:
+        history = backtest.MatchHistory.load(conn)
+    print(f"loaded {len(history)} matches in {time.perf_counter() - started:.1f}s")
+    if not len(history):
+        raise ValueError("historical_matches is empty")
+
+    candidates = list(grid_candidates() if args.grid else random_candidates(args.random, args.seed))
+    candidates.append(dict(prediction.DEFAULT_PARAMS))  # the current model, for reference
+
+    started = time.perf_counter()
+    windows = sorted({(c['form_window'], c['h2h_window']) for c in candidates})
+    shared = {
+        'features': {w: backtest.compute_features(history, *w) for w in windows},
+        'labels': history.labels(),
+        'mask': backtest.since_mask(history, since_epoch),
+        'buckets': args.buckets,
+    }
+    print(f"features for {len(windows)} window pairs in {time.perf_counter() - started:.1f}s")
+    # evaluate() reports only {'matches': 0} without a scored match, nothing to rank
+    mask = shared['mask']
+    if not any(y != backtest.NO_RESULT and (mask is None or mask[i]) for i, y in enumerate(shared['labels'])):
+        raise ValueError(f"no finished matches to score{f' since {args.since}' if args.since else ''}")
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(shared,)) as pool:
+        results = pool.map(_evaluate, candidates, chunksize=max(1, len(candidates) // (args.workers * 4)))
+    elapsed = time.perf_counter() - started
+    print(f"scored {len(candidates)} candidates on {args.workers} workers in {elapsed:.1f}s")
+
+    baseline = results.pop()[1]
+    results.sort(key=_sort_key(args.metric))
+    for params, report in results[:args.top]:
+        coefficients = {k: params[k] for k in GRID}
+        print(f"{args.metric}={report[args.metric]:.4f} accuracy={report['accuracy']:.4f} "
+              f"brier={report['brier']:.4f} {coefficients}")
+    best_params, best = results[0]
+    print(f"{prediction.MODEL_NAME}: {args.metric}={baseline[args.metric]:.4f} "
+          f"accuracy={baseline['accuracy']:.4f} brier={baseline['brier']:.4f}")
+
+    if args.dry_run:
+        return
+    with connect(args.database_url) as conn:
+        with conn.cursor() as cur:
+            name = args.name or prediction.next_model_name(cur)
+            prediction.save_model(cur, name, best_params, best, {
+                'method': 'grid' if args.grid else 'random',
+                'candidates': len(candidates) - 1,
+                'seed': None if args.grid else args.seed,
+                'metric': args.metric,
+                'since': args.since,
+                'matches': len(history),
+                'baseline': {k: baseline[k] for k in ('accuracy', 'log_loss', 'brier')},
+            })
+    print(f"saved {name}; select it with PREDICTION_MODEL={name} or /api/predict?model={name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Replays signed webhook events against /api/webhooks.
+
+Events come from an NDJSON file (one event body per line, e.g. captured
+deliveries) or are generated: --synthetic N builds N successive updates of
+one running match (score, round, player stats, increasing modified_at).
+Each event is signed like the sender does (see api/services/webhooks.py);
+--duplicate-rate re-sends a share of them, --shuffle delivers them out of
+order and --tamper adds one delivery with a wrong signature.
+
+The replayer checks the receiver's answers: a first delivery must not be
+reported as duplicate, a re-delivery must be, and a tampered one must get
+401. It prints the results per status and exits 1 on a mismatch.
+
+Usage (from the repository root, with the server running):
+
+    WEBHOOK_SECRET=dev python -m server --port 8000
+    python -m scripts.webhook_replay --url http://127.0.0.1:8000/api/webhooks --secret dev \\
+        --synthetic 20 --duplicate-rate 0.3 --shuffle --tamper
+    python -m scripts.webhook_replay --secret dev --file captured.ndjson
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from api.services import webhooks
+
+
+def synthetic_events(count, match_id=900001, seed=0):
+    rng = random.Random(seed)
+    started = datetime.now(timezone.utc) - timedelta(minutes=count)
+    scores = [0, 0]
+    players = [{'id': match_id * 10 + i, 'name': f'player{i}', 'kills': 0, 'deaths': 0} for i in range(10)]
+    events = []
+    for n in range(count):
+        scores[rng.randrange(2)] += 1
+        for player in rng.sample(players, 3):
+            player['kills'] += 1
+        for player in rng.sample(players, 3):
+            player['deaths'] += 1
+        match = {
+            'id': match_id,
+            'status': 'running' if n < count - 1 else 'finished',
+            'modified_at': (started + timedelta(minutes=n)).isoformat(),
+            'results': [{'score': scores[0]}, {'score': scores[1]}],
+            'opponents': [{'opponent': {'id': 1, 'name': 'Replay A'}}, {'opponent': {'id': 2, 'name': 'Replay B'}}],
+        }
+        events.append({
+            'id': f'replay-{match_id}-{n}',
+            'type': 'match',
+            'event_type': 'update',
+            'object': match,
+            'stats': {
+                'current_round': sum(scores) + 1,
+                'map': {'name': 'de_inferno'},
+                'players': [dict(p) for p in players],
+            },
+        })
+    return events
+
+
+def load_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def deliver(session, url, secret, body, timestamp=None):
+    timestamp = str(int(time.time() if timestamp is None else timestamp))
+    response = session.post(url, data=body, timeout=30, headers={
+        'Content-Type': 'application/json',
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Signature': webhooks.sign(secret, timestamp, body),
+    })
+    try:
+        status = response.json().get('status')
+    except ValueError:
+        status = None
+    return response.status_code, status or f'http_{response.status_code}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api/webhooks')
+    parser.add_argument('--secret', required=True, help="one of the receiver's WEBHOOK_SECRET values")
+    parser.add_argument('--file', help="NDJSON file with one event per line")
+    parser.add_argument('--synthetic', type=int, default=0, help="generate N updates of one match")
+    parser.add_argument('--match-id', type=int, default=900001, help="match id of the synthetic events")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help="share of events delivered twice")
+    parser.add_argument('--shuffle', action='store_true', help="deliver in random order")
+    parser.add_argument('--tamper', action='store_true', help="also send one delivery with a bad signature")
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds between deliveries")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.file:
+        events = load_events(args.file)
+    elif args.synthetic:
+        events = synthetic_events(args.synthetic, args.match_id, args.seed)
+    else:
+        parser.error("one of --file or --synthetic is required")
+
+    rng = random.Random(args.seed)
+    deliveries = [(event, False) for event in events]
+    deliveries += [(event, True) for event in events if rng.random() < args.duplicate_rate]
+    if args.shuffle:
+        rng.shuffle(deliveries)
+    else:
+        # Re-deliveries still come after the original
+        deliveries.sort(key=lambda d: d[1])
+
+    session = requests.Session()
+    results = Counter()
+    mismatches = []
+    delivered = set()
+    for event, _ in deliveries:
+        body = json.dumps(event).encode()
+        code, status = deliver(session, args.url, args.secret, body)
+        results[status] += 1
+        event_id = str(event.get('id'))
+        # With --shuffle the copy may arrive first; whichever comes second is the duplicate
+        expected_duplicate = event_id in delivered
+        delivered.add(event_id)
+        if code == 200 and (status == 'duplicate') != expected_duplicate:
+            mismatches.append(f"{event_id}: {status} (expected {'duplicate' if expected_duplicate else 'first delivery'})")
+        elif code != 200:
+            mismatches.append(f"{event_id}: HTTP {code}")
+        if args.delay:
+            time.sleep(args.delay)
+
+    if args.tamper and events:
+        body = json.dumps(events[0]).encode()
+        code, status = deliver(session, args.url, args.secret + '-wrong', body)
+        results['tampered'] += 1
+        if code != 401:
+            mismatches.append(f"tampered delivery: HTTP {code}, expected 401")
+
+    print(f"{len(deliveries)} deliveries of {len(events)} events to {args.url}")
+    for status, count in sorted(results.items()):
+        print(f"  {status:<12} {count}")
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
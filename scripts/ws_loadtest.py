@@ -0,0 +1,166 @@
+"""Load test for the WebSocket broadcaster: N subscribers, M messages.
+
+Opens `--subscribers` Pusher-protocol WebSocket clients on the `matches`
+channel (spread over `--client-procs` processes so the clients do not
+compete with the broadcaster for one event loop), publishes `--messages`
+list-update events and reports delivered messages per second, fan-out
+time per publish and subscribers dropped as slow consumers.
+
+Without --port a broadcaster is started in this process on an ephemeral
+port and events are published to it directly. With --port the events go
+to an already running broadcaster via POST /publish.
+
+Usage (from the repository root):
+
+    python -m scripts.ws_loadtest --subscribers 10000 --messages 200
+    python -m scripts.ws_loadtest --port 8001 --subscribers 10000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+
+from api.services import broadcast
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = min(hard, max(soft, needed))
+    if target > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return target
+
+
+async def open_client(host, port, channel):
+    reader, writer = await asyncio.open_connection(host, port, limit=2 ** 20)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f'GET /app/loadtest?protocol=7 HTTP/1.1\r\nHost: {host}:{port}\r\n'
+                  'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                  f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n').encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    if not head.startswith(b'HTTP/1.1 101'):
+        raise RuntimeError(head.decode('latin-1').splitlines()[0])
+    await broadcast.read_frame(reader)  # pusher:connection_established
+    subscribe = json.dumps({'event': 'pusher:subscribe', 'data': {'channel': channel}}).encode()
+    writer.write(broadcast.encode_frame(subscribe, mask=os.urandom(4)))
+    await broadcast.read_frame(reader)  # pusher_internal:subscription_succeeded
+    return reader, writer
+
+
+async def consume(reader, counter, messages):
+    received = 0
+    try:
+        while received < messages:
+            _, opcode, _ = await broadcast.read_frame(reader)
+            if opcode == broadcast.OP_TEXT:
+                received += 1
+                counter['received'] += 1
+                counter['last_at'] = time.time()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        counter['disconnected'] += 1
+
+
+async def run_clients(host, port, count, messages, connect_concurrency, timeout, ready, results):
+    raise_fd_limit(count + 100)
+    semaphore = asyncio.Semaphore(connect_concurrency)
+
+    async def connect_one():
+        async with semaphore:
+            return await open_client(host, port, 'matches')
+
+    clients = await asyncio.gather(*(connect_one() for _ in range(count)), return_exceptions=True)
+    connected = [c for c in clients if not isinstance(c, BaseException)]
+    counter = {'received': 0, 'disconnected': 0, 'last_at': None}
+    consumers = [asyncio.ensure_future(consume(reader, counter, messages)) for reader, _ in connected]
+    ready.put(len(connected))
+    await asyncio.wait(consumers, timeout=timeout)
+    results.put(counter)
+    for _, writer in connected:
+        writer.transport.abort()
+
+
+def client_process(*args):
+    asyncio.run(run_clients(*args))
+
+
+async def run(args):
+    server = None
+    host, port = args.host, args.port
+    if port is None:
+        raise_fd_limit(args.subscribers + 100)
+        server = broadcast.Broadcaster('127.0.0.1', 0)
+        await server.start()
+        host, port = '127.0.0.1', server.server.sockets[0].getsockname()[1]
+    loop = asyncio.get_running_loop()
+
+    ready, results = multiprocessing.Queue(), multiprocessing.Queue()
+    share = [args.subscribers // args.client_procs + (i < args.subscribers % args.client_procs)
+             for i in range(args.client_procs)]
+    processes = [multiprocessing.Process(target=client_process, daemon=True, args=(
+        host, port, n, args.messages, args.connect_concurrency, args.drain_timeout + 60, ready, results))
+        for n in share if n]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    # Keep this loop free to accept connections while the clients connect
+    connected = 0
+    for _ in processes:
+        connected += await loop.run_in_executor(None, ready.get)
+    print(f"connected {connected} / {args.subscribers} subscribers in {time.perf_counter() - started:.1f}s")
+
+    payload = {'matches': [{'match_id': i, 'pad': 'x' * max(args.payload_bytes // 10, 1)} for i in range(10)]}
+    publisher = None if server else broadcast.HttpPublisher(f'http://{host}:{port}')
+    fanout = []
+    published_at = time.time()
+    for i in range(args.messages):
+        data = dict(payload, seq=i, timestamp=time.time())
+        if server:
+            t = time.perf_counter()
+            server.publish('matches', 'list-update', data)
+            fanout.append(time.perf_counter() - t)
+        else:
+            await loop.run_in_executor(
+                None, publisher.publish, [{'channel': 'matches', 'event': 'list-update', 'data': data}])
+        await asyncio.sleep(args.interval)
+
+    counters = [await loop.run_in_executor(None, results.get) for _ in processes]
+    received = sum(c['received'] for c in counters)
+    dropped = sum(c['disconnected'] for c in counters)
+    last_at = max((c['last_at'] for c in counters if c['last_at']), default=time.time())
+    elapsed = max(last_at - published_at, 1e-9)
+    expected = connected * args.messages
+
+    print(f"published {args.messages} messages to {connected} subscribers")
+    print(f"delivered {received} / {expected} ({received / elapsed:,.0f} msgs/s over {elapsed:.2f}s)")
+    if fanout:
+        print(f"fan-out per publish: median {statistics.median(fanout) * 1000:.2f}ms, "
+              f"max {max(fanout) * 1000:.2f}ms")
+    print(f"subscribers dropped as slow consumers: {dropped}")
+
+    for process in processes:
+        process.join(timeout=10)
+    if server:
+        await server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="external broadcaster (default: in-process)")
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--payload-bytes', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.005, help="seconds between publishes")
+    parser.add_argument('--client-procs', type=int, default=max(os.cpu_count() - 1, 1))
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--drain-timeout', type=float, default=60.0)
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
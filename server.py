@@ -0,0 +1,427 @@
+"""Single-process ASGI server hosting every api/*.py endpoint.
+
+Self-hosted alternative to the Vercel deployment. Routes follow Vercel's
+file-based routing (/api -> api/index.py, /api/<name> -> api/<name>.py) and
+the response headers configured in vercel.json. Unlike the serverless
+functions, the process keeps its state between requests:
+
+- a psycopg2 connection pool that every `db.connect(DATABASE_URL)` call in
+  the handlers draws from,
+- the PandaScore keep-alive HTTP session and all in-process caches/metrics,
+- asyncpg pools serving the DB-only reads (/api/teams and /api/matches
+  listings, /api/analyze, /api/predict without match_id) without tying up a
+  worker thread, when asyncpg is installed; like db.connect_read they prefer
+  a DATABASE_READ_URL replica within the lag limit. /api/matchstats stays
+  threaded: its request coalescing (singleflight) and prediction upserts run
+  on psycopg2,
+- with asyncpg, /api/live/stream (SSE) is served natively: one LISTEN
+  connection feeds an in-process hub that fans each change out to all
+  subscribers of the match,
+- optionally (--ws-port) the Pusher-compatible WebSocket broadcaster
+  (api/services/broadcast.py); the live pipeline then publishes to it
+  in-process.
+
+The existing handler classes run unchanged in a thread pool; they stay the
+Vercel entry points. Usage (from the repository root):
+
+    pip install -r requirements-server.txt
+    python -m server --host 0.0.0.0 --port 8000 --threads 16
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPResponse
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from api.services import db, listing, live_updates, metrics
+from api.services.analysis import AsyncAnalysisService
+from api.services.broadcast import Broadcaster
+from api.services.live_hub import Hub, PostgresListener, match_topic
+from api.services.prediction import AsyncPredictionModel
+
+try:
+    import asyncpg
+except ImportError:  # DB reads then go through the threaded handlers
+    asyncpg = None
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Connection headers describe the in-memory exchange with the handler
+_HOP_BY_HOP = {'connection', 'keep-alive', 'transfer-encoding'}
+
+
+def _vercel_routes() -> List[Dict]:
+    with open(os.path.join(ROOT_DIR, 'vercel.json')) as f:
+        return json.load(f).get('routes', [])
+
+
+def load_routes() -> Dict[str, str]:
+    """Request path -> handler module, mirroring Vercel's api/ routing
+    plus the explicit routes in vercel.json."""
+    routes = {}
+    for filename in sorted(os.listdir(os.path.join(ROOT_DIR, 'api'))):
+        if filename.endswith('.py') and not filename.startswith('_'):
+            name = filename[:-3]
+            routes['/api' if name == 'index' else f'/api/{name}'] = f'api.{name}'
+    for route in _vercel_routes():
+        dest = route.get('dest', '')
+        if dest.startswith('api/') and dest.endswith('.py'):
+            routes[route['src']] = 'api.' + dest[4:-3]
+    return routes
+
+
+def load_route_headers() -> Dict[str, List[Tuple[str, str]]]:
+    """Extra response headers per path from vercel.json."""
+    return {route['src']: list(route.get('headers', {}).items())
+            for route in _vercel_routes() if route.get('headers')}
+
+
+class _ResponseSocket:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def makefile(self, mode, *args, **kwargs):
+        return io.BytesIO(self._data)
+
+
+def call_handler(handler_cls, method: str, target: str, headers: List[Tuple[bytes, bytes]],
+                 body: bytes, client: Tuple[str, int]) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """Runs one request through a BaseHTTPRequestHandler class in memory."""
+    raw = f'{method} {target} HTTP/1.1\r\n'.encode('latin-1')
+    raw += b''.join(name + b': ' + value + b'\r\n' for name, value in headers)
+    raw += b'\r\n' + body
+
+    handler = handler_cls.__new__(handler_cls)
+    handler.request = None
+    handler.client_address = client
+    handler.server = None
+    handler.rfile = io.BytesIO(raw)
+    handler.wfile = io.BytesIO()
+    handler.close_connection = True
+    handler.handle_one_request()
+
+    response = HTTPResponse(_ResponseSocket(handler.wfile.getvalue()), method=method)
+    response.begin()
+    return response.status, response.getheaders(), response.read()
+
+
+async def _init_connection(conn) -> None:
+    # JSONB as Python objects, like psycopg2
+    await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+class ReadPools:
+    """db.connect_read for asyncpg: each query runs on a DATABASE_READ_URL
+    replica pool, round-robin, skipping replicas that are unreachable or lag
+    more than DATABASE_READ_MAX_LAG seconds; otherwise on the primary pool.
+
+    Lag checks share db's per-replica cache with the psycopg2 reads.
+    """
+
+    def __init__(self, primary, replicas: Dict[str, object]):
+        self.primary = primary
+        self.replicas = replicas
+
+    async def pick(self):
+        if not self.replicas:
+            return self.primary
+        reason = 'stale'
+        for url, lag in db.read_candidates():
+            pool = self.replicas[url]
+            if lag is None:
+                try:
+                    lag = db.record_replica_lag(url, float(await pool.fetchval(db.REPLICA_LAG_SQL)))
+                except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError):
+                    db.forget_replica(url)
+                    reason = 'unreachable'
+                    continue
+            if lag <= db.MAX_REPLICA_LAG:
+                metrics.DB_READ_ROUTES.inc(db.replica_name(url), 'fresh')
+                return pool
+        metrics.DB_READ_ROUTES.inc('primary', reason)
+        return self.primary
+
+    async def fetch(self, sql: str, *args):
+        return await (await self.pick()).fetch(sql, *args)
+
+    def named(self) -> List[Tuple[str, object]]:
+        return [('async_read', self.primary)] + [
+            (f'async_replica{i}', pool) for i, pool in enumerate(self.replicas.values())]
+
+    async def close(self) -> None:
+        for _, pool in self.named():
+            await pool.close()
+
+
+class App:
+    """ASGI application; see the module docstring."""
+
+    def __init__(self, database_url: Optional[str] = None, threads: int = 16, read_pool_size: int = 10,
+                 ws_host: str = '0.0.0.0', ws_port: Optional[int] = None):
+        self.database_url = database_url if database_url is not None else os.getenv('DATABASE_URL')
+        self.routes = load_routes()
+        self.route_headers = load_route_headers()
+        self.handlers = {}
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='handler')
+        self.threads = threads
+        self.read_pool_size = read_pool_size
+        self.read_pool = None
+        self.read_pools = None
+        self.listings = None
+        self.analysis = None
+        self.hub = None
+        self.listener = None
+        self.broadcaster = Broadcaster(ws_host, ws_port) if ws_port else None
+
+    def _handler_class(self, path: str):
+        module = self.routes.get(path)
+        if module is None:
+            return None
+        if module not in self.handlers:
+            self.handlers[module] = importlib.import_module(module).handler
+        return self.handlers[module]
+
+    async def startup(self) -> None:
+        if self.broadcaster is not None:
+            await self.broadcaster.start()
+        if not self.database_url:
+            return
+        # One pooled connection per handler thread
+        db.install_pool(self.database_url, maxconn=self.threads)
+        for i, url in enumerate(db.READ_URLS):
+            db.install_pool(url, maxconn=self.threads, name=f'replica{i}')
+        if asyncpg is not None:
+            # Native reads go through the replica lag guard like db.connect_read;
+            # replica pools connect lazily so a down replica does not block startup
+            self.read_pool = await asyncpg.create_pool(self.database_url, min_size=1, max_size=self.read_pool_size,
+                                                       init=_init_connection)
+            replicas = {}
+            for url in db.READ_URLS:
+                replicas[url] = await asyncpg.create_pool(url, min_size=0, max_size=self.read_pool_size,
+                                                          init=_init_connection)
+            self.read_pools = ReadPools(self.read_pool, replicas)
+            self.listings = listing.AsyncListingService(self.read_pools)
+            self.analysis = AsyncAnalysisService(self.read_pools)
+            self.hub = Hub()
+            self.listener = PostgresListener(self.hub, self.database_url, self.read_pool)
+            self.listener.start()
+
+    async def shutdown(self) -> None:
+        if self.broadcaster is not None:
+            await self.broadcaster.stop()
+        if self.listener is not None:
+            await self.listener.stop()
+        if self.read_pools is not None:
+            await self.read_pools.close()
+        db.close_pools()
+        self.executor.shutdown(wait=False)
+
+    def _update_read_pool_gauges(self) -> None:
+        for name, pool in self.read_pools.named():
+            idle = pool.get_idle_size()
+            metrics.DB_POOL_CONNECTIONS.set(idle, name, 'idle')
+            metrics.DB_POOL_CONNECTIONS.set(pool.get_size() - idle, name, 'in_use')
+
+    async def _native_read(self, path: str, query: Dict) -> Optional[Tuple[int, Dict]]:
+        """Serves DB-only reads on the asyncpg pools; None = not handled here
+        (writes, PandaScore refreshes and malformed requests keep the handler's
+        behaviour)."""
+        if self.listings is None:
+            return None
+        try:
+            if path == '/api/teams' and 'team_id' not in query and 'refresh' not in query:
+                read = self.listings.list_teams(**listing.teams_args(query))
+            elif path == '/api/matches':
+                read = self.listings.list_matches(**listing.matches_args(query))
+            else:
+                read = self._native_analysis(path, query)
+                if read is None:
+                    return None
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        try:
+            return 200, await read
+        except ValueError as e:  # includes InvalidCursor and unknown prediction models
+            return 400, {'error': str(e)}
+        finally:
+            self._update_read_pool_gauges()
+
+    def _native_analysis(self, path: str, query: Dict):
+        """Coroutine for /api/analyze and /api/predict (without match_id, which stores)."""
+        try:
+            if path == '/api/analyze' and 'team_id' in query:
+                return self._team_analysis(int(query['team_id'][0]))
+            if path == '/api/analyze' and 'team1_id' in query and 'team2_id' in query:
+                return self.analysis.analyze_teams(int(query['team1_id'][0]), int(query['team2_id'][0]))
+            if path == '/api/predict' and 'match_id' not in query and 'team1_id' in query and 'team2_id' in query:
+                model = AsyncPredictionModel(self.read_pools, query.get('model', [None])[0])
+                return model.predict_match(int(query['team1_id'][0]), int(query['team2_id'][0]))
+        except ValueError:  # the handler reports bad ids
+            return None
+        return None
+
+    async def _team_analysis(self, team_id: int) -> Dict:
+        form, map_performance = await asyncio.gather(self.analysis.get_team_form(team_id),
+                                                     self.analysis.get_map_performance(team_id))
+        return {'form': form, 'map_performance': map_performance}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path'].rstrip('/') or '/'
+        if path == '/api/live/stream' and self.hub is not None and scope['method'] == 'GET':
+            await self._live_stream(scope, receive, send)
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        started = time.perf_counter()
+        native = None
+        if scope['method'] == 'GET':
+            native = await self._native_read(path, parse_qs(scope['query_string'].decode('latin-1')))
+        if native is not None:
+            status, data = native
+            payload = json.dumps(data).encode()
+            headers = [('Content-type', 'application/json')]
+            metrics.HTTP_REQUESTS.inc(path, status)
+            metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, path)
+        else:
+            handler_cls = self._handler_class(path)
+            if handler_cls is None:
+                status, headers, payload = 404, [('Content-type', 'text/plain')], b'Not Found'
+            else:
+                target = scope.get('raw_path') or scope['path'].encode()
+                if scope['query_string']:
+                    target += b'?' + scope['query_string']
+                status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, call_handler, handler_cls, scope['method'], target.decode('latin-1'),
+                    scope['headers'], body, tuple(scope.get('client') or ('127.0.0.1', 0)))
+
+        headers = [(k, v) for k, v in headers if k.lower() not in _HOP_BY_HOP]
+        present = {k.lower() for k, _ in headers}
+        headers += [(k, v) for k, v in self.route_headers.get(path, []) if k.lower() not in present]
+        headers.append(('Content-Length', str(len(payload))))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _live_stream(self, scope, receive, send) -> None:
+        """SSE for one match: replay since Last-Event-ID (or the latest
+        snapshot), then hub messages, with heartbeats while idle."""
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        cors = [(k.encode('latin-1'), v.encode('latin-1'))
+                for k, v in self.route_headers.get('/api/live/stream', [])]
+        try:
+            match_id = int(query['match_id'][0])
+        except (KeyError, ValueError):
+            await send({'type': 'http.response.start', 'status': 400,
+                        'headers': [(b'content-type', b'text/plain')] + cors})
+            await send({'type': 'http.response.body', 'body': b"Missing or invalid 'match_id'"})
+            return
+        since = live_updates.parse_event_id(headers.get('last-event-id') or query.get('last_event_id', [None])[0])
+
+        # Subscribe before replaying so nothing published meanwhile is lost;
+        # anything not newer than the replay is skipped below
+        subscriber = self.hub.connect('sse')
+        self.hub.subscribe(match_topic(match_id), subscriber)
+        watcher = asyncio.ensure_future(self._close_on_disconnect(receive, subscriber))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ] + cors})
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': f"retry: {live_updates.RETRY_MS}\n\n".encode()})
+
+            if since is None:
+                sql, args = db.to_numbered(live_updates.LATEST_EVENT_SQL, {'match_id': match_id})
+            else:
+                sql, args = db.to_numbered(live_updates.EVENTS_SINCE_SQL,
+                                           {'match_id': match_id, 'since': since, 'limit': 500})
+            # Replay from the primary: a replica may not have the event just notified yet
+            rows = [(r['timestamp'], r['event_data']) for r in await self.read_pool.fetch(sql, *args)]
+            frames = live_updates.replay_frames(match_id, rows)
+            if frames:
+                await send({'type': 'http.response.body', 'body': b''.join(frames), 'more_body': True})
+            last_sent = rows[-1][0] if rows else since
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), live_updates.HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    await send({'type': 'http.response.body', 'body': live_updates.HEARTBEAT_FRAME,
+                                'more_body': True})
+                    continue
+                if message is None:
+                    break
+                timestamp, frame = message
+                if last_sent is not None and timestamp <= last_sent:
+                    continue
+                last_sent = timestamp
+                await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+            if not watcher.done():
+                # Dropped as a slow consumer: end the response, EventSource resumes
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            self.hub.close(subscriber)
+
+    async def _close_on_disconnect(self, receive, subscriber) -> None:
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        self.hub.close(subscriber)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = App()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=16,
+                        help="handler threads (and pooled psycopg2 connections)")
+    parser.add_argument('--read-pool-size', type=int, default=10, help="asyncpg pool size")
+    parser.add_argument('--ws-port', type=int, help="also run the WebSocket broadcaster on this port")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    uvicorn.run(App(threads=args.threads, read_pool_size=args.read_pool_size,
+                    ws_host=args.host, ws_port=args.ws_port),
+                host=args.host, port=args.port, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()